@@ -1,7 +1,14 @@
+import json
+import os
+import time
+from contextlib import contextmanager
 import streamlit as st
-import pandas as pd
-from sqlalchemy import create_engine
-import joblib
+
+# Heavy libraries (pandas, numpy, SQLAlchemy, joblib, the model and feature store
+# modules) are imported inside the functions that use them, so the page header
+# is drawn before any of them load and a view only pays for what it shows.
+
+run_started = time.perf_counter()
 
 # --- PAGE CONFIGURATION ---
 st.set_page_config(
@@ -19,30 +26,91 @@ SNOWFLAKE_PASSWORD = 'Ha0ieidheb#rl9'
 SNOWFLAKE_DB = 'OLIST_DB'
 SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
 SNOWFLAKE_SCHEMA = 'PUBLIC'
+# Any SQLAlchemy URL (e.g. sqlite:///standin.db) to use instead of Snowflake, for CI and local runs
+APP_DATABASE_URL = os.environ.get('APP_DATABASE_URL')
+DB_POOL_SIZE = 5  # Connections kept open by the process-wide pool
+
+# --- MODEL FILES ---
+CHURN_MODEL_PATH = 'churn_model.pkl'
+RECOMMENDER_MODEL_DIR = 'recommender_model'
+
+# --- SELECTOR SETTINGS ---
+SELECTOR_PAGE_SIZE = 50  # IDs sent to the browser per page of search results
+# Churn risk bands as (name, lower probability bound); 'High' matches a churn prediction
+CHURN_RISK_BANDS = [('Low', 0.0), ('Medium', 0.35), ('High', 0.5)]
+
+# --- KPI SETTINGS ---
+# The KPI view reads the small daily/monthly rollups kept by kpi_rollups.py, never the raw fact tables
+KPI_METRICS = {'Revenue (R$)': 'revenue', 'Orders': 'orders', 'Items sold': 'items', 'Freight (R$)': 'freight'}
+KPI_DIMENSIONS = {'Customer state': 'state', 'Product category': 'category', 'Seller': 'seller'}
+KPI_TOP_N = 10  # Bars in the breakdown chart
+
+# --- TIMING ---
+# When set, every script run appends one JSON line with its timing breakdown here
+APP_TIMING_LOG = os.environ.get('APP_TIMING_LOG')
+run_timings = {}
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in the block to this run's timing breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run_timings[phase] = run_timings.get(phase, 0.0) + time.perf_counter() - start
 
 
 @st.cache_resource
-def get_snowflake_engine():
-    """Creates a SQLAlchemy engine for Snowflake."""
+def process_stats():
+    """Counts script runs in this process, so the first (cold) run can be told apart."""
+    return {'runs': 0}
+
+
+def write_timings(view):
+    stats = process_stats()
+    stats['runs'] += 1
+    if not APP_TIMING_LOG:
+        return
+    record = {
+        'run': stats['runs'],
+        'cold': stats['runs'] == 1,
+        'view': view,
+        'total_seconds': round(time.perf_counter() - run_started, 4),
+        'phases': {phase: round(seconds, 4) for phase, seconds in run_timings.items()},
+    }
+    with open(APP_TIMING_LOG, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+@st.cache_resource
+def get_engine():
+    """
+    Creates the process-wide SQLAlchemy engine on first use. Its connection pool
+    is shared by every session and survives reruns, so it is never disposed here.
+    """
+    from sqlalchemy import create_engine
     try:
-        connection_url = (
+        connection_url = APP_DATABASE_URL or (
             f"snowflake://{SNOWFLAKE_USER}:{SNOWFLAKE_PASSWORD}@{SNOWFLAKE_ACCOUNT}/"
             f"{SNOWFLAKE_DB}/{SNOWFLAKE_SCHEMA}?warehouse={SNOWFLAKE_WAREHOUSE}"
         )
-        engine = create_engine(connection_url)
-        return engine
+        # pool_pre_ping replaces connections the warehouse closed while idle
+        return create_engine(connection_url, pool_size=DB_POOL_SIZE, pool_pre_ping=True, pool_recycle=3600)
     except Exception as e:
         st.error(f"Error creating database engine: {e}")
         return None
 
 
-engine = get_snowflake_engine()
-
-
 # --- LOAD MODELS ---
-@st.cache_data
-def load_model(model_path):
-    """Loads a saved model from a .pkl file."""
+@st.cache_resource(max_entries=2)  # One shared instance per process, not a copy per call
+def load_model(model_path, model_version):
+    """
+    Loads a saved model from a .pkl file. Keyed by the file's version hash as
+    well as its path, so a retrained model replaces the cached one on the next
+    run, together with the batch predictions looked up for that version.
+    """
+    import joblib
     try:
         with open(model_path, 'rb') as file:
             model = joblib.load(file)
@@ -52,103 +120,348 @@ def load_model(model_path):
         return None
 
 
-churn_model = load_model('churn_model.pkl')
-recommender_model = load_model('recommender_model.pkl')
+@st.cache_resource(max_entries=2)
+def load_recommender(model_dir, model_version):
+    """
+    Opens the memory-mapped recommender written by train_recommender.py.
+    cache_resource keeps a single instance per process instead of copying it,
+    and the OS shares the mapped pages between all app processes on the host.
+    Keyed by the artifact's version as well as its directory, like load_model,
+    so a retrained recommender replaces the cached one on the next run.
+    """
+    from recommender_store import Recommender
+    try:
+        return Recommender(model_dir)
+    except FileNotFoundError:
+        st.error(f"Error: Recommender model not found at {model_dir}")
+        return None
 
 
 # --- LOAD DATA ---
-@st.cache_data(ttl=600)  # Cache data for 10 minutes
 def load_data(query):
-    """Loads data from Snowflake using a SQL query."""
+    """
+    Loads data from the database using a SQL query, with lower-case column names.
+    Results go through the shared on-disk query cache (see query_cache.py), so
+    every app replica on the host reuses one copy until the next sync publishes
+    a new data version. Each call is traced as an app.load_data span.
+    """
+    import pandas as pd
+    import instrumentation
+    import query_cache
+    engine = get_engine()
     if engine:
-        try:
-            df = pd.read_sql(query, engine)
+        with instrumentation.span('app.load_data', query=query_cache.normalize_query(query)) as load_span:
+            def run_query():
+                with load_span.phase('query'):
+                    df = pd.read_sql(query, engine)
+                df.columns = [col.lower() for col in df.columns]
+                return df
+
+            try:
+                df = query_cache.cached_query(query, run_query)
+            except Exception as e:
+                st.error(f"Error loading data: {e}")
+                load_span.record_error(e)
+                return pd.DataFrame()
+            load_span.set(cache_hit='query' not in load_span.phases)
+            load_span.add_rows(len(df))
             return df
-        except Exception as e:
-            st.error(f"Error loading data: {e}")
-            return pd.DataFrame()
     return pd.DataFrame()
 
 
-# Load data for selectors and displaying info
-customers_df = load_data(
-    'SELECT "customer_unique_id", "RECENCY", "FREQUENCY", "MONETARY_VALUE" FROM CUSTOMER_CHURN_FEATURES')
-products_df = load_data('SELECT "product_id", "product_category_name" FROM "PRODUCTS"')
+@st.cache_data  # Keyed by snapshot version, so a refresh is picked up on the next call
+def load_feature_table(table_name, columns, version):
+    """Loads columns of a local feature store snapshot."""
+    import feature_store
+    return feature_store.read_table(table_name, columns=list(columns), version=version)
 
-# --- UI LAYOUT ---
-st.title("🛍️ Olist E-commerce Analytics Dashboard")
-st.markdown("This interactive dashboard provides churn predictions and product recommendations.")
 
-# --- TABS FOR DIFFERENT MODELS ---
-tab1, tab2 = st.tabs(["🔥 Customer Churn Predictor", "🤝 Product Recommender"])
+def load_table(table_name, columns, query):
+    """
+    Loads columns of a table from the local feature store snapshot, which every
+    app replica reads from its own disk. Falls back to querying the database when
+    no snapshot has been materialized yet.
+    """
+    import feature_store
+    version = feature_store.current_version(table_name)
+    if version is not None:
+        try:
+            return load_feature_table(table_name, tuple(columns), version)
+        except Exception as e:
+            st.warning(f"Could not read the local '{table_name}' snapshot, querying the database instead: {e}")
+    return load_data(query)
+
+
+def load_batch_predictions(model_version):
+    """
+    Reads the churn probabilities written by score_churn_batch.py for this model
+    version. Returns None when the predictions table doesn't exist yet.
+    """
+    import pandas as pd
+    from sqlalchemy import text
+    from score_churn_batch import PREDICTIONS_TABLE
+    engine = get_engine()
+    if not engine:
+        return None
+    try:
+        query = text(f'SELECT "customer_unique_id", "churn_probability" FROM {PREDICTIONS_TABLE} '
+                     f'WHERE "model_version" = :model_version')
+        predictions = pd.read_sql(query, engine, params={'model_version': model_version})
+    except Exception:
+        return None
+    return predictions.drop_duplicates('customer_unique_id').set_index('customer_unique_id')['churn_probability']
+
+
+@st.cache_resource  # Keyed by data version, so it is rebuilt after each sync
+def load_customer_scores(_model, model_version, data_version):
+    """
+    Builds the churn lookup once per data refresh: the customer features indexed by
+    customer_unique_id, plus a churn probability and prediction for every customer.
+    Probabilities come from the nightly predictions table when it was produced by
+    the current model, so the dashboard does no inference at all; any customers it
+    doesn't cover are scored here in a single vectorized predict_proba call.
+    Returns the frame and a PrefixIndex over the ids, filterable by risk band.
+    """
+    import numpy as np
+    from search_index import PrefixIndex
+    from score_churn_batch import FEATURE_COLUMNS
+
+    customers = load_table(
+        'CUSTOMER_CHURN_FEATURES', ['customer_unique_id', 'recency', 'frequency', 'monetary_value'],
+        'SELECT "customer_unique_id", "RECENCY", "FREQUENCY", "MONETARY_VALUE" FROM CUSTOMER_CHURN_FEATURES')
+    if customers.empty:
+        return customers, PrefixIndex([])
+    customers = customers.drop_duplicates('customer_unique_id').set_index('customer_unique_id')
+
+    predictions = load_batch_predictions(model_version)
+    if predictions is not None:
+        customers['churn_probability'] = predictions.reindex(customers.index)
+    else:
+        customers['churn_probability'] = float('nan')
+
+    unscored = customers['churn_probability'].isna()
+    if unscored.any():
+        customers.loc[unscored, 'churn_probability'] = _model.predict_proba(
+            customers.loc[unscored, FEATURE_COLUMNS])[:, 1]
 
-# --- CHURN PREDICTOR TAB ---
-with tab1:
+    # Same decision as LogisticRegression.predict() for a binary model
+    customers['churn_prediction'] = (customers['churn_probability'] > 0.5).astype(int)
+
+    band_names = np.array([name for name, _ in CHURN_RISK_BANDS], dtype=object)
+    band_bounds = [bound for _, bound in CHURN_RISK_BANDS[1:]]
+    risk_bands = band_names[np.digitize(customers['churn_probability'], band_bounds, right=False)]
+    return customers, PrefixIndex(customers.index, risk=risk_bands)
+
+
+@st.cache_resource
+def load_product_catalogue(data_version):
+    """
+    Builds the product lookup once per data refresh: products indexed by
+    product_id, and a PrefixIndex over the ids filterable by category.
+    """
+    from search_index import PrefixIndex
+    products = load_table('PRODUCTS', ['product_id', 'product_category_name'],
+                          'SELECT "product_id", "product_category_name" FROM "PRODUCTS"')
+    if products.empty:
+        return products, PrefixIndex([])
+    products = products.drop_duplicates('product_id').set_index('product_id', drop=False)
+    return products, PrefixIndex(products.index, category=products['product_category_name'])
+
+
+def search_selector(label, search_index, key, filter_name=None, filter_label=None, filter_options=()):
+    """
+    Typeahead selector backed by a PrefixIndex: the user types the start of an ID
+    (optionally picking a filter) and only one page of matching IDs is sent to the
+    browser, however many IDs there are. Returns the selected ID or None.
+    """
+    search_col, filter_col, page_col = st.columns([3, 2, 1])
+    prefix = search_col.text_input(f"Search {label}s (type the first characters):", key=f"{key}_prefix").strip()
+
+    filters = {}
+    if filter_name:
+        choice = filter_col.selectbox(filter_label, ['All'] + list(filter_options), key=f"{key}_filter")
+        filters[filter_name] = None if choice == 'All' else choice
+
+    page = page_col.number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page")
+    matches, total = search_index.search(prefix, limit=SELECTOR_PAGE_SIZE,
+                                         offset=(page - 1) * SELECTOR_PAGE_SIZE, **filters)
+    st.caption(f"{total:,} matching {label}s, showing page {page} of {max(1, -(-total // SELECTOR_PAGE_SIZE))}.")
+
+    if not matches:
+        st.info(f"No {label}s match this search.")
+        return None
+    return st.selectbox(f"Select a {label}:", options=matches, index=0, key=f"{key}_select")
+
+
+# --- CHURN PREDICTOR VIEW ---
+def render_churn_view():
     st.header("Predict Customer Churn")
 
-    if churn_model is not None and not customers_df.empty:
-        # Customer selection
-        customer_id = st.selectbox(
-            "Select a Customer ID to predict churn:",
-            options=customers_df['customer_unique_id'],
-            index=0
-        )
+    with timed('load_model'):
+        from score_churn_batch import get_model_version
+        try:
+            model_version = get_model_version(CHURN_MODEL_PATH)
+        except FileNotFoundError:
+            st.error(f"Error: Model file not found at {CHURN_MODEL_PATH}")
+            return
+        churn_model = load_model(CHURN_MODEL_PATH, model_version)
+    if churn_model is None:
+        return
 
-        if customer_id:
-            # Get features for the selected customer
-            customer_features = customers_df[customers_df['customer_unique_id'] == customer_id]
+    with timed('load_data'):
+        import query_cache
+        customer_scores, customer_search = load_customer_scores(churn_model, model_version,
+                                                                query_cache.data_version())
+    if customer_scores.empty:
+        return
 
-            if not customer_features.empty:
-                # Prepare features for prediction (must match training format)
-                features_for_prediction = customer_features[['frequency', 'monetary_value']]
+    # Customer selection
+    customer_id = search_selector("Customer ID", customer_search, key='customer',
+                                  filter_name='risk', filter_label="Churn risk",
+                                  filter_options=[name for name, _ in CHURN_RISK_BANDS])
 
-                # Predict churn
-                prediction_proba = churn_model.predict_proba(features_for_prediction)[0]
-                prediction = churn_model.predict(features_for_prediction)[0]
+    if customer_id in customer_scores.index:
+        # Look up the precomputed features and score for the selected customer
+        customer = customer_scores.loc[customer_id]
 
-                # Display results
-                st.subheader(f"Prediction for Customer: `{customer_id}`")
+        # Display results
+        st.subheader(f"Prediction for Customer: `{customer_id}`")
 
-                churn_probability = prediction_proba[1]  # Probability of the '1' class (churn)
+        churn_probability = customer['churn_probability']  # Probability of the '1' class (churn)
 
-                if prediction == 1:
-                    st.error(f"**High Risk of Churn** (Probability: {churn_probability:.2%})")
-                else:
-                    st.success(f"**Low Risk of Churn** (Probability: {churn_probability:.2%})")
+        if customer['churn_prediction'] == 1:
+            st.error(f"**High Risk of Churn** (Probability: {churn_probability:.2%})")
+        else:
+            st.success(f"**Low Risk of Churn** (Probability: {churn_probability:.2%})")
 
-                # Show customer's features
-                st.write("Customer's Purchase Behavior:")
-                st.metric("Recency (days since last purchase)", f"{customer_features.iloc[0]['recency']:.0f}")
-                st.metric("Frequency (total orders)", f"{customer_features.iloc[0]['frequency']:.0f}")
-                st.metric("Monetary Value (total spend)", f"R$ {customer_features.iloc[0]['monetary_value']:.2f}")
+        # Show customer's features
+        st.write("Customer's Purchase Behavior:")
+        st.metric("Recency (days since last purchase)", f"{customer['recency']:.0f}")
+        st.metric("Frequency (total orders)", f"{customer['frequency']:.0f}")
+        st.metric("Monetary Value (total spend)", f"R$ {customer['monetary_value']:.2f}")
 
-# --- RECOMMENDER TAB ---
-with tab2:
+
+# --- RECOMMENDER VIEW ---
+def render_recommender_view():
     st.header("Find Product Recommendations")
 
-    if recommender_model is not None and not products_df.empty:
-        # Product selection
-        product_id = st.selectbox(
-            "Select a Product ID to get recommendations:",
-            options=products_df['product_id'],
-            index=0
-        )
+    with timed('load_model'):
+        from recommender_store import get_recommender_version
+        try:
+            model_version = get_recommender_version(RECOMMENDER_MODEL_DIR)
+        except FileNotFoundError:
+            st.error(f"Error: Recommender model not found at {RECOMMENDER_MODEL_DIR}")
+            return
+        recommender_model = load_recommender(RECOMMENDER_MODEL_DIR, model_version)
+    if recommender_model is None:
+        return
+
+    with timed('load_data'):
+        import query_cache
+        products_df, product_search = load_product_catalogue(query_cache.data_version())
+    if products_df.empty:
+        return
 
-        if product_id:
-            # Get recommendations from our model
-            recommendations = recommender_model.get(product_id, [])
+    # Product selection
+    categories = sorted(products_df['product_category_name'].dropna().unique())
+    product_id = search_selector("Product ID", product_search, key='product',
+                                 filter_name='category', filter_label="Category", filter_options=categories)
+
+    if product_id:
+        # Get recommendations from our model, topped up with popular items when there are fewer than 5
+        specific = recommender_model.get(product_id, k=5)
+        recommendations = recommender_model.recommend(product_id, k=5)
+
+        st.subheader(f"Top 5 Recommendations for Product: `{product_id}`")
+
+        if not specific:
+            st.warning("No specific recommendations found for this product. Showing popular items instead.")
+        elif len(specific) < len(recommendations):
+            st.caption(f"Only {len(specific)} co-purchase recommendations found; the rest are popular items, "
+                       f"from related categories where possible.")
+
+        if recommendations:
+            # Get details for the recommended products
+            recommended_products_df = products_df.loc[[r for r in recommendations if r in products_df.index]]
+            st.table(recommended_products_df.reset_index(drop=True))
+        else:
+            st.info("This recommender model has no popularity data; retrain it with train_recommender.py.")
+
+
+# --- SALES KPI VIEW ---
+def load_kpi_rollup(table_name, dimension, period_columns):
+    """Loads one dimension of a KPI rollup table (see kpi_rollups.py) through the query cache."""
+    columns = ', '.join(f'"{col}"' for col in period_columns + ['dimension_value', 'orders', 'items', 'revenue',
+                                                                 'freight'])
+    return load_data(f'SELECT {columns} FROM {table_name} WHERE "dimension" = \'{dimension}\'')
+
+
+def render_kpi_view():
+    st.header("Sales KPIs")
+    import pandas as pd
+    from kpi_rollups import DAILY_TABLE, MONTHLY_TABLE
+
+    grain_col, metric_col, dimension_col = st.columns(3)
+    grain = grain_col.radio("Granularity", ["Monthly", "Daily"], horizontal=True, key='kpi_grain')
+    metric_label = metric_col.selectbox("Metric", list(KPI_METRICS), key='kpi_metric')
+    dimension_label = dimension_col.selectbox("Break down by", list(KPI_DIMENSIONS), key='kpi_dimension')
+    metric = KPI_METRICS[metric_label]
+
+    with timed('load_data'):
+        if grain == "Daily":
+            trend = load_kpi_rollup(DAILY_TABLE, 'total', ['sales_month', 'sales_date'])
+        else:
+            trend = load_kpi_rollup(MONTHLY_TABLE, 'total', ['sales_month'])
+    if trend.empty:
+        st.info("No KPI rollups found. They are built by each mysql_to_snowflake.py sync, or by kpi_rollups.py.")
+        return
+
+    months = sorted(trend['sales_month'].unique())
+    if len(months) > 1:
+        first_month, last_month = st.select_slider("Months", options=months, value=(months[0], months[-1]),
+                                                   key='kpi_months')
+    else:
+        first_month = last_month = months[0]
+    trend = trend[trend['sales_month'].between(first_month, last_month)]
+
+    # Headline figures for the selected months
+    orders = trend['orders'].sum()
+    revenue = trend['revenue'].sum()
+    revenue_col, orders_col, items_col, aov_col = st.columns(4)
+    revenue_col.metric("Revenue", f"R$ {revenue:,.2f}")
+    orders_col.metric("Orders", f"{orders:,.0f}")
+    items_col.metric("Items sold", f"{trend['items'].sum():,.0f}")
+    aov_col.metric("Average order value", f"R$ {revenue / orders:,.2f}" if orders else "-")
+
+    st.subheader(f"{metric_label} over time")
+    period = 'sales_date' if grain == "Daily" else 'sales_month'
+    st.line_chart(trend.assign(**{period: pd.to_datetime(trend[period])}).set_index(period)[metric].sort_index())
+
+    # Months are the coarsest partition, so the breakdown always reads the monthly rollup
+    with timed('load_data'):
+        breakdown = load_kpi_rollup(MONTHLY_TABLE, KPI_DIMENSIONS[dimension_label], ['sales_month'])
+    if breakdown.empty:
+        return
+    breakdown = breakdown[breakdown['sales_month'].between(first_month, last_month)]
+    top = breakdown.groupby('dimension_value')[metric].sum().nlargest(KPI_TOP_N)
+    st.subheader(f"Top {len(top)} by {dimension_label.lower()}: {metric_label}")
+    st.bar_chart(top.rename_axis(dimension_label).rename(metric_label))
+
+
+# --- UI LAYOUT ---
+st.title("🛍️ Olist E-commerce Analytics Dashboard")
+st.markdown("This interactive dashboard provides churn predictions, product recommendations and sales KPIs.")
+run_timings['first_paint'] = time.perf_counter() - run_started
 
-            st.subheader(f"Top 5 Recommendations for Product: `{product_id}`")
+# Only the selected view runs, so its models and data are loaded on first use
+VIEWS = {
+    "🔥 Customer Churn Predictor": render_churn_view,
+    "🤝 Product Recommender": render_recommender_view,
+    "📈 Sales KPIs": render_kpi_view,
+}
+view = st.radio("View", list(VIEWS), horizontal=True, label_visibility='collapsed', key='view')
 
-            if recommendations:
-                # Get details for the recommended products
-                recommended_products_df = products_df[products_df['product_id'].isin(recommendations)]
-                st.table(recommended_products_df)
-            else:
-                st.warning("No specific recommendations found for this product. Showing popular items instead.")
-                # Fallback: show some popular items if no specific recommendation is found
-                st.table(products_df.head(5))
+with timed('render_view'):
+    VIEWS[view]()
 
-# --- clean up engine ---
-if engine:
-    engine.dispose()
\ No newline at end of file
+write_timings(view)
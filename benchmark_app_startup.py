@@ -0,0 +1,136 @@
+# benchmark_app_startup.py
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# --- BENCHMARK SETTINGS ---
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+STANDIN_CUSTOMERS = 100_000  # Rows in the SQLite stand-in for CUSTOMER_CHURN_FEATURES
+STANDIN_PRODUCTS = 30_000  # Rows in the stand-in for PRODUCTS
+RERUNS = 5  # Warm reruns per view after the cold start
+FIRST_PAINT_BUDGET_SECONDS = 1.0  # CI fails if the cold run's first paint takes longer
+RESULTS_PATH = 'app_startup_results.json'
+SEED = 42
+
+
+def build_standin(workdir, seed=SEED):
+    """
+    Creates everything app.py reads, in workdir: a SQLite database with the
+    CUSTOMER_CHURN_FEATURES and PRODUCTS tables, a churn model and a recommender.
+    """
+    import joblib
+    import numpy as np
+    import pandas as pd
+    from sqlalchemy import create_engine
+    from sklearn.linear_model import LogisticRegression
+    from recommender_store import save_recommender
+
+    rng = np.random.default_rng(seed)
+    customers = pd.DataFrame({
+        'customer_unique_id': [f"{i:032x}" for i in rng.permutation(STANDIN_CUSTOMERS)],
+        'recency': rng.integers(0, 700, size=STANDIN_CUSTOMERS),
+        'frequency': rng.geometric(0.7, size=STANDIN_CUSTOMERS),
+        'monetary_value': np.round(rng.lognormal(4.8, 0.8, size=STANDIN_CUSTOMERS), 2),
+    })
+    customers['churn'] = (customers['recency'] > 180).astype(int)
+    product_ids = np.array(sorted(f"{i:032x}" for i in rng.permutation(STANDIN_PRODUCTS)), dtype=object)
+    products = pd.DataFrame({
+        'product_id': product_ids,
+        'product_category_name': rng.choice(['cama_mesa_banho', 'beleza_saude', 'esporte_lazer', None],
+                                            size=STANDIN_PRODUCTS),
+    })
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'standin.db')}")
+    customers.to_sql('CUSTOMER_CHURN_FEATURES', engine, index=False)
+    products.to_sql('PRODUCTS', engine, index=False)
+    engine.dispose()
+
+    model = LogisticRegression(random_state=42, class_weight='balanced')
+    model.fit(customers[['frequency', 'monetary_value']], customers['churn'])
+    joblib.dump(model, os.path.join(workdir, 'churn_model.pkl'))
+
+    k = 5
+    indices = rng.integers(0, STANDIN_PRODUCTS, size=STANDIN_PRODUCTS * k)
+    save_recommender(os.path.join(workdir, 'recommender_model'), product_ids,
+                     np.arange(0, STANDIN_PRODUCTS * k + 1, k), indices, np.ones(len(indices)))
+
+
+def run_app_session(workdir, reruns=RERUNS):
+    """
+    Runs app.py headless in this (fresh) process: a cold start on the first view,
+    warm reruns, then the second view. Returns the timing records it logged.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(workdir)
+    log_path = os.path.join(workdir, 'timings.jsonl')
+    os.environ['APP_DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'standin.db')}"
+    os.environ['APP_TIMING_LOG'] = log_path
+
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.run()
+    for _ in range(reruns):
+        app.run()
+    views = app.radio(key='view').options
+    app.radio(key='view').set_value(views[1]).run()
+    for _ in range(reruns):
+        app.run()
+    if app.exception:
+        raise RuntimeError(f"app.py raised: {app.exception[0].message}")
+
+    with open(log_path) as f:
+        return [json.loads(line) for line in f]
+
+
+def summarize(records):
+    def phase(record, name):
+        return record['phases'].get(name, 0.0)
+
+    print(f"\n{'Run':>5}{'Cold':>6}  {'View':<28}{'First paint':>13}{'Model':>9}{'Data':>9}{'Total':>9}")
+    for record in records:
+        print(f"{record['run']:>5}{str(record['cold']):>6}  {record['view']:<28}{phase(record, 'first_paint'):>13.3f}"
+              f"{phase(record, 'load_model'):>9.3f}{phase(record, 'load_data'):>9.3f}{record['total_seconds']:>9.3f}")
+
+    cold = records[0]
+    warm = [record for record in records[1:] if record['view'] == cold['view']]
+    summary = {
+        'cold_first_paint_seconds': phase(cold, 'first_paint'),
+        'cold_total_seconds': cold['total_seconds'],
+        'warm_median_total_seconds': statistics.median(record['total_seconds'] for record in warm) if warm else None,
+        'first_paint_budget_seconds': FIRST_PAINT_BUDGET_SECONDS,
+        'runs': records,
+    }
+    summary['within_budget'] = summary['cold_first_paint_seconds'] <= FIRST_PAINT_BUDGET_SECONDS
+    return summary
+
+
+def run_benchmark():
+    workdir = tempfile.mkdtemp(prefix='app_startup_')
+    try:
+        print(f"Building SQLite stand-in ({STANDIN_CUSTOMERS:,} customers, {STANDIN_PRODUCTS:,} products)...")
+        build_standin(workdir)
+
+        # A fresh interpreter, so the cold run pays for its imports like a new app process would
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            records = executor.submit(run_app_session, workdir).result()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(records)
+    with open(RESULTS_PATH, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"\nCold first paint: {summary['cold_first_paint_seconds']:.3f}s "
+          f"(budget {FIRST_PAINT_BUDGET_SECONDS}s, within budget: {summary['within_budget']}). "
+          f"Results written to '{RESULTS_PATH}'.")
+    return summary['within_budget']
+
+
+if __name__ == '__main__':
+    print("--- Benchmark: app.py startup and rerun timings ---")
+    within_budget = run_benchmark()
+    print("\n--- Benchmark Complete! ---")
+    raise SystemExit(0 if within_budget else 1)
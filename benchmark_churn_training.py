@@ -0,0 +1,121 @@
+# benchmark_churn_training.py
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+import feature_store
+import instrumentation
+from train_churn_model import (
+    FEATURE_COLUMNS, TRAINING_CHUNK_SIZE, fit_streaming, evaluate_streaming, is_holdout,
+)
+
+# --- BENCHMARK SETTINGS ---
+CUSTOMER_COUNTS = [200_000, 1_000_000, 4_000_000]  # Number of synthetic customers per run
+ACCURACY_TOLERANCE = 0.02  # Streaming accuracy may be at most this much below the full fit
+BENCHMARK_STORE_DIR = 'benchmark_feature_store'
+GENERATION_CHUNK_SIZE = 500_000
+SEED = 42
+
+
+def make_synthetic_features(n_customers, seed=SEED, chunksize=GENERATION_CHUNK_SIZE):
+    """
+    Yields CUSTOMER_CHURN_FEATURES-shaped chunks: most customers buy once, spend
+    is long-tailed, and churn is more likely for customers who buy less often.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_customers, chunksize):
+        size = min(chunksize, n_customers - start)
+        frequency = rng.geometric(0.7, size=size)
+        monetary_value = np.round(frequency * rng.lognormal(4.8, 0.8, size=size), 2)
+        logit = 1.5 - 1.2 * (frequency - 1) - 0.002 * (monetary_value - 160) + rng.logistic(size=size) * 0.5
+        churn = (logit > 0).astype(np.int64)
+        yield pd.DataFrame({
+            'customer_unique_id': [f"{i:032x}" for i in range(start, start + size)],
+            'recency': rng.integers(0, 700, size=size),
+            'frequency': frequency,
+            'monetary_value': monetary_value,
+            'churn': churn,
+        })
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the resource module is missing."""
+    peak = instrumentation.peak_rss_bytes()
+    return None if peak is None else peak / (1024 * 1024)
+
+
+def rss_growth_mb(start_rss):
+    """Growth of the peak RSS since start_rss, or None where it can't be measured."""
+    end_rss = peak_rss_mb()
+    return None if start_rss is None or end_rss is None else end_rss - start_rss
+
+
+def run_full_fit(root):
+    """The current path: load every customer, fit LogisticRegression in memory."""
+    start_rss = peak_rss_mb()
+    start_time = time.perf_counter()
+    df = feature_store.read_table('CUSTOMER_CHURN_FEATURES', columns=['customer_unique_id'] + FEATURE_COLUMNS + ['churn'],
+                                  root=root)
+    holdout = is_holdout(df['customer_unique_id'])
+    model = LogisticRegression(random_state=42, class_weight='balanced')
+    model.fit(df.loc[~holdout, FEATURE_COLUMNS], df.loc[~holdout, 'churn'])
+    accuracy = (model.predict(df.loc[holdout, FEATURE_COLUMNS]) == df.loc[holdout, 'churn']).mean()
+    return time.perf_counter() - start_time, rss_growth_mb(start_rss), accuracy
+
+
+def run_streaming_fit(root):
+    """The streaming path: partial_fit over TRAINING_CHUNK_SIZE-row chunks."""
+    start_rss = peak_rss_mb()
+    start_time = time.perf_counter()
+
+    def chunk_source():
+        return feature_store.iter_batches('CUSTOMER_CHURN_FEATURES', columns=['customer_unique_id'] + FEATURE_COLUMNS + ['churn'],
+                                          batch_size=TRAINING_CHUNK_SIZE, root=root)
+
+    model = fit_streaming(chunk_source)
+    matrix = evaluate_streaming(model, chunk_source)
+    accuracy = np.trace(matrix) / matrix.sum()
+    return time.perf_counter() - start_time, rss_growth_mb(start_rss), accuracy
+
+
+def run_isolated(function, root):
+    """Runs one path in a fresh process so its peak memory isn't hidden by earlier runs."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, root).result()
+
+
+def run_benchmark():
+    results = []
+    try:
+        for n_customers in CUSTOMER_COUNTS:
+            print(f"\n--- {n_customers:,} customers ---")
+            shutil.rmtree(BENCHMARK_STORE_DIR, ignore_errors=True)
+            feature_store.write_snapshot('CUSTOMER_CHURN_FEATURES', make_synthetic_features(n_customers),
+                                         root=BENCHMARK_STORE_DIR)
+
+            full = run_isolated(run_full_fit, BENCHMARK_STORE_DIR)
+            streaming = run_isolated(run_streaming_fit, BENCHMARK_STORE_DIR)
+            results.append((n_customers, full, streaming))
+    finally:
+        shutil.rmtree(BENCHMARK_STORE_DIR, ignore_errors=True)
+
+    print(f"\n{'Customers':>12}{'full (s)':>10}{'full (MB)':>11}{'full acc':>10}"
+          f"{'stream (s)':>12}{'stream (MB)':>13}{'stream acc':>12}{'Within tol.':>13}")
+    all_within = True
+    for n_customers, (full_s, full_mb, full_acc), (stream_s, stream_mb, stream_acc) in results:
+        within = stream_acc >= full_acc - ACCURACY_TOLERANCE
+        all_within = all_within and within
+        print(f"{n_customers:>12,}{full_s:>10.2f}{full_mb or 0:>11.0f}{full_acc:>10.3f}"
+              f"{stream_s:>12.2f}{stream_mb or 0:>13.0f}{stream_acc:>12.3f}{str(within):>13}")
+    print(f"\nMemory is the growth in peak RSS during the run. "
+          f"Accuracy tolerance: {ACCURACY_TOLERANCE}. All within tolerance: {all_within}")
+    return all_within
+
+
+if __name__ == '__main__':
+    print("--- Benchmark: churn model training (full fit vs. streaming partial_fit) ---")
+    run_benchmark()
+    print("\n--- Benchmark Complete! ---")
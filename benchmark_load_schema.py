@@ -0,0 +1,148 @@
+# benchmark_load_schema.py
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from load_data import DATA_DIR, TABLE_KEYS, create_keys, create_tables, get_table_name, read_csv_batches
+
+# --- BENCHMARK SETTINGS ---
+# Both schemas are loaded into SQLite stand-ins for MySQL from the CSVs in DATA_DIR
+LOOKUPS = 1000  # Random order_id point lookups timed per database
+SEED = 42
+
+# Queries timed on each database, as run downstream
+QUERIES = {
+    'order_items self-join (train_recommender)': (
+        "SELECT COUNT(*) FROM order_items a JOIN order_items b ON a.order_id = b.order_id "
+        "WHERE a.product_id != b.product_id"),
+    'orders x customers (build_features)': (
+        "SELECT COUNT(DISTINCT c.customer_unique_id) FROM orders o JOIN customers c ON c.customer_id = o.customer_id"),
+    'items per product': "SELECT product_id, COUNT(*) FROM order_items GROUP BY product_id",
+}
+
+
+def build_standin(path, data_dir, infer_types):
+    """
+    Loads every CSV into a SQLite database: with the original name-based types
+    and no keys, or with inferred types and the TABLE_KEYS keys created after
+    the load. Returns the load and index build times, and the database size
+    before and after the keys were created.
+    """
+    db = sqlite3.connect(path)
+    cursor = db.cursor()
+    table_names = create_tables(cursor, data_dir, dialect='sqlite', infer_types=infer_types)
+
+    files = {get_table_name(f): f for f in os.listdir(data_dir) if f.endswith('.csv')}
+    start_time = time.perf_counter()
+    for table_name in table_names:
+        for columns, rows in read_csv_batches(os.path.join(data_dir, files[table_name])):
+            cols = ', '.join(f"`{c}`" for c in columns)
+            cursor.executemany(f"INSERT INTO {table_name} ({cols}) VALUES ({', '.join(['?'] * len(columns))})", rows)
+    db.commit()
+    load_seconds = time.perf_counter() - start_time
+    cursor.execute("VACUUM")
+    data_bytes = os.path.getsize(path)
+
+    start_time = time.perf_counter()
+    if infer_types:
+        for table_name in table_names:
+            create_keys(cursor, table_name, dialect='sqlite')
+    db.commit()
+    index_seconds = time.perf_counter() - start_time
+
+    cursor.execute("VACUUM")
+    db.close()
+    return load_seconds, index_seconds, data_bytes, os.path.getsize(path)
+
+
+def check_zero_padded_values(workdir):
+    """
+    Loads a small CSV with a zero-padded code column into an inferred-schema
+    stand-in and checks the codes come back as the same strings, not as numbers.
+    """
+    data_dir = os.path.join(workdir, 'zero_padded')
+    os.makedirs(data_dir)
+    expected = pd.DataFrame({'zip_code_prefix': ['01001', '02002', '13500', None], 'quantity': ['1', '2', '3', '4']})
+    expected.to_csv(os.path.join(data_dir, 'zips.csv'), index=False)
+
+    path = os.path.join(workdir, 'zero_padded.db')
+    build_standin(path, data_dir, infer_types=True)
+    db = sqlite3.connect(path)
+    try:
+        rows = db.execute("SELECT zip_code_prefix, quantity FROM zips ORDER BY rowid").fetchall()
+    finally:
+        db.close()
+    expected_rows = [(None if pd.isna(code) else code, int(qty)) for code, qty in expected.itertuples(index=False)]
+    if rows != expected_rows:
+        raise AssertionError(f"Zero-padded values were not loaded intact: {rows} != {expected_rows}")
+    print("Zero-padded text columns are loaded intact.")
+
+
+def time_queries(path, seed=SEED):
+    db = sqlite3.connect(path)
+    cursor = db.cursor()
+    timings = {}
+    results = {}
+    for name, query in QUERIES.items():
+        start_time = time.perf_counter()
+        results[name] = sorted(cursor.execute(query).fetchall())
+        timings[name] = time.perf_counter() - start_time
+
+    order_ids = [row[0] for row in cursor.execute("SELECT order_id FROM order_items").fetchall()]
+    lookups = np.random.default_rng(seed).choice(order_ids, size=min(LOOKUPS, len(order_ids)))
+    start_time = time.perf_counter()
+    for order_id in lookups:
+        cursor.execute("SELECT * FROM order_items WHERE order_id = ?", (str(order_id),)).fetchall()
+    timings[f"{len(lookups)} order_id lookups"] = time.perf_counter() - start_time
+    db.close()
+    return timings, results
+
+
+def table_counts(path):
+    db = sqlite3.connect(path)
+    tables = [row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    counts = {table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables}
+    db.close()
+    return counts
+
+
+def run_benchmark(data_dir=DATA_DIR):
+    workdir = tempfile.mkdtemp(prefix='load_schema_')
+    try:
+        check_zero_padded_values(workdir)
+        paths = {'name-based': os.path.join(workdir, 'baseline.db'), 'inferred': os.path.join(workdir, 'inferred.db')}
+        builds = {}
+        for label, path in paths.items():
+            print(f"\nBuilding the {label} SQLite stand-in...")
+            builds[label] = build_standin(path, data_dir, infer_types=(label == 'inferred'))
+
+        counts = {label: table_counts(path) for label, path in paths.items()}
+        if counts['name-based'] != counts['inferred']:
+            raise AssertionError(f"Row counts differ: {counts}")
+        print(f"\nBoth stand-ins hold the same rows: {counts['inferred']}")
+
+        query_runs = {label: time_queries(path) for label, path in paths.items()}
+        for name in QUERIES:
+            if query_runs['name-based'][1][name] != query_runs['inferred'][1][name]:
+                raise AssertionError(f"'{name}' returned different results on the two schemas.")
+        print("Every query returned the same results on both schemas.")
+
+        print(f"\n{'':<44}{'Name-based':>14}{'Inferred':>14}")
+        print(f"{'Table data (MB)':<44}" + ''.join(f"{builds[label][2] / 1e6:>14.1f}" for label in paths))
+        print(f"{'Table data and indexes (MB)':<44}" + ''.join(f"{builds[label][3] / 1e6:>14.1f}" for label in paths))
+        print(f"{'Load (s)':<44}" + ''.join(f"{builds[label][0]:>14.2f}" for label in paths))
+        print(f"{'Key and index build after load (s)':<44}" + ''.join(f"{builds[label][1]:>14.2f}" for label in paths))
+        for name in query_runs['inferred'][0]:
+            print(f"{name + ' (s)':<44}" + ''.join(f"{query_runs[label][0][name]:>14.3f}" for label in paths))
+        print(f"\nKeys created: {', '.join(sorted(t for t in TABLE_KEYS if t in counts['inferred']))}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    print("--- Benchmark: inferred vs name-based MySQL schema (SQLite stand-in) ---")
+    run_benchmark()
+    print("\n--- Benchmark Complete! ---")
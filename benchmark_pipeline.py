@@ -0,0 +1,271 @@
+# benchmark_pipeline.py
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# --- BENCHMARK SETTINGS ---
+# Every stage runs on synthetic Olist data (synthetic_olist.py) against local stand-ins:
+# SQLite for MySQL, SQLite and DuckDB for Snowflake, and a local feature store.
+SCALE = float(os.environ.get('PIPELINE_SCALE', '1'))  # 1, 10 or 100 times the size of the real dataset
+SEED = 42
+RESULTS_DIR = 'benchmark_results'
+# A results file from an earlier run (e.g. on the main branch) to compare against
+BASELINE_PATH = os.environ.get('PIPELINE_BASELINE')
+KEEP_WORKDIR = False  # Keep the generated data, databases and stage logs for inspection
+APP_RERUNS = 5
+
+SOURCE_DB = 'source.db'  # Stand-in for MySQL, built by the load_data stage
+WAREHOUSE_DB = 'standin.db'  # Stand-in for Snowflake, named as benchmark_app_startup expects
+DATA_DIR = 'data'
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the resource module is missing."""
+    import instrumentation  # Not at the top: it reads PIPELINE_JOB, which run_stage sets, when imported
+    peak = instrumentation.peak_rss_bytes()
+    return None if peak is None else round(peak / (1024 * 1024), 1)
+
+
+def sqlite_row_count(path, table_name):
+    import sqlite3
+    db = sqlite3.connect(path)
+    try:
+        return db.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+    finally:
+        db.close()
+
+
+# --- STAGES ---
+# Each stage runs in workdir and returns (rows processed, extra metrics)
+
+def stage_generate(workdir, scale, seed):
+    from synthetic_olist import generate_dataset
+    counts = generate_dataset(os.path.join(workdir, DATA_DIR), scale, seed)
+    print(json.dumps(counts, indent=2))
+    return sum(counts.values()), {'files': counts}
+
+
+def stage_load_data(workdir, scale, seed):
+    """load_data.py's inferred schema, bulk insert and key build, into the SQLite stand-in for MySQL."""
+    from benchmark_load_schema import build_standin, table_counts
+    load_seconds, index_seconds, data_bytes, total_bytes = build_standin(
+        os.path.join(workdir, SOURCE_DB), os.path.join(workdir, DATA_DIR), infer_types=True)
+    counts = table_counts(os.path.join(workdir, SOURCE_DB))
+    return sum(counts.values()), {'load_seconds': round(load_seconds, 3), 'index_seconds': round(index_seconds, 3),
+                                  'database_mb': round(total_bytes / 1e6, 1)}
+
+
+def transfer_tables(workdir, sink):
+    """mysql_to_snowflake.py's streaming transfer of every source table, upper-cased as in Snowflake."""
+    import sqlite3
+    from mysql_to_snowflake import stream_table
+    source = sqlite3.connect(os.path.join(workdir, SOURCE_DB))
+    try:
+        tables = [row[0] for row in source.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        return sum(stream_table(source, sink, table, table.upper()) for table in tables)
+    finally:
+        source.close()
+        sink.close()
+
+
+def stage_etl_sqlite(workdir, scale, seed):
+    from etl_sinks import SQLiteSink
+    return transfer_tables(workdir, SQLiteSink(os.path.join(workdir, WAREHOUSE_DB))), {}
+
+
+def stage_etl_duckdb(workdir, scale, seed):
+    from etl_sinks import DuckDBSink
+    return transfer_tables(workdir, DuckDBSink(os.path.join(workdir, 'standin.duckdb'))), {}
+
+
+def stage_build_features(workdir, scale, seed):
+    """RFM features from the CSVs, published to the feature store that churn training and the app read."""
+    import feature_store
+    from build_features import build_features_in_memory
+    features = build_features_in_memory(os.path.join(workdir, DATA_DIR))
+    _, total_rows = feature_store.write_snapshot(
+        'CUSTOMER_CHURN_FEATURES', [features], feature_store.FEATURE_TABLES['CUSTOMER_CHURN_FEATURES']['partition_cols'])
+    return total_rows, {}
+
+
+def stage_incremental_features(workdir, scale, seed):
+    """
+    incremental_features.py's self-check: accumulators built from the earlier
+    orders and updated with the rest must equal a full recompute, for a large
+    and a small delta. A mismatch fails the run.
+    """
+    from incremental_features import check_against_full_recompute
+    for split_fraction in (0.5, 0.9):
+        if not check_against_full_recompute(os.path.join(workdir, DATA_DIR), split_fraction):
+            raise AssertionError(f"Incremental RFM features split at {split_fraction:.0%} of orders "
+                                 f"don't match a full recompute (see the stage log).")
+    return None, {}
+
+
+def stage_train_recommender(workdir, scale, seed):
+    from sqlalchemy import create_engine
+    from recommender_store import Recommender
+    from train_recommender import MODEL_DIR, train_tiered_recommender
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, WAREHOUSE_DB)}")
+    try:
+        train_tiered_recommender(engine)
+    finally:
+        engine.dispose()
+    model = Recommender(MODEL_DIR)
+    return sqlite_row_count(os.path.join(workdir, WAREHOUSE_DB), 'ORDER_ITEMS'), {
+        'products': len(model.product_ids), 'recommendations': int(model.indptr[-1])}
+
+
+def stage_train_churn_model(workdir, scale, seed):
+    import joblib
+    from train_churn_model import MODEL_FILENAME, get_clean_feature_data, train_model_full
+    model = train_model_full(None)  # Reads the feature store snapshot, so no warehouse engine is needed
+    joblib.dump(model, MODEL_FILENAME)
+    return len(get_clean_feature_data(None)), {}
+
+
+def stage_app(workdir, scale, seed):
+    """A headless app.py session: cold start, warm reruns, then the second view."""
+    from benchmark_app_startup import run_app_session
+    records = run_app_session(workdir, APP_RERUNS)
+    cold = records[0]
+    warm = sorted(record['total_seconds'] for record in records[1:] if record['view'] == cold['view'])
+    return None, {'runs': len(records), 'cold_first_paint_seconds': cold['phases'].get('first_paint'),
+                  'cold_total_seconds': cold['total_seconds'],
+                  'warm_median_total_seconds': warm[len(warm) // 2] if warm else None}
+
+
+def duckdb_installed():
+    try:
+        import duckdb  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# Run in this order; later stages read what earlier ones wrote
+STAGES = [
+    ('generate', stage_generate),
+    ('load_data', stage_load_data),
+    ('mysql_to_snowflake[sqlite]', stage_etl_sqlite),
+    ('mysql_to_snowflake[duckdb]', stage_etl_duckdb),
+    ('build_features', stage_build_features),
+    ('incremental_features[check]', stage_incremental_features),
+    ('train_recommender', stage_train_recommender),
+    ('train_churn_model', stage_train_churn_model),
+    ('app', stage_app),
+]
+
+
+def run_stage(name, stage, workdir, scale, seed):
+    """
+    Runs one stage in this (fresh) process with its output sent to a log file in
+    workdir, so peak RSS and wall time cover that stage alone.
+    """
+    os.chdir(workdir)
+    os.environ['PIPELINE_JOB'] = name  # Names the stage's spans in the trace log (see instrumentation.py)
+    log_name = f"{name.replace('[', '_').replace(']', '')}.log"
+    with open(os.path.join(workdir, log_name), 'w') as log, contextlib.redirect_stdout(log):
+        start_time = time.perf_counter()
+        rows, extra = stage(workdir, scale, seed)
+        wall_seconds = time.perf_counter() - start_time
+    return {
+        'stage': name,
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'rows': rows,
+        'rows_per_second': round(rows / wall_seconds, 1) if rows and wall_seconds > 0 else None,
+        'log': log_name,
+        **extra,
+    }
+
+
+def git_commit():
+    """The commit being benchmarked, marked '-dirty' when the tree has uncommitted changes."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repo_dir,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    if baseline.get('scale') != results['scale']:
+        print(f"\nNote: the baseline was run at scale {baseline.get('scale')}x, this run at {results['scale']}x.")
+    before = {stage['stage']: stage for stage in baseline['stages']}
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    print(f"{'Stage':<30}{'Wall s':>10}{'Before':>10}{'Change':>9}{'RSS MB':>10}{'Before':>10}")
+    for stage in results['stages']:
+        old = before.get(stage['stage'])
+        if old is None:
+            continue
+        change = (stage['wall_seconds'] / old['wall_seconds'] - 1) * 100 if old['wall_seconds'] else 0.0
+        print(f"{stage['stage']:<30}{stage['wall_seconds']:>10.2f}{old['wall_seconds']:>10.2f}{change:>+8.1f}%"
+              f"{stage['peak_rss_mb'] or 0:>10.1f}{old['peak_rss_mb'] or 0:>10.1f}")
+
+
+def run_benchmark(scale=SCALE, seed=SEED, baseline_path=BASELINE_PATH):
+    stages = [(name, stage) for name, stage in STAGES if stage is not stage_etl_duckdb or duckdb_installed()]
+    if len(stages) < len(STAGES):
+        print("duckdb is not installed; skipping the DuckDB ETL stage.")
+
+    results = {
+        'scale': scale,
+        'seed': seed,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'stages': [],
+    }
+    workdir = tempfile.mkdtemp(prefix='pipeline_benchmark_')
+    try:
+        print(f"Running {len(stages)} stages at scale {scale}x in '{workdir}'...")
+        print(f"\n{'Stage':<30}{'Wall s':>10}{'RSS MB':>10}{'Rows':>14}{'Rows/sec':>14}")
+        for name, stage in stages:
+            # A fresh interpreter per stage, so each one's peak RSS is its own
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                record = executor.submit(run_stage, name, stage, workdir, scale, seed).result()
+            results['stages'].append(record)
+            print(f"{name:<30}{record['wall_seconds']:>10.2f}{record['peak_rss_mb'] or 0:>10.1f}"
+                  f"{record['rows'] or 0:>14,}{record['rows_per_second'] or 0:>14,.0f}")
+    except Exception as e:
+        print(f"An error occurred: {e} (stage logs are in '{workdir}')")
+        return None
+    finally:
+        if KEEP_WORKDIR or len(results['stages']) < len(stages):
+            results['workdir'] = workdir
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"pipeline_{scale:g}x_{results['commit'] or 'unknown'}_"
+                                             f"{datetime.now():%Y%m%dT%H%M%S}.json")
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to '{results_path}'.")
+
+    if baseline_path:
+        compare_with_baseline(results, baseline_path)
+    return results_path
+
+
+if __name__ == '__main__':
+    print("--- Benchmark: Pipeline Stages on Synthetic Olist Data ---")
+    run_benchmark()
+    print("\n--- Benchmark Complete! ---")
@@ -0,0 +1,82 @@
+# benchmark_recommender.py
+import time
+import numpy as np
+import pandas as pd
+from train_recommender import create_recommendation_model, create_recommendation_model_iterrows
+
+# --- BENCHMARK SETTINGS ---
+ORDER_COUNTS = [10_000, 100_000, 1_000_000]  # Number of synthetic orders per run
+PRODUCTS_PER_ORDER = 0.33  # Catalogue size relative to the number of orders (Olist: ~33k products, ~99k orders)
+BASKET_SIZE_P = 0.6  # Geometric basket-size parameter: most orders have one item, some have several
+POPULARITY_SKEW = 1.1  # Zipf exponent of product popularity (long tail)
+SEED = 42
+
+
+def make_synthetic_pairs(n_orders, seed=SEED):
+    """
+    Generates Olist-shaped order baskets and returns the (product_a, product_b)
+    pairs that the ORDER_ITEMS self-join in get_copurchase_data() would return.
+    """
+    rng = np.random.default_rng(seed)
+    n_products = max(int(n_orders * PRODUCTS_PER_ORDER), 10)
+
+    basket_sizes = rng.geometric(BASKET_SIZE_P, size=n_orders)
+    popularity = 1.0 / np.arange(1, n_products + 1) ** POPULARITY_SKEW
+    product_codes = rng.choice(n_products, size=basket_sizes.sum(), p=popularity / popularity.sum())
+
+    product_ids = np.array([f"{code:032x}" for code in rng.permutation(n_products)], dtype=object)
+    order_items = pd.DataFrame({
+        'order_id': np.repeat(np.arange(n_orders), basket_sizes),
+        'product_id': product_ids[product_codes],
+    })
+
+    pairs = order_items.merge(order_items, on='order_id', suffixes=('_a', '_b'))
+    pairs = pairs[pairs['product_id_a'] != pairs['product_id_b']]
+    return pairs.rename(columns={'product_id_a': 'product_a', 'product_id_b': 'product_b'})[['product_a', 'product_b']]
+
+
+def same_top_k(baseline, vectorized, pair_counts):
+    """
+    Checks that both models give every product the same top-k co-purchase counts.
+    Products tied on count may be ordered differently, since the baseline's sort
+    doesn't define an order for ties.
+    """
+    if set(baseline) != set(vectorized):
+        return False
+    for product_a, recommended in baseline.items():
+        baseline_counts = [pair_counts[(product_a, b)] for b in recommended]
+        vectorized_counts = [pair_counts[(product_a, b)] for b in vectorized[product_a]]
+        if sorted(baseline_counts, reverse=True) != vectorized_counts:
+            return False
+    return True
+
+
+def run_benchmark():
+    results = []
+    for n_orders in ORDER_COUNTS:
+        print(f"\n--- {n_orders:,} orders ---")
+        pairs = make_synthetic_pairs(n_orders)
+        print(f"Generated {len(pairs):,} co-purchased pairs.")
+
+        start_time = time.perf_counter()
+        baseline = create_recommendation_model_iterrows(pairs)
+        baseline_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        vectorized = create_recommendation_model(pairs)
+        vectorized_seconds = time.perf_counter() - start_time
+
+        pair_counts = pairs.groupby(['product_a', 'product_b']).size().to_dict()
+        matches = same_top_k(baseline, vectorized, pair_counts)
+        results.append((n_orders, len(pairs), baseline_seconds, vectorized_seconds, matches))
+
+    print(f"\n{'Orders':>12}{'Pairs':>12}{'iterrows (s)':>15}{'vectorized (s)':>17}{'Speedup':>10}{'Same top-5':>12}")
+    for n_orders, n_pairs, baseline_seconds, vectorized_seconds, matches in results:
+        print(f"{n_orders:>12,}{n_pairs:>12,}{baseline_seconds:>15.2f}{vectorized_seconds:>17.2f}"
+              f"{baseline_seconds / max(vectorized_seconds, 1e-9):>9.1f}x{str(matches):>12}")
+
+
+if __name__ == '__main__':
+    print("--- Benchmark: co-purchase model build (iterrows vs. vectorized) ---")
+    run_benchmark()
+    print("\n--- Benchmark Complete! ---")
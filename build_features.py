@@ -0,0 +1,289 @@
+# build_features.py
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import feature_store
+import query_cache
+
+# --- DATA SOURCES ---
+# Directory containing the Olist CSV files (same layout as load_data.py)
+DATA_DIR = '.'
+ORDERS_FILE = 'olist_orders_dataset.csv'
+ORDER_ITEMS_FILE = 'olist_order_items_dataset.csv'
+PAYMENTS_FILE = 'olist_order_payments_dataset.csv'
+CUSTOMERS_FILE = 'olist_customers_dataset.csv'
+
+# --- FEATURE SETTINGS ---
+CHURN_THRESHOLD_DAYS = 180  # Customers with no purchase for longer than this are labelled as churned
+EXCLUDED_ORDER_STATUSES = ['canceled', 'unavailable']  # Orders that don't count as purchases
+
+# --- BUILD SETTINGS ---
+# 'memory' builds the features in one vectorized pass over fully loaded files.
+# 'out_of_core' streams the files in chunks through hash-partitioned spill files,
+# so memory is bounded by one partition instead of the whole dataset.
+BUILD_MODE = 'memory'
+CHUNK_SIZE = 500000  # CSV rows read per chunk in out-of-core mode
+SPILL_PARTITIONS = 16  # Number of hash partitions in out-of-core mode
+SPILL_DIR = 'feature_build_spill'
+
+
+def data_path(filename, data_dir=DATA_DIR):
+    return os.path.join(data_dir, filename)
+
+
+def read_orders(path, **kwargs):
+    return pd.read_csv(path, usecols=['order_id', 'customer_id', 'order_status', 'order_purchase_timestamp'],
+                       parse_dates=['order_purchase_timestamp'], **kwargs)
+
+
+def read_customers(path, **kwargs):
+    return pd.read_csv(path, usecols=['customer_id', 'customer_unique_id'], **kwargs)
+
+
+def read_payments(path, **kwargs):
+    return pd.read_csv(path, usecols=['order_id', 'payment_value'], **kwargs)
+
+
+def read_order_items(path, **kwargs):
+    return pd.read_csv(path, usecols=['order_id', 'price', 'freight_value'], **kwargs)
+
+
+def join_customers(orders, customers):
+    """
+    Reduces orders to purchases: order_id, customer_unique_id and
+    order_purchase_timestamp, skipping excluded statuses and unknown customers.
+    """
+    orders = orders[~orders['order_status'].isin(EXCLUDED_ORDER_STATUSES)]
+    orders = orders.dropna(subset=['order_purchase_timestamp'])
+    customers = customers.drop_duplicates('customer_id')
+
+    customer_codes = pd.Index(customers['customer_id']).get_indexer(orders['customer_id'])
+    known = customer_codes >= 0
+    purchases = pd.DataFrame({
+        'order_id': orders['order_id'].to_numpy()[known],
+        'customer_unique_id': customers['customer_unique_id'].to_numpy()[customer_codes[known]],
+        'order_purchase_timestamp': orders['order_purchase_timestamp'].to_numpy()[known],
+    })
+    return purchases.drop_duplicates('order_id')
+
+
+def value_orders(purchases, payments, order_items):
+    """
+    Adds order_value to each purchase: the sum of its payments, or of item prices
+    plus freight for orders with no payment rows. Ids become categoricals so the
+    later group-bys run on integer codes.
+    """
+    payment_totals = payments.groupby('order_id', sort=False)['payment_value'].sum()
+    item_totals = (order_items['price'] + order_items['freight_value']).groupby(
+        order_items['order_id'], sort=False).sum()
+
+    order_ids = purchases['order_id'].to_numpy()
+    order_value = payment_totals.reindex(order_ids).to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(order_value)
+    order_value[missing] = item_totals.reindex(order_ids[missing]).fillna(0.0).to_numpy()
+
+    return pd.DataFrame({
+        'order_id': pd.Categorical(order_ids),
+        'customer_unique_id': pd.Categorical(purchases['customer_unique_id'].to_numpy()),
+        'order_purchase_timestamp': purchases['order_purchase_timestamp'].to_numpy(),
+        'order_value': order_value,
+    })
+
+
+def aggregate_customers(facts):
+    """
+    Partial RFM aggregates per customer: last purchase, number of orders and total
+    spend. Partials of disjoint order sets merge with max / sum / sum.
+    """
+    return facts.groupby('customer_unique_id', observed=True, sort=False).agg(
+        last_purchase=('order_purchase_timestamp', 'max'),
+        frequency=('order_id', 'size'),
+        monetary_value=('order_value', 'sum'),
+    )
+
+
+def merge_partials(partials):
+    """Merges partial aggregates of the same customers into one row per customer."""
+    combined = pd.concat(partials)
+    return combined.groupby(level=0, sort=False).agg(
+        last_purchase=('last_purchase', 'max'),
+        frequency=('frequency', 'sum'),
+        monetary_value=('monetary_value', 'sum'),
+    )
+
+
+def finalize_rfm(aggregates, snapshot_date):
+    """
+    Turns per-customer aggregates into the CUSTOMER_CHURN_FEATURES columns.
+    Recency is counted in whole days up to snapshot_date.
+    """
+    recency = (snapshot_date - aggregates['last_purchase']).dt.days
+    return pd.DataFrame({
+        'customer_unique_id': aggregates.index.astype(str),
+        'recency': recency.to_numpy(dtype=np.int64),
+        'frequency': aggregates['frequency'].to_numpy(dtype=np.int64),
+        'monetary_value': aggregates['monetary_value'].to_numpy(dtype=np.float64).round(2),
+        'churn': (recency.to_numpy() > CHURN_THRESHOLD_DAYS).astype(np.int64),
+    })
+
+
+def default_snapshot_date(last_purchase):
+    """The day after the latest purchase, so the most recent customers have recency 0."""
+    return pd.Timestamp(last_purchase).normalize() + pd.Timedelta(days=1)
+
+
+def build_rfm_features(orders, customers, payments, order_items, snapshot_date=None):
+    """
+    Computes RFM features and the churn label for every customer in one vectorized
+    pass over in-memory tables.
+    """
+    facts = value_orders(join_customers(orders, customers), payments, order_items)
+    aggregates = aggregate_customers(facts)
+    if snapshot_date is None:
+        snapshot_date = default_snapshot_date(facts['order_purchase_timestamp'].max())
+    return finalize_rfm(aggregates, snapshot_date)
+
+
+def build_features_in_memory(data_dir=DATA_DIR, snapshot_date=None):
+    print("Reading orders, customers, payments and order items...")
+    orders = read_orders(data_path(ORDERS_FILE, data_dir))
+    customers = read_customers(data_path(CUSTOMERS_FILE, data_dir))
+    payments = read_payments(data_path(PAYMENTS_FILE, data_dir))
+    order_items = read_order_items(data_path(ORDER_ITEMS_FILE, data_dir))
+    return build_rfm_features(orders, customers, payments, order_items, snapshot_date)
+
+
+# --- OUT-OF-CORE BUILD ---
+def partition_of(keys, partitions):
+    """Stable hash partition number of each key."""
+    return pd.util.hash_array(np.asarray(keys, dtype=object)) % partitions
+
+
+def spill(df, key, spill_dir, name, chunk_number, partitions):
+    """Appends a chunk to spill_dir/<name>/p<k>/, split by the hash of its key column."""
+    parts = partition_of(df[key].to_numpy(), partitions)
+    for partition, part in df.groupby(parts, sort=False):
+        part_dir = os.path.join(spill_dir, name, f"p{partition:03d}")
+        os.makedirs(part_dir, exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(part, preserve_index=False),
+                       os.path.join(part_dir, f"chunk-{chunk_number:05d}.parquet"))
+
+
+def read_spill(spill_dir, name, partition):
+    """Reads one spilled partition, or None if no rows hashed to it."""
+    part_dir = os.path.join(spill_dir, name, f"p{partition:03d}")
+    if not os.path.isdir(part_dir):
+        return None
+    return pq.read_table(part_dir).to_pandas()
+
+
+def build_features_out_of_core(data_dir=DATA_DIR, snapshot_date=None, chunksize=CHUNK_SIZE,
+                               partitions=SPILL_PARTITIONS, spill_dir=SPILL_DIR):
+    """
+    Builds the same features as build_rfm_features() while holding at most one
+    CSV chunk or one spill partition in memory. Yields the features in chunks.
+      1. Orders and customers are spilled by customer_id, joined partition by
+         partition, and the resulting purchases re-spilled by order_id.
+      2. Payments and order items are spilled by order_id; each partition's
+         purchases are valued and reduced to partial aggregates per customer,
+         spilled by customer_unique_id.
+      3. Each customer partition's partials are merged into final rows.
+    """
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    try:
+        print("  Partitioning orders and customers by customer_id...")
+        for i, chunk in enumerate(read_orders(data_path(ORDERS_FILE, data_dir), chunksize=chunksize)):
+            spill(chunk, 'customer_id', spill_dir, 'orders', i, partitions)
+        for i, chunk in enumerate(read_customers(data_path(CUSTOMERS_FILE, data_dir), chunksize=chunksize)):
+            spill(chunk, 'customer_id', spill_dir, 'customers', i, partitions)
+
+        print("  Joining purchases to customers...")
+        latest_purchase = None
+        for partition in range(partitions):
+            orders = read_spill(spill_dir, 'orders', partition)
+            customers = read_spill(spill_dir, 'customers', partition)
+            if orders is None or customers is None:
+                continue
+            purchases = join_customers(orders, customers)
+            if purchases.empty:
+                continue
+            partition_latest = purchases['order_purchase_timestamp'].max()
+            latest_purchase = partition_latest if latest_purchase is None else max(latest_purchase, partition_latest)
+            spill(purchases, 'order_id', spill_dir, 'purchases', partition, partitions)
+
+        if latest_purchase is None:
+            return
+        if snapshot_date is None:
+            snapshot_date = default_snapshot_date(latest_purchase)
+
+        print("  Partitioning payments and order items by order_id...")
+        for i, chunk in enumerate(read_payments(data_path(PAYMENTS_FILE, data_dir), chunksize=chunksize)):
+            spill(chunk, 'order_id', spill_dir, 'payments', i, partitions)
+        for i, chunk in enumerate(read_order_items(data_path(ORDER_ITEMS_FILE, data_dir), chunksize=chunksize)):
+            spill(chunk, 'order_id', spill_dir, 'order_items', i, partitions)
+
+        print("  Aggregating purchases per customer...")
+        for partition in range(partitions):
+            purchases = read_spill(spill_dir, 'purchases', partition)
+            if purchases is None:
+                continue
+            payments = read_spill(spill_dir, 'payments', partition)
+            if payments is None:
+                payments = pd.DataFrame({'order_id': pd.Series(dtype=object), 'payment_value': pd.Series(dtype=float)})
+            order_items = read_spill(spill_dir, 'order_items', partition)
+            if order_items is None:
+                order_items = pd.DataFrame({'order_id': pd.Series(dtype=object), 'price': pd.Series(dtype=float),
+                                            'freight_value': pd.Series(dtype=float)})
+
+            facts = value_orders(purchases, payments, order_items)
+            partials = aggregate_customers(facts)
+            partials.index = partials.index.astype(str)
+            partials = partials.rename_axis('customer_unique_id').reset_index()
+            spill(partials, 'customer_unique_id', spill_dir, 'partials', partition, partitions)
+
+        print("  Merging partial aggregates...")
+        for partition in range(partitions):
+            partials = read_spill(spill_dir, 'partials', partition)
+            if partials is None:
+                continue
+            aggregates = merge_partials([partials.set_index('customer_unique_id')])
+            yield finalize_rfm(aggregates, snapshot_date)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def build_features(mode=BUILD_MODE, data_dir=DATA_DIR, publish=True):
+    """
+    Main function: builds CUSTOMER_CHURN_FEATURES from the raw CSVs and publishes
+    it as a feature store snapshot, where train_churn_model.py and app.py read it.
+    """
+    try:
+        start_time = time.perf_counter()
+        print(f"Building RFM features from '{data_dir}' ({mode} mode)...")
+        if mode == 'out_of_core':
+            chunks = build_features_out_of_core(data_dir)
+        else:
+            chunks = [build_features_in_memory(data_dir)]
+
+        if publish:
+            version, total_rows = feature_store.write_snapshot(
+                'CUSTOMER_CHURN_FEATURES', chunks, feature_store.FEATURE_TABLES['CUSTOMER_CHURN_FEATURES']['partition_cols'])
+            print(f"Published features for {total_rows} customers as version {version}.")
+            query_cache.publish_data_version()
+        else:
+            total_rows = sum(len(chunk) for chunk in chunks)
+            print(f"Built features for {total_rows} customers.")
+        print(f"Feature build took {time.perf_counter() - start_time:.1f}s.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == '__main__':
+    print("--- Starting RFM Feature Build ---")
+    build_features()
+    print("\n--- RFM Feature Build Complete! ---")
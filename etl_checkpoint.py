@@ -0,0 +1,181 @@
+# etl_checkpoint.py
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+
+# --- CHECKPOINT SETTINGS ---
+MAX_QUARANTINED_ROWS = 1000  # Bad rows tolerated per chunk; beyond this the chunk fails as before
+# LIMIT meaning "all remaining rows", accepted by both MySQL and SQLite
+ALL_ROWS = 2 ** 63 - 1
+
+
+def chunk_checksum(df):
+    """A checksum of a chunk's values, in order, for telling whether a rerun reads the same rows."""
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha256(hashes.tobytes()).hexdigest()[:16]
+
+
+class Checkpoint:
+    """
+    Manifest of a resumable load. For each table it records how many source rows
+    have been committed to the target in whole chunks, the rows loaded and
+    quarantined, and a checksum of the last chunk and of the table so far.
+    It is saved to a local JSON file after every chunk (written to a temporary
+    file and renamed, like SyncState), so a failed run can be picked up at the
+    first chunk that wasn't committed. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.tables = json.load(f)
+
+    def _save(self):
+        # Write to a temporary file first so a crash can't leave a half-written manifest
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.tables, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, table_name, key):
+        return self.tables.get(table_name, {}).get(key)
+
+    def has_progress(self, table_name, source):
+        """True if a previous run started this table from the same source."""
+        entry = self.tables.get(table_name)
+        return entry is not None and entry['source'] == source
+
+    def is_complete(self, table_name):
+        return self.get(table_name, 'status') == 'complete'
+
+    def resume(self, table_name, source, target_rows):
+        """
+        Returns where to pick a table up: None when it is already complete, or a
+        dict with the chunk number and source row to continue from, the rows
+        loaded so far, and the last committed chunk, which the caller should
+        re-read and compare. The table starts over from chunk 0 when it has no
+        entry, its source changed (a different file or batch size), or the
+        target no longer holds exactly the rows the manifest says were loaded,
+        e.g. after a crash between a commit and the manifest update.
+        """
+        with self.lock:
+            entry = self.tables.get(table_name)
+            if entry is not None and entry['source'] == source:
+                if entry['status'] == 'complete':
+                    return None
+                if target_rows == entry['rows']:
+                    return {'chunk': entry['chunks'], 'row': entry['source_rows'], 'rows': entry['rows'],
+                            'last_chunk': entry['last_chunk']}
+            self.tables[table_name] = {
+                'status': 'in_progress', 'source': source, 'chunks': 0, 'source_rows': 0, 'rows': 0,
+                'quarantined': 0, 'checksum': None, 'last_chunk': None,
+                'started_at': datetime.now().isoformat(sep=' ', timespec='seconds'),
+            }
+            self._save()
+            return {'chunk': 0, 'row': 0, 'rows': 0, 'last_chunk': None}
+
+    def commit_chunk(self, table_name, chunk_number, start_row, source_rows, rows, quarantined, checksum):
+        """Records a chunk as committed: call only once the target has committed it."""
+        with self.lock:
+            entry = self.tables[table_name]
+            entry['chunks'] = chunk_number + 1
+            entry['source_rows'] = start_row + source_rows
+            entry['rows'] += rows
+            entry['quarantined'] += quarantined
+            entry['checksum'] = hashlib.sha256(f"{entry['checksum']}{checksum}".encode('ascii')).hexdigest()[:16]
+            entry['last_chunk'] = {'chunk': chunk_number, 'start_row': start_row, 'source_rows': source_rows,
+                                   'checksum': checksum}
+            entry['updated_at'] = datetime.now().isoformat(sep=' ', timespec='seconds')
+            self._save()
+
+    def complete_table(self, table_name, **values):
+        with self.lock:
+            entry = self.tables.setdefault(table_name, {'source': None, 'rows': 0})
+            entry.update(values, status='complete')
+            self._save()
+
+    def update(self, table_name, **values):
+        with self.lock:
+            self.tables.setdefault(table_name, {}).update(values)
+            self._save()
+
+    def reset_table(self, table_name):
+        with self.lock:
+            self.tables.pop(table_name, None)
+            self._save()
+
+    def finish(self):
+        """Deletes the manifest once the whole run has succeeded, so the next run starts afresh."""
+        with self.lock:
+            self.tables = {}
+            for path in (self.path, f"{self.path}.tmp"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+# --- QUARANTINE ---
+
+def is_row_error(error):
+    """
+    True for errors caused by the values being written rather than by the
+    connection or the target: PEP 249 DataError/IntegrityError, SQLSTATE
+    classes 22 (data exception) and 23 (constraint violation), and conversion
+    errors while staging. Only these are narrowed down to the rows at fault.
+    """
+    names = {cls.__name__ for cls in type(error).__mro__}
+    sqlstate = str(getattr(error, 'sqlstate', None) or '')
+    return bool(names & {'DataError', 'IntegrityError', 'ArrowException', 'ValueError', 'TypeError'}) \
+        or sqlstate[:2] in ('22', '23')
+
+
+def load_with_quarantine(rows, write, max_bad_rows=MAX_QUARANTINED_ROWS):
+    """
+    Writes a chunk (a DataFrame or list of rows) with write(rows). If that fails
+    with a row error, the chunk is split in halves and each half retried, down
+    to single rows, so a few bad rows cost a few extra writes of shrinking size
+    instead of the whole table. The target must leave a failed write without
+    effect, as a transactional statement does. Returns (rows written,
+    [(bad row, error message)]); raises the error once more than max_bad_rows
+    rows have failed, since then the problem is unlikely to be the data.
+    """
+    bad_rows = []
+
+    def attempt(part):
+        try:
+            write(part)
+            return len(part)
+        except Exception as e:
+            if not is_row_error(e):
+                raise
+            if len(part) <= 1:
+                bad_rows.append((part, f"{type(e).__name__}: {e}"))
+                if len(bad_rows) > max_bad_rows:
+                    raise
+                return 0
+            middle = len(part) // 2
+            return attempt(part[:middle]) + attempt(part[middle:])
+
+    return attempt(rows), bad_rows
+
+
+def quarantine_rows(quarantine_dir, table_name, bad_rows):
+    """Appends rows that could not be loaded, with their errors, to <quarantine_dir>/<table>.jsonl."""
+    os.makedirs(quarantine_dir, exist_ok=True)
+    quarantined_at = datetime.now().isoformat(sep=' ', timespec='seconds')
+    with open(os.path.join(quarantine_dir, f"{table_name}.jsonl"), 'a') as f:
+        for part, error in bad_rows:
+            if isinstance(part, pd.DataFrame):
+                records = part.astype(object).where(part.notna(), None).to_dict('records')
+            else:
+                records = [list(row) for row in part]
+            for record in records:
+                f.write(json.dumps({'table': table_name, 'error': error, 'quarantined_at': quarantined_at,
+                                    'row': record}, default=str) + '\n')
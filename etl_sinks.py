@@ -0,0 +1,314 @@
+# etl_sinks.py
+import os
+import shutil
+import sqlite3
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Names of the session-scoped Snowflake objects used to stage Parquet batches
+SNOWFLAKE_STAGE = 'ETL_STAGING'
+SNOWFLAKE_FILE_FORMAT = 'ETL_PARQUET'
+
+
+def merge_changes(conn, table_name, changes_table, keys, columns):
+    """
+    Upserts the rows of changes_table into table_name by key columns on a
+    SQLite or DuckDB connection: matching rows with different values are
+    replaced, new rows inserted, and rows already in the target unchanged are
+    left alone. Returns (inserted, updated) row counts.
+    """
+    match = ' AND '.join(f'"{table_name}"."{k}" = "{changes_table}"."{k}"' for k in keys)
+    changed = ' OR '.join(f'"{table_name}"."{c}" IS DISTINCT FROM "{changes_table}"."{c}"'
+                          for c in columns if c not in keys) or 'FALSE'
+    cols = ', '.join(f'"{c}"' for c in columns)
+
+    inserted = conn.execute(
+        f'SELECT COUNT(*) FROM "{changes_table}" WHERE NOT EXISTS (SELECT 1 FROM "{table_name}" WHERE {match})'
+    ).fetchone()[0]
+    updated = conn.execute(
+        f'SELECT COUNT(*) FROM "{changes_table}" '
+        f'WHERE EXISTS (SELECT 1 FROM "{table_name}" WHERE {match} AND ({changed}))'
+    ).fetchone()[0]
+    conn.execute(f'DELETE FROM "{table_name}" '
+                 f'WHERE EXISTS (SELECT 1 FROM "{changes_table}" WHERE {match} AND ({changed}))')
+    conn.execute(f'INSERT INTO "{table_name}" ({cols}) SELECT {cols} FROM "{changes_table}" '
+                 f'WHERE NOT EXISTS (SELECT 1 FROM "{table_name}" WHERE {match})')
+    conn.execute(f'DROP TABLE "{changes_table}"')
+    return inserted, updated
+
+
+def delete_partitions(conn, table_name, column, values):
+    """Deletes the rows whose partition column is one of values, on a SQLite or DuckDB connection."""
+    if values:
+        placeholders = ', '.join(['?'] * len(values))
+        conn.execute(f'DELETE FROM "{table_name}" WHERE "{column}" IN ({placeholders})', list(values))
+
+
+class SnowflakeSink:
+    """
+    Uploads staged Parquet batches to Snowflake with PUT and appends them
+    with COPY INTO. The first batch of a table (re)creates it from the
+    Parquet schema, like write_pandas(auto_create_table=True, overwrite=True).
+    With owns_connection the sink also closes the connection when it is closed.
+    """
+
+    def __init__(self, conn, owns_connection=False):
+        self.conn = conn
+        self.owns_connection = owns_connection
+        self.cursor = conn.cursor()
+        self.cursor.execute(f"CREATE TEMPORARY STAGE IF NOT EXISTS {SNOWFLAKE_STAGE}")
+        self.cursor.execute(f"CREATE TEMPORARY FILE FORMAT IF NOT EXISTS {SNOWFLAKE_FILE_FORMAT} TYPE = PARQUET")
+
+    def _put(self, table_name, parquet_path):
+        """Uploads a Parquet file to the stage and returns its stage folder and file name."""
+        file_name = os.path.basename(parquet_path)
+        stage_path = f"@{SNOWFLAKE_STAGE}/{table_name}"
+        local_path = os.path.abspath(parquet_path).replace('\\', '/')
+
+        # Parquet is already compressed, so skip the connector's gzip pass
+        self.cursor.execute(f"PUT 'file://{local_path}' {stage_path} AUTO_COMPRESS = FALSE OVERWRITE = TRUE")
+        return stage_path, file_name
+
+    def _copy_into(self, table_name, stage_path, file_name):
+        self.cursor.execute(
+            f'COPY INTO "{table_name}" FROM {stage_path} FILES = (\'{file_name}\') '
+            f"FILE_FORMAT = (FORMAT_NAME = '{SNOWFLAKE_FILE_FORMAT}') "
+            f"MATCH_BY_COLUMN_NAME = CASE_SENSITIVE PURGE = TRUE"
+        )
+
+    def write_batch(self, table_name, parquet_path, overwrite=False):
+        stage_path, file_name = self._put(table_name, parquet_path)
+
+        if overwrite:
+            self.cursor.execute(
+                f'CREATE OR REPLACE TABLE "{table_name}" USING TEMPLATE ('
+                f"SELECT ARRAY_AGG(OBJECT_CONSTRUCT(*)) FROM TABLE(INFER_SCHEMA("
+                f"LOCATION => '{stage_path}/{file_name}', FILE_FORMAT => '{SNOWFLAKE_FILE_FORMAT}')))"
+            )
+
+        self._copy_into(table_name, stage_path, file_name)
+
+    def merge_batch(self, table_name, parquet_path, keys):
+        """
+        Upserts a Parquet batch into an existing table by key columns: the file is
+        copied into a temporary table and MERGEd into the target. Matching rows
+        whose values haven't changed are left alone. Returns (inserted, updated)
+        row counts as reported by MERGE.
+        """
+        columns = pq.read_schema(parquet_path).names
+        changes_table = f"{table_name}_CHANGES"
+        stage_path, file_name = self._put(changes_table, parquet_path)
+
+        self.cursor.execute(f'CREATE OR REPLACE TEMPORARY TABLE "{changes_table}" LIKE "{table_name}"')
+        self._copy_into(changes_table, stage_path, file_name)
+
+        match = ' AND '.join(f'target."{k}" = changes."{k}"' for k in keys)
+        updates = ', '.join(f'target."{c}" = changes."{c}"' for c in columns if c not in keys)
+        changed = ' OR '.join(f'target."{c}" IS DISTINCT FROM changes."{c}"' for c in columns if c not in keys)
+        insert_cols = ', '.join(f'"{c}"' for c in columns)
+        insert_values = ', '.join(f'changes."{c}"' for c in columns)
+
+        merge_sql = f'MERGE INTO "{table_name}" target USING "{changes_table}" changes ON {match} '
+        if updates:
+            merge_sql += f"WHEN MATCHED AND ({changed}) THEN UPDATE SET {updates} "
+        merge_sql += f"WHEN NOT MATCHED THEN INSERT ({insert_cols}) VALUES ({insert_values})"
+        self.cursor.execute(merge_sql)
+
+        # MERGE returns one row: (rows inserted, rows updated), without the
+        # second column when there is no WHEN MATCHED clause
+        result = self.cursor.fetchone()
+        inserted = result[0]
+        updated = result[1] if updates else 0
+        return inserted, updated
+
+    def replace_partitions(self, table_name, parquet_path, column, values):
+        """
+        Replaces the rows whose partition column is one of values with the rows
+        of a Parquet batch, in one transaction. Creates the table if it is missing.
+        """
+        if self.count_rows(table_name) is None:
+            self.write_batch(table_name, parquet_path, overwrite=True)
+            return
+        stage_path, file_name = self._put(table_name, parquet_path)
+        self.cursor.execute("BEGIN")
+        try:
+            if values:
+                placeholders = ', '.join(['%s'] * len(values))
+                self.cursor.execute(f'DELETE FROM "{table_name}" WHERE "{column}" IN ({placeholders})', list(values))
+            self._copy_into(table_name, stage_path, file_name)
+            self.cursor.execute("COMMIT")
+        except Exception:
+            self.cursor.execute("ROLLBACK")
+            raise
+
+    def count_rows(self, table_name):
+        """Returns the number of rows in a target table, or None if it doesn't exist."""
+        try:
+            self.cursor.execute(f'SELECT COUNT(*) FROM "{table_name}"')
+        except Exception:
+            return None
+        return self.cursor.fetchone()[0]
+
+    def close(self):
+        self.cursor.close()
+        if self.owns_connection:
+            self.conn.close()
+
+
+class LocalParquetSink:
+    """
+    Keeps the staged Parquet batches in a local directory, one folder per table.
+    Useful for testing the pipeline without a warehouse.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def write_batch(self, table_name, parquet_path, overwrite=False):
+        table_dir = os.path.join(self.output_dir, table_name)
+        if overwrite:
+            shutil.rmtree(table_dir, ignore_errors=True)
+        os.makedirs(table_dir, exist_ok=True)
+
+        part_number = len(os.listdir(table_dir))
+        shutil.copyfile(parquet_path, os.path.join(table_dir, f"part-{part_number:05d}.parquet"))
+
+    def merge_batch(self, table_name, parquet_path, keys):
+        """
+        Upserts a batch by key columns. The table's files are rewritten as a
+        single part, which is fine for the test-sized data this sink is for.
+        """
+        table_dir = os.path.join(self.output_dir, table_name)
+        changes = pd.read_parquet(parquet_path)
+        existing = pd.read_parquet(table_dir)
+
+        existing_keys = pd.MultiIndex.from_frame(existing[keys])
+        changed_keys = pd.MultiIndex.from_frame(changes[keys])
+        updated = int(changed_keys.isin(existing_keys).sum())
+
+        merged = pd.concat([existing[~existing_keys.isin(changed_keys)], changes], ignore_index=True)
+        merged_path = os.path.join(self.output_dir, f"{table_name}.merged.parquet")
+        merged.to_parquet(merged_path, index=False)
+        shutil.rmtree(table_dir)
+        os.makedirs(table_dir)
+        os.replace(merged_path, os.path.join(table_dir, "part-00000.parquet"))
+        return len(changes) - updated, updated
+
+    def replace_partitions(self, table_name, parquet_path, column, values):
+        """Replaces the rows whose partition column is one of values, rewriting the table as one part."""
+        table_dir = os.path.join(self.output_dir, table_name)
+        if not os.path.isdir(table_dir):
+            self.write_batch(table_name, parquet_path, overwrite=True)
+            return
+        existing = pd.read_parquet(table_dir)
+        merged = pd.concat([existing[~existing[column].isin(values)], pd.read_parquet(parquet_path)],
+                           ignore_index=True)
+        merged_path = os.path.join(self.output_dir, f"{table_name}.merged.parquet")
+        merged.to_parquet(merged_path, index=False)
+        shutil.rmtree(table_dir)
+        os.makedirs(table_dir)
+        os.replace(merged_path, os.path.join(table_dir, "part-00000.parquet"))
+
+    def count_rows(self, table_name):
+        """Returns the number of rows in a table's files, or None if it has none."""
+        table_dir = os.path.join(self.output_dir, table_name)
+        if not os.path.isdir(table_dir):
+            return None
+        return sum(pq.ParquetFile(os.path.join(table_dir, name)).metadata.num_rows
+                   for name in os.listdir(table_dir) if name.endswith('.parquet'))
+
+    def close(self):
+        pass
+
+
+class SQLiteSink:
+    """
+    Appends staged Parquet batches to a local SQLite database.
+    Stands in for Snowflake when testing the pipeline offline.
+    """
+
+    def __init__(self, database_path):
+        self.conn = sqlite3.connect(database_path)
+
+    def write_batch(self, table_name, parquet_path, overwrite=False):
+        df = pd.read_parquet(parquet_path)
+        df.to_sql(table_name, self.conn, if_exists='replace' if overwrite else 'append', index=False)
+        self.conn.commit()
+
+    def merge_batch(self, table_name, parquet_path, keys):
+        """Upserts a batch by key columns. Returns (inserted, updated) row counts."""
+        df = pd.read_parquet(parquet_path)
+        changes_table = f"{table_name}_changes"
+        df.to_sql(changes_table, self.conn, if_exists='replace', index=False)
+        counts = merge_changes(self.conn, table_name, changes_table, keys, list(df.columns))
+        self.conn.commit()
+        return counts
+
+    def replace_partitions(self, table_name, parquet_path, column, values):
+        """Replaces the rows whose partition column is one of values with the rows of a batch."""
+        df = pd.read_parquet(parquet_path)
+        if self.count_rows(table_name) is not None:
+            delete_partitions(self.conn, table_name, column, values)
+        df.to_sql(table_name, self.conn, if_exists='append', index=False)
+        self.conn.commit()
+
+    def count_rows(self, table_name):
+        """Returns the number of rows in a target table, or None if it doesn't exist."""
+        try:
+            return self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        except sqlite3.OperationalError:
+            return None
+
+    def close(self):
+        self.conn.close()
+
+
+class DuckDBSink:
+    """
+    Appends staged Parquet batches to a local DuckDB database, which reads
+    the Parquet files directly. Requires the optional duckdb package.
+    """
+
+    def __init__(self, database_path):
+        import duckdb  # Only needed when this sink is used
+        self.conn = duckdb.connect(database_path)
+
+    def write_batch(self, table_name, parquet_path, overwrite=False):
+        if overwrite:
+            self.conn.execute(f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM read_parquet(?)',
+                              [parquet_path])
+        else:
+            self.conn.execute(f'INSERT INTO "{table_name}" BY NAME SELECT * FROM read_parquet(?)', [parquet_path])
+
+    def merge_batch(self, table_name, parquet_path, keys):
+        """Upserts a batch by key columns. Returns (inserted, updated) row counts."""
+        changes_table = f"{table_name}_changes"
+        self.conn.execute(f'CREATE OR REPLACE TEMP TABLE "{changes_table}" AS SELECT * FROM read_parquet(?)',
+                          [parquet_path])
+        columns = pq.read_schema(parquet_path).names
+        return merge_changes(self.conn, table_name, changes_table, keys, columns)
+
+    def replace_partitions(self, table_name, parquet_path, column, values):
+        """Replaces the rows whose partition column is one of values with the rows of a batch."""
+        if self.count_rows(table_name) is None:
+            self.write_batch(table_name, parquet_path, overwrite=True)
+            return
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            delete_partitions(self.conn, table_name, column, values)
+            self.write_batch(table_name, parquet_path)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def count_rows(self, table_name):
+        """Returns the number of rows in a target table, or None if it doesn't exist."""
+        import duckdb
+        try:
+            return self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        except duckdb.CatalogException:
+            return None
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,188 @@
+# feature_store.py
+import os
+import shutil
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import query_cache
+from sqlalchemy import create_engine
+import warnings
+
+# Suppress the UserWarning from pandas
+warnings.filterwarnings("ignore", category=UserWarning)
+
+# --- CONFIGURATION: FILL IN YOUR SNOWFLAKE DETAILS ---
+SNOWFLAKE_ACCOUNT = 'fac88810.us-east-1'  # <-- CHANGE THIS
+SNOWFLAKE_USER = 'ETL_USER'
+SNOWFLAKE_PASSWORD = 'Ha0ieidheb#rl9'  # <-- CHANGE THIS
+SNOWFLAKE_DB = 'OLIST_DB'
+SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
+SNOWFLAKE_SCHEMA = 'PUBLIC'
+
+# --- FEATURE STORE SETTINGS ---
+# Snapshots live in FEATURE_STORE_DIR/<TABLE>/v<timestamp>/ as (optionally Hive-partitioned)
+# Parquet files. FEATURE_STORE_DIR/<TABLE>/CURRENT names the version readers should use.
+FEATURE_STORE_DIR = 'feature_store'
+KEEP_VERSIONS = 3  # Older snapshots are deleted after a refresh
+SNAPSHOT_CHUNK_SIZE = 200000  # Rows fetched and written per Parquet file
+
+# Tables materialized by the refresh job, with the columns their files are partitioned by
+FEATURE_TABLES = {
+    'CUSTOMER_CHURN_FEATURES': {
+        'query': 'SELECT * FROM CUSTOMER_CHURN_FEATURES',
+        # Not partitioned by churn: streaming training reads the files in order and
+        # needs both classes mixed within each chunk
+        'partition_cols': [],
+    },
+    'PRODUCTS': {
+        'query': 'SELECT * FROM "PRODUCTS"',
+        'partition_cols': ['product_category_name'],
+    },
+    'ORDER_ITEMS': {
+        'query': 'SELECT * FROM "ORDER_ITEMS"',
+        'partition_cols': [],
+    },
+}
+
+
+def current_version(table_name, root=FEATURE_STORE_DIR):
+    """Returns the published snapshot version of a table, or None if it has none."""
+    pointer = os.path.join(root, table_name, 'CURRENT')
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip()
+
+
+def has_snapshot(table_name, root=FEATURE_STORE_DIR):
+    return current_version(table_name, root) is not None
+
+
+def read_table(table_name, columns=None, filters=None, version=None, root=FEATURE_STORE_DIR):
+    """
+    Loads a snapshot from local disk through memory-mapped Parquet files.
+    Only the requested columns are decoded (projection), and partitions and row
+    groups that can't match the filters are skipped (predicate pushdown).
+    Filters use the pyarrow form, e.g. [('churn', '=', 1)].
+    """
+    version = version or current_version(table_name, root)
+    if version is None:
+        raise FileNotFoundError(f"No feature store snapshot of '{table_name}' in '{root}'.")
+
+    # Partition values are read back as plain columns (not dictionaries), so
+    # null partitions such as uncategorized products come back as missing values
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=False)
+    table = pq.read_table(os.path.join(root, table_name, version), columns=columns, filters=filters,
+                          memory_map=True, partitioning=partitioning)
+    return table.to_pandas()
+
+
+def iter_batches(table_name, columns=None, batch_size=SNAPSHOT_CHUNK_SIZE, version=None, root=FEATURE_STORE_DIR):
+    """
+    Streams a snapshot as DataFrames of at most batch_size rows, so a reader's
+    memory is bounded by the batch rather than the table.
+    """
+    version = version or current_version(table_name, root)
+    if version is None:
+        raise FileNotFoundError(f"No feature store snapshot of '{table_name}' in '{root}'.")
+
+    partitioning = ds.HivePartitioning.discover(infer_dictionary=False)
+    dataset = ds.dataset(os.path.join(root, table_name, version), format='parquet', partitioning=partitioning)
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def write_snapshot(table_name, chunks, partition_cols=(), root=FEATURE_STORE_DIR):
+    """
+    Writes an iterable of DataFrame chunks as a new snapshot version of a table,
+    then publishes it by rewriting the CURRENT pointer, so readers switch over
+    only once the snapshot is complete. Returns the version and row count.
+    """
+    version = datetime.now().strftime('v%Y%m%dT%H%M%S%f')
+    version_dir = os.path.join(root, table_name, version)
+
+    total_rows = 0
+    schema = None
+    for part_number, chunk in enumerate(chunks):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        # Later chunks take the first chunk's types so all files share one schema
+        schema = schema or table.schema
+        table = table.cast(schema)
+
+        pq.write_to_dataset(table, version_dir, partition_cols=list(partition_cols) or None,
+                            basename_template=f"part-{part_number:05d}-{{i}}.parquet", compression='snappy')
+        total_rows += len(chunk)
+
+    if total_rows == 0:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        return None, 0
+
+    pointer = os.path.join(root, table_name, 'CURRENT')
+    with open(f"{pointer}.tmp", 'w') as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    prune_versions(table_name, root=root)
+    return version, total_rows
+
+
+def prune_versions(table_name, keep=KEEP_VERSIONS, root=FEATURE_STORE_DIR):
+    """Deletes all but the newest `keep` snapshot versions, never the current one."""
+    table_dir = os.path.join(root, table_name)
+    current = current_version(table_name, root)
+    versions = sorted(name for name in os.listdir(table_dir) if name.startswith('v'))
+    for version in versions[:-keep]:
+        if version != current:
+            shutil.rmtree(os.path.join(table_dir, version), ignore_errors=True)
+
+
+def materialize_table(engine, table_name, root=FEATURE_STORE_DIR, chunksize=SNAPSHOT_CHUNK_SIZE):
+    """Streams one warehouse table into a new feature store snapshot."""
+    config = FEATURE_TABLES[table_name]
+    chunks = pd.read_sql(config['query'], engine, chunksize=chunksize)
+    return write_snapshot(table_name, chunks, config['partition_cols'], root)
+
+
+def refresh_feature_store():
+    """
+    Main function of the refresh job: the only step that pays the warehouse
+    round-trip. Training scripts and app replicas then read the local snapshots.
+    """
+    snowflake_engine = None
+    try:
+        # --- Create a SQLAlchemy Engine for Snowflake ---
+        print("Creating Snowflake SQLAlchemy engine...")
+        connection_url = (
+            f"snowflake://{SNOWFLAKE_USER}:{SNOWFLAKE_PASSWORD}@{SNOWFLAKE_ACCOUNT}/"
+            f"{SNOWFLAKE_DB}/{SNOWFLAKE_SCHEMA}?warehouse={SNOWFLAKE_WAREHOUSE}"
+        )
+        snowflake_engine = create_engine(connection_url)
+        print("Snowflake engine created successfully.")
+
+        for table_name in FEATURE_TABLES:
+            print(f"\nMaterializing '{table_name}'...")
+            version, total_rows = materialize_table(snowflake_engine, table_name)
+            if version:
+                print(f"  Published {total_rows} rows as version {version}.")
+            else:
+                print(f"  '{table_name}' returned no rows; keeping the previous snapshot.")
+
+        data_version = query_cache.publish_data_version()
+        print(f"\nPublished data version {data_version}; cached app queries are now stale.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if snowflake_engine:
+            snowflake_engine.dispose()
+            print("\nSnowflake engine connection closed.")
+
+
+if __name__ == '__main__':
+    print("--- Starting Feature Store Refresh ---")
+    refresh_feature_store()
+    print("\n--- Feature Store Refresh Complete! ---")
@@ -0,0 +1,258 @@
+# incremental_features.py
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import feature_store
+import query_cache
+from build_features import (
+    CHURN_THRESHOLD_DAYS, DATA_DIR, ORDERS_FILE, CUSTOMERS_FILE, PAYMENTS_FILE, ORDER_ITEMS_FILE,
+    data_path, read_orders, read_customers, read_payments, read_order_items,
+    join_customers, value_orders, aggregate_customers, finalize_rfm, default_snapshot_date, build_rfm_features,
+)
+
+# --- INCREMENTAL SETTINGS ---
+STORE_DIR = 'rfm_accumulators'  # Per-customer running aggregates kept between runs
+DELTA_DIR = 'new_orders'  # Olist-format CSVs holding only the orders that arrived since the last run
+CHANGED_CUSTOMERS_PATH = 'changed_customers.parquet'  # Customers to rescore after an update
+CHECK_SPLIT_FRACTION = 0.9  # Share of orders (by purchase time) in the base build of the self-check
+# 'update' applies the orders in DELTA_DIR; 'check' verifies incremental updates against a full recompute
+RUN_MODE = 'update'
+STORE_VERSION = 1
+
+
+class RFMStore:
+    """
+    Running RFM aggregates for every customer, held as parallel arrays sorted by
+    customer_unique_id: the last purchase time, the order count and the total
+    spend. A batch of new orders only touches the customers in it. The sorted ids
+    of the orders already counted are kept too, so re-applying a batch that
+    overlaps an earlier one doesn't count its orders twice.
+    """
+
+    def __init__(self, customer_ids, last_purchase, frequency, monetary_value, order_ids, snapshot_date):
+        self.customer_ids = np.array(customer_ids, dtype=bytes)
+        self.last_purchase = np.array(last_purchase, dtype='datetime64[ns]')
+        self.frequency = np.array(frequency, dtype=np.int64)
+        self.monetary_value = np.array(monetary_value, dtype=np.float64)
+        self.order_ids = np.array(order_ids, dtype=bytes)
+        self.snapshot_date = pd.Timestamp(snapshot_date)
+
+    @classmethod
+    def from_facts(cls, facts):
+        """Creates the store from the full purchase history (value_orders() output)."""
+        store = cls([], [], [], [], [], default_snapshot_date(facts['order_purchase_timestamp'].max()))
+        store.apply(facts)
+        return store
+
+    def __len__(self):
+        return len(self.customer_ids)
+
+    def apply(self, facts):
+        """
+        Folds a batch of new purchases (value_orders() output) into the accumulators.
+        The snapshot date moves to the day after the latest purchase seen.
+        Returns (updated_rows, changed_ids): the refreshed feature rows and ids of
+        every customer whose frequency or monetary value changed, or whose churn
+        label flipped because the snapshot date moved past their last purchase.
+        """
+        old_snapshot = self.snapshot_date
+        new_order_ids = np.char.encode(facts['order_id'].to_numpy(dtype=str), 'utf-8')
+        unseen = ~np.isin(new_order_ids, self.order_ids)
+        facts = facts[unseen]
+        self.order_ids = np.union1d(self.order_ids, new_order_ids[unseen])
+
+        delta = aggregate_customers(facts)
+        delta.index = delta.index.astype(str)
+        delta = delta.sort_index()
+        if delta.empty:
+            return self.features(np.array([], dtype=bytes)), []
+
+        delta_ids = np.char.encode(delta.index.to_numpy(dtype=str), 'utf-8')
+        positions = np.searchsorted(self.customer_ids, delta_ids)
+        existing = np.zeros(len(delta_ids), dtype=bool)
+        in_range = positions < len(self.customer_ids)
+        existing[in_range] = self.customer_ids[positions[in_range]] == delta_ids[in_range]
+
+        # Existing customers: max of last purchase, sums of count and spend
+        rows = positions[existing]
+        self.last_purchase[rows] = np.maximum(self.last_purchase[rows],
+                                              delta['last_purchase'].to_numpy()[existing])
+        self.frequency[rows] += delta['frequency'].to_numpy()[existing]
+        self.monetary_value[rows] += delta['monetary_value'].to_numpy()[existing]
+
+        # New customers: insert at their sorted positions
+        new = ~existing
+        if new.any():
+            insert_at = positions[new]
+            # Widen the fixed-width id type first if a new id is longer than all stored ones
+            id_type = np.promote_types(self.customer_ids.dtype, delta_ids.dtype)
+            self.customer_ids = np.insert(self.customer_ids.astype(id_type), insert_at, delta_ids[new])
+            self.last_purchase = np.insert(self.last_purchase, insert_at, delta['last_purchase'].to_numpy()[new])
+            self.frequency = np.insert(self.frequency, insert_at, delta['frequency'].to_numpy()[new])
+            self.monetary_value = np.insert(self.monetary_value, insert_at, delta['monetary_value'].to_numpy()[new])
+
+        self.snapshot_date = max(self.snapshot_date, default_snapshot_date(delta['last_purchase'].max()))
+        changed = np.union1d(delta_ids, self.churn_crossings(old_snapshot, self.snapshot_date))
+        return self.features(changed), [pid.decode('utf-8') for pid in changed]
+
+    def churn_crossings(self, old_snapshot, new_snapshot):
+        """
+        Ids of customers whose churn label flips to 1 only because the snapshot
+        date moved from old_snapshot to new_snapshot: their last purchase is old
+        enough now but wasn't before.
+        """
+        # recency > CHURN_THRESHOLD_DAYS in whole days <=> the last purchase is at
+        # least CHURN_THRESHOLD_DAYS + 1 days before the snapshot date
+        threshold = np.timedelta64(CHURN_THRESHOLD_DAYS + 1, 'D')
+        old_cutoff = old_snapshot.to_datetime64() - threshold
+        new_cutoff = new_snapshot.to_datetime64() - threshold
+        crossed = (self.last_purchase <= new_cutoff) & (self.last_purchase > old_cutoff)
+        return self.customer_ids[crossed]
+
+    def features(self, customer_ids=None):
+        """Returns CUSTOMER_CHURN_FEATURES rows for the given ids (all customers if None)."""
+        if customer_ids is None:
+            rows = np.arange(len(self.customer_ids))
+        else:
+            rows = np.searchsorted(self.customer_ids, np.asarray(customer_ids, dtype=bytes))
+        aggregates = pd.DataFrame({
+            'last_purchase': pd.to_datetime(self.last_purchase[rows]),
+            'frequency': self.frequency[rows],
+            'monetary_value': self.monetary_value[rows],
+        }, index=pd.Index(np.char.decode(self.customer_ids[rows], 'utf-8').astype(object)))
+        return finalize_rfm(aggregates, self.snapshot_date)
+
+    def save(self, path=STORE_DIR):
+        """Writes the arrays to a temporary directory and swaps it in when complete."""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'customer_ids.npy'), self.customer_ids)
+        np.save(os.path.join(tmp_path, 'last_purchase.npy'), self.last_purchase)
+        np.save(os.path.join(tmp_path, 'frequency.npy'), self.frequency)
+        np.save(os.path.join(tmp_path, 'monetary_value.npy'), self.monetary_value)
+        np.save(os.path.join(tmp_path, 'order_ids.npy'), self.order_ids)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump({'version': STORE_VERSION, 'customers': len(self),
+                       'snapshot_date': self.snapshot_date.isoformat()}, f)
+
+        old_path = f"{path}.old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path=STORE_DIR):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported RFM store version {meta['version']}.")
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"))
+                  for name in ('customer_ids', 'last_purchase', 'frequency', 'monetary_value', 'order_ids')}
+        return cls(snapshot_date=meta['snapshot_date'], **arrays)
+
+
+def read_delta_facts(data_dir):
+    """Reads a batch of new orders (Olist-format CSVs) and values them."""
+    orders = read_orders(data_path(ORDERS_FILE, data_dir))
+    customers = read_customers(data_path(CUSTOMERS_FILE, data_dir))
+    payments = read_payments(data_path(PAYMENTS_FILE, data_dir))
+    order_items = read_order_items(data_path(ORDER_ITEMS_FILE, data_dir))
+    return value_orders(join_customers(orders, customers), payments, order_items)
+
+
+def initialize_store(data_dir=DATA_DIR, path=STORE_DIR):
+    """Builds the accumulators from the full order history."""
+    store = RFMStore.from_facts(read_delta_facts(data_dir))
+    store.save(path)
+    return store
+
+
+def update_features(delta_dir=DELTA_DIR, path=STORE_DIR, publish=True):
+    """
+    Main function: applies a batch of new orders to the stored accumulators,
+    republishes CUSTOMER_CHURN_FEATURES to the feature store and writes the
+    changed customers' rows to CHANGED_CUSTOMERS_PATH for rescoring.
+    """
+    try:
+        if os.path.exists(path):
+            store = RFMStore.load(path)
+            print(f"Loaded accumulators for {len(store)} customers (snapshot {store.snapshot_date.date()}).")
+        else:
+            print(f"No accumulators in '{path}' yet; building them from '{DATA_DIR}'...")
+            store = initialize_store(DATA_DIR, path)
+            print(f"Built accumulators for {len(store)} customers.")
+
+        facts = read_delta_facts(delta_dir)
+        print(f"Applying {len(facts)} new purchases from '{delta_dir}'...")
+        updated_rows, changed_ids = store.apply(facts)
+        store.save(path)
+        print(f"  {len(changed_ids)} customers changed; snapshot date is now {store.snapshot_date.date()}.")
+
+        updated_rows.to_parquet(CHANGED_CUSTOMERS_PATH, index=False)
+        print(f"  Wrote changed customers to '{CHANGED_CUSTOMERS_PATH}'.")
+
+        if publish:
+            version, total_rows = feature_store.write_snapshot(
+                'CUSTOMER_CHURN_FEATURES', [store.features()],
+                feature_store.FEATURE_TABLES['CUSTOMER_CHURN_FEATURES']['partition_cols'])
+            print(f"  Published features for {total_rows} customers as version {version}.")
+            query_cache.publish_data_version()
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+def check_against_full_recompute(data_dir=DATA_DIR, split_fraction=CHECK_SPLIT_FRACTION):
+    """
+    Builds the accumulators from the earliest orders, applies the rest as one
+    delta, and checks that the result equals a full recompute over all orders.
+    """
+    orders = read_orders(data_path(ORDERS_FILE, data_dir))
+    customers = read_customers(data_path(CUSTOMERS_FILE, data_dir))
+    payments = read_payments(data_path(PAYMENTS_FILE, data_dir))
+    order_items = read_order_items(data_path(ORDER_ITEMS_FILE, data_dir))
+
+    split_time = orders['order_purchase_timestamp'].quantile(split_fraction)
+    base_facts = value_orders(join_customers(orders[orders['order_purchase_timestamp'] <= split_time], customers),
+                              payments, order_items)
+    delta_facts = value_orders(join_customers(orders[orders['order_purchase_timestamp'] > split_time], customers),
+                               payments, order_items)
+
+    store = RFMStore.from_facts(base_facts)
+    before = store.features().set_index('customer_unique_id')
+    updated_rows, changed_ids = store.apply(delta_facts)
+
+    incremental = store.features().set_index('customer_unique_id').sort_index()
+    full = build_rfm_features(orders, customers, payments, order_items).set_index('customer_unique_id').sort_index()
+    print(f"Base build: {len(before)} customers; delta: {len(delta_facts)} purchases, {len(changed_ids)} changed.")
+
+    same_features = incremental.index.equals(full.index) and np.allclose(
+        incremental['monetary_value'], full['monetary_value']) and incremental[
+        ['recency', 'frequency', 'churn']].equals(full[['recency', 'frequency', 'churn']])
+    print(f"  Incremental features match full recompute: {same_features}")
+
+    # Every customer whose frequency, spend or churn label differs must be reported
+    after = incremental.reindex(before.index)
+    moved = before.index[(after['frequency'] != before['frequency'])
+                         | ~np.isclose(after['monetary_value'], before['monetary_value'])
+                         | (after['churn'] != before['churn'])]
+    new_customers = incremental.index.difference(before.index)
+    complete = set(moved).union(new_customers) <= set(changed_ids)
+    print(f"  Changed-customer list covers every affected customer: {complete}")
+    return same_features and complete
+
+
+if __name__ == '__main__':
+    if RUN_MODE == 'check':
+        print("--- Checking Incremental RFM Against a Full Recompute ---")
+        check_against_full_recompute()
+        print("\n--- Incremental RFM Check Complete! ---")
+    else:
+        print("--- Starting Incremental RFM Update ---")
+        update_features()
+        print("\n--- Incremental RFM Update Complete! ---")
@@ -0,0 +1,356 @@
+# inference_service.py
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import joblib
+import numpy as np
+import pandas as pd
+import feature_store
+from recommender_store import Recommender
+from score_churn_batch import FEATURE_COLUMNS, get_model_version
+
+# --- CONFIGURATION: FILL IN YOUR SNOWFLAKE DETAILS ---
+SNOWFLAKE_ACCOUNT = 'fac88810.us-east-1'  # <-- CHANGE THIS
+SNOWFLAKE_USER = 'ETL_USER'
+SNOWFLAKE_PASSWORD = 'Ha0ieidheb#rl9'  # <-- CHANGE THIS
+SNOWFLAKE_DB = 'OLIST_DB'
+SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
+SNOWFLAKE_SCHEMA = 'PUBLIC'
+# Any SQLAlchemy URL to read the features from instead of Snowflake, for local runs
+SERVICE_DATABASE_URL = os.environ.get('SERVICE_DATABASE_URL')
+
+# --- SERVICE SETTINGS ---
+SERVICE_HOST = os.environ.get('SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.environ.get('SERVICE_PORT', '8080'))
+CHURN_MODEL_PATH = 'churn_model.pkl'
+RECOMMENDER_MODEL_DIR = 'recommender_model'
+DEFAULT_RECOMMENDATIONS = 5  # k when a /recommendations request doesn't give one
+MAX_IDS_PER_REQUEST = 1000  # Larger requests are rejected with 413
+MAX_BODY_BYTES = 1024 * 1024
+
+# --- MICRO-BATCHING ---
+# Concurrent /churn requests are scored together in one predict_proba call.
+# A batch is closed when it holds MAX_BATCH_SIZE customers or MAX_BATCH_WAIT_MS
+# after its first request arrived, whichever comes first.
+MAX_BATCH_SIZE = 512
+MAX_BATCH_WAIT_MS = 2
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def load_customer_features():
+    """
+    Loads the customer features once at startup, from the local feature store
+    snapshot or, if there is none, from the database. Returns a frame of
+    FEATURE_COLUMNS indexed by customer_unique_id.
+    """
+    columns = ['customer_unique_id'] + FEATURE_COLUMNS
+    if feature_store.has_snapshot('CUSTOMER_CHURN_FEATURES'):
+        customers = feature_store.read_table('CUSTOMER_CHURN_FEATURES', columns=columns)
+    else:
+        from sqlalchemy import create_engine
+        connection_url = SERVICE_DATABASE_URL or (
+            f"snowflake://{SNOWFLAKE_USER}:{SNOWFLAKE_PASSWORD}@{SNOWFLAKE_ACCOUNT}/"
+            f"{SNOWFLAKE_DB}/{SNOWFLAKE_SCHEMA}?warehouse={SNOWFLAKE_WAREHOUSE}"
+        )
+        engine = create_engine(connection_url)
+        try:
+            customers = pd.read_sql(
+                'SELECT "customer_unique_id", "FREQUENCY", "MONETARY_VALUE" FROM CUSTOMER_CHURN_FEATURES', engine)
+        finally:
+            engine.dispose()
+        customers.columns = [col.lower() for col in customers.columns]
+    customers = customers.drop_duplicates('customer_unique_id').set_index('customer_unique_id')
+    return customers[FEATURE_COLUMNS].astype(np.float64)
+
+
+class MicroBatcher:
+    """
+    Groups concurrent scoring requests into batches. Each submit() queues one
+    request's feature rows and waits; a single background task concatenates the
+    queued rows, scores them with one call to score_fn on a worker thread (so the
+    event loop keeps accepting requests meanwhile) and hands every request back
+    its own slice of the result.
+    """
+
+    def __init__(self, score_fn, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_BATCH_WAIT_MS):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.task = None
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, features):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future))
+        return await future
+
+    async def _collect(self):
+        """Waits for a first request, then gathers more until the batch is full or its wait is up."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        # Requests that queued up while the previous batch was scored ride along too
+        while size < self.max_batch_size and not self.queue.empty():
+            item = self.queue.get_nowait()
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            features = np.concatenate([rows for rows, _ in batch])
+            try:
+                scores = await loop.run_in_executor(self.executor, self.score_fn, features)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(features)
+
+            offset = 0
+            for rows, future in batch:
+                if not future.done():  # The client may have gone away
+                    future.set_result(scores[offset:offset + len(rows)])
+                offset += len(rows)
+
+
+class InferenceService:
+    """
+    Serves the churn model and the recommender over HTTP/1.1 with keep-alive:
+      POST /churn            {"customer_ids": [...]}
+      POST /recommendations  {"product_ids": [...], "k": 5, "fallback": true}
+      GET  /health
+    The model, the customer features and the recommender are loaded once when
+    the service is created.
+    """
+
+    def __init__(self, model_path=CHURN_MODEL_PATH, recommender_dir=RECOMMENDER_MODEL_DIR, customers=None):
+        self.model = joblib.load(model_path)
+        self.model_version = get_model_version(model_path)
+        self.customers = load_customer_features() if customers is None else customers
+        self.customer_index = self.customers.index
+        self.customer_features = np.ascontiguousarray(self.customers.to_numpy(dtype=np.float64))
+        self.recommender = Recommender(recommender_dir)
+        self.batcher = MicroBatcher(self.score)
+        self.requests = 0
+
+    def score(self, features):
+        # Columns are in FEATURE_COLUMNS order; naming them as in training lets
+        # sklearn check them against the model instead of warning on every batch
+        return self.model.predict_proba(pd.DataFrame(features, columns=FEATURE_COLUMNS, copy=False))[:, 1]
+
+    async def churn(self, payload):
+        customer_ids = id_list(payload, 'customer_ids')
+        codes = self.customer_index.get_indexer(customer_ids)
+        known = codes >= 0
+
+        probabilities = np.full(len(customer_ids), np.nan)
+        if known.any():
+            probabilities[known] = await self.batcher.submit(self.customer_features[codes[known]])
+
+        predictions = []
+        for customer_id, is_known, probability in zip(customer_ids, known, probabilities):
+            if is_known:
+                predictions.append({'customer_unique_id': customer_id,
+                                    'churn_probability': round(float(probability), 6),
+                                    'churn_prediction': int(probability > 0.5)})
+        return {
+            'model_version': self.model_version,
+            'predictions': predictions,
+            'unknown_customer_ids': [cid for cid, is_known in zip(customer_ids, known) if not is_known],
+        }
+
+    async def recommendations(self, payload):
+        product_ids = id_list(payload, 'product_ids')
+        k = payload.get('k', DEFAULT_RECOMMENDATIONS)
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'k' must be a positive integer.")
+        # Products with fewer than k co-purchase recommendations are topped up with popular ones
+        fallback = payload.get('fallback', True)
+        if not isinstance(fallback, bool):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "'fallback' must be true or false.")
+        return {
+            'recommendations': {pid: self.recommender.recommend(pid, k=k) if fallback else self.recommender.get(pid, k=k)
+                                for pid in product_ids},
+            'unknown_product_ids': [pid for pid in product_ids if pid not in self.recommender],
+        }
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'model_version': self.model_version,
+            'customers': len(self.customer_index),
+            'products': len(self.recommender),
+            'requests': self.requests,
+            'batches': self.batcher.batches,
+            'mean_batch_size': round(self.batcher.rows / max(self.batcher.batches, 1), 2),
+        }
+
+    async def dispatch(self, method, path, body):
+        routes = {'/churn': self.churn, '/recommendations': self.recommendations}
+        if path == '/health':
+            if method != 'GET':
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET.")
+            return self.health()
+        if path not in routes:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No endpoint '{path}'.")
+        if method != 'POST':
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST with a JSON body.")
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "The body must be JSON.")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "The body must be a JSON object.")
+        return await routes[path](payload)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                self.requests += 1
+                try:
+                    status, response = HTTPStatus.OK, await self.dispatch(method, path, body)
+                except HTTPError as e:
+                    status, response = e.status, {'error': e.message}
+                except Exception as e:
+                    status, response = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                write_response(writer, status, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except HTTPError as e:
+            write_response(writer, e.status, {'error': e.message}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT, ready=None):
+        """Runs the HTTP server until cancelled. ready, if given, is set once it accepts connections."""
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port} (customers: {len(self.customer_index)}, "
+              f"products: {len(self.recommender)}, model version: {self.model_version}).")
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.stop()
+
+
+def id_list(payload, field):
+    ids = payload.get(field)
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{field}' must be a list of strings.")
+    if len(ids) > MAX_IDS_PER_REQUEST:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"At most {MAX_IDS_PER_REQUEST} ids per request, got {len(ids)}.")
+    return ids
+
+
+async def read_request(reader):
+    """Reads one HTTP/1.1 request. Returns (method, path, headers, body), or None when the client closed."""
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer.")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Bodies are limited to {MAX_BODY_BYTES} bytes.")
+    body = await reader.readexactly(length) if length else b''
+    return method.upper(), target.split('?', 1)[0], headers, body
+
+
+def write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload).encode('utf-8')
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+
+
+def run_service(host=SERVICE_HOST, port=SERVICE_PORT):
+    """
+    Main function: loads the models and features, then serves requests until
+    interrupted.
+    """
+    try:
+        start_time = time.perf_counter()
+        print("Loading the churn model, customer features and recommender...")
+        service = InferenceService()
+        print(f"Loaded in {time.perf_counter() - start_time:.1f}s.")
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+
+if __name__ == '__main__':
+    print("--- Starting Churn and Recommendation Inference Service ---")
+    run_service()
+    print("\n--- Inference Service Stopped ---")
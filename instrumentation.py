@@ -0,0 +1,256 @@
+# instrumentation.py
+import atexit
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- TRACING SETTINGS ---
+# Every finished span is appended here as one JSON line; set to an empty string to turn the log off
+TRACE_LOG = os.environ.get('PIPELINE_TRACE_LOG', 'pipeline_traces.jsonl')
+TRACE_LOG_MAX_BYTES = 100 * 1024 * 1024  # Above this size the log is moved to <TRACE_LOG>.1 and restarted
+
+# --- PROMETHEUS EXPORTER ---
+# When set, per-stage metrics are written in the Prometheus text format to
+# <METRICS_DIR>/<job>.prom, for node_exporter's textfile collector
+METRICS_DIR = os.environ.get('PIPELINE_METRICS_DIR')
+METRICS_MIN_INTERVAL_SECONDS = 5  # Long-running processes (the app) rewrite the file at most this often
+# Names the job in traces and metrics; defaults to the script's name
+JOB_NAME = os.environ.get('PIPELINE_JOB')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_log_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {}  # Stage path -> aggregates since the process started
+_metrics_written = 0.0
+
+
+def job_name():
+    script = sys.argv[0] if sys.argv else ''
+    if not script or script == '-c':
+        script = 'python'
+    return JOB_NAME or os.path.splitext(os.path.basename(script))[0]
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process so far, or None where the resource module is missing."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Span:
+    """
+    One timed stage of a job. Records wall time, CPU time, how much the stage
+    raised the process's peak RSS, rows processed and any attributes, then
+    writes them out when the block ends. Spans opened inside another span
+    become its children. CPU time and peak RSS are per process, so stages
+    running at the same time in threads share them.
+    """
+
+    def __init__(self, name, attributes=None):
+        parent = _current_span.get()
+        self.name = name
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.rows = None
+        self.phases = {}
+        self.error = None
+
+    def add_rows(self, count):
+        self.rows = (self.rows or 0) + int(count)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        """Marks the span as failed, for errors the code catches and prints instead of raising."""
+        self.error = f"{type(error).__name__}: {error}"
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the wall time of the block to one of the span's phases, for steps repeated per batch."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self._started_at = time.time()
+        self._start_rss = peak_rss_bytes()
+        self._start_cpu = time.process_time()
+        self._start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_seconds = time.perf_counter() - self._start_wall
+        cpu_seconds = time.process_time() - self._start_cpu
+        end_rss = peak_rss_bytes()
+        _current_span.reset(self._token)
+        if exc is not None and self.error is None:
+            self.record_error(exc)
+
+        record = {
+            'timestamp': datetime.fromtimestamp(self._started_at, timezone.utc).isoformat(timespec='milliseconds'),
+            'job': job_name(),
+            'pid': os.getpid(),
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'path': self.path,
+            'status': 'error' if self.error else 'ok',
+            'error': self.error,
+            'wall_seconds': round(wall_seconds, 6),
+            'cpu_seconds': round(cpu_seconds, 6),
+            'peak_rss_bytes': end_rss,
+            'peak_rss_delta_bytes': end_rss - self._start_rss if end_rss is not None else None,
+            'rows': self.rows,
+            'rows_per_second': round(self.rows / wall_seconds, 1) if self.rows and wall_seconds > 0 else None,
+            'phases': {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            'attributes': self.attributes,
+        }
+        write_trace(record)
+        update_metrics(record)
+        if self.parent_id is None:
+            write_metrics()
+        return False
+
+
+def span(name, **attributes):
+    """Context manager timing the block as a stage: `with span('extract', table=name) as s: ...`"""
+    return Span(name, attributes)
+
+
+def traced(name=None, **attributes):
+    """Decorator running every call of a function in a span named after it."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(name or func.__name__, attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The innermost open span in this thread or task, or None."""
+    return _current_span.get()
+
+
+def record_error(error):
+    """Marks the innermost open span as failed (see Span.record_error)."""
+    active = _current_span.get()
+    if active is not None:
+        active.record_error(error)
+
+
+def write_trace(record, path=None):
+    path = TRACE_LOG if path is None else path
+    if not path:
+        return
+    line = json.dumps(record, default=str) + '\n'
+    try:
+        with _log_lock:
+            with open(path, 'a') as f:
+                f.write(line)
+                size = f.tell()
+            if size > TRACE_LOG_MAX_BYTES:
+                os.replace(path, f"{path}.1")
+    except OSError:
+        pass  # Tracing never fails the job it traces
+
+
+# --- PROMETHEUS EXPORTER ---
+
+def update_metrics(record):
+    with _metrics_lock:
+        stage = _metrics.setdefault(record['path'], {
+            'runs': 0, 'errors': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'phases': {}})
+        stage['runs'] += 1
+        stage['errors'] += record['status'] == 'error'
+        stage['wall_seconds'] += record['wall_seconds']
+        stage['cpu_seconds'] += record['cpu_seconds']
+        stage['rows'] += record['rows'] or 0
+        stage['last_wall_seconds'] = record['wall_seconds']
+        stage['last_peak_rss_delta_bytes'] = record['peak_rss_delta_bytes']
+        stage['last_finished'] = time.time()
+        for phase, seconds in record['phases'].items():
+            stage['phases'][phase] = stage['phases'].get(phase, 0.0) + seconds
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metrics(metrics, job):
+    """Renders the stage aggregates in the Prometheus text exposition format."""
+    families = [
+        ('pipeline_stage_runs_total', 'counter', 'Finished runs of the stage.', 'runs'),
+        ('pipeline_stage_errors_total', 'counter', 'Runs of the stage that failed.', 'errors'),
+        ('pipeline_stage_wall_seconds_total', 'counter', 'Wall time spent in the stage.', 'wall_seconds'),
+        ('pipeline_stage_cpu_seconds_total', 'counter', 'Process CPU time spent in the stage.', 'cpu_seconds'),
+        ('pipeline_stage_rows_total', 'counter', 'Rows processed by the stage.', 'rows'),
+        ('pipeline_stage_last_wall_seconds', 'gauge', 'Wall time of the latest run.', 'last_wall_seconds'),
+        ('pipeline_stage_last_peak_rss_delta_bytes', 'gauge',
+         'How much the latest run raised the peak RSS.', 'last_peak_rss_delta_bytes'),
+        ('pipeline_stage_last_finished_timestamp_seconds', 'gauge', 'When the latest run finished.', 'last_finished'),
+    ]
+    lines = []
+    for metric, kind, help_text, key in families:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for path, stage in sorted(metrics.items()):
+            if stage.get(key) is not None:
+                lines.append(f'{metric}{{job="{label_value(job)}",stage="{label_value(path)}"}} {stage[key]}')
+
+    metric = 'pipeline_stage_phase_seconds_total'
+    lines += [f"# HELP {metric} Wall time spent in each phase of the stage.", f"# TYPE {metric} counter"]
+    for path, stage in sorted(metrics.items()):
+        for phase, seconds in sorted(stage['phases'].items()):
+            lines.append(f'{metric}{{job="{label_value(job)}",stage="{label_value(path)}",'
+                         f'phase="{label_value(phase)}"}} {seconds}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(metrics_dir=None, force=False):
+    """
+    Writes this process's stage metrics to <metrics_dir>/<job>.prom, under a
+    temporary name and renamed, so the collector never reads a partial file.
+    """
+    global _metrics_written
+    metrics_dir = metrics_dir or METRICS_DIR
+    if not metrics_dir:
+        return
+    with _metrics_lock:
+        if not force and time.time() - _metrics_written < METRICS_MIN_INTERVAL_SECONDS:
+            return
+        _metrics_written = time.time()
+        text = format_metrics(_metrics, job_name())
+    path = os.path.join(metrics_dir, f"{job_name()}.prom")
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+
+# Writes whatever the interval held back when the process exits
+atexit.register(lambda: write_metrics(force=True))
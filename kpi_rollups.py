@@ -0,0 +1,223 @@
+# kpi_rollups.py
+import json
+import os
+import sqlite3
+from datetime import datetime
+import pandas as pd
+import instrumentation
+from build_features import EXCLUDED_ORDER_STATUSES
+
+# --- ROLLUP SETTINGS ---
+# Daily and monthly sales cubes behind the dashboard's KPI view, by customer state,
+# product category and seller, plus an overall total. They are rebuilt from the
+# source one calendar month at a time: only months holding orders that changed
+# since the last refresh are recomputed and replaced in the target.
+DAILY_TABLE = 'KPI_SALES_DAILY'
+MONTHLY_TABLE = 'KPI_SALES_MONTHLY'
+ROLLUP_STATE_FILE = 'kpi_rollups_state.json'  # Delete to rebuild every month on the next refresh
+STAGING_DIR = 'etl_staging'
+# Dimension name -> column of the order-level facts it groups by; 'total' is the whole business
+ROLLUP_DIMENSIONS = {
+    'total': None,
+    'state': 'customer_state',
+    'category': 'product_category_name',
+    'seller': 'seller_id',
+}
+UNKNOWN_VALUE = 'unknown'  # Stands in for a missing state or category
+# Latest timestamp of an order's lifecycle, as the 'orders' watermark in mysql_to_snowflake.py.
+# Months at the saved mark are refreshed again, as orders may share its timestamp. A
+# status change that sets no timestamp (e.g. a shipped order being canceled) doesn't
+# move it, so its month keeps the old figures until a rebuild (delete ROLLUP_STATE_FILE).
+ORDER_CHANGED_AT = ("COALESCE(o.order_delivered_customer_date, o.order_delivered_carrier_date, "
+                    "o.order_approved_at, o.order_purchase_timestamp)")
+
+
+def param_marker(conn):
+    """Returns the parameter placeholder of the connection's driver."""
+    return '?' if isinstance(conn, sqlite3.Connection) else '%s'
+
+
+def read_query(conn, query, params=()):
+    """Runs a query on a DB-API connection (MySQL or its SQLite stand-in) and returns a DataFrame."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        columns = [col[0] for col in cursor.description]
+        return pd.DataFrame(cursor.fetchall(), columns=columns)
+    finally:
+        cursor.close()
+
+
+def load_state(path=ROLLUP_STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=ROLLUP_STATE_FILE):
+    # Write to a temporary file first so a crash can't leave a half-written state
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_changed_months(conn, watermark):
+    """
+    Returns the months ('YYYY-MM') of the orders that changed at or after
+    watermark (every month when it is None) and the new watermark.
+    """
+    query = (f"SELECT DATE(o.order_purchase_timestamp) AS sales_date, MAX({ORDER_CHANGED_AT}) AS changed_at "
+             f"FROM orders o")
+    params = ()
+    if watermark is not None:
+        query += f" WHERE {ORDER_CHANGED_AT} >= {param_marker(conn)}"
+        params = (watermark,)
+    query += " GROUP BY DATE(o.order_purchase_timestamp)"
+    days = read_query(conn, query, params).dropna(subset=['sales_date'])
+    if days.empty:
+        return [], watermark
+    months = sorted({str(day)[:7] for day in days['sales_date']})
+    new_watermark = str(max(str(value) for value in days['changed_at'].dropna()))
+    return months, new_watermark
+
+
+def read_order_facts(conn, months):
+    """
+    Reads one row per order, seller and category in the given months, with its
+    item count, revenue (item prices) and freight, skipping orders whose status
+    doesn't count as a sale. The grouping is done by the source database, so
+    only a few rows per order are transferred.
+    """
+    marker = param_marker(conn)
+    excluded = ', '.join([marker] * len(EXCLUDED_ORDER_STATUSES))
+    # One range covering the months; those in between that didn't change are filtered out below
+    first_day = f"{months[0]}-01"
+    last_day = (pd.Period(months[-1], freq='M') + 1).start_time.strftime('%Y-%m-%d')
+    query = f"""
+        SELECT i.order_id, DATE(o.order_purchase_timestamp) AS sales_date, c.customer_state,
+               p.product_category_name, i.seller_id,
+               COUNT(*) AS items, SUM(i.price) AS revenue, SUM(i.freight_value) AS freight
+        FROM order_items i
+        JOIN orders o ON o.order_id = i.order_id
+        LEFT JOIN customers c ON c.customer_id = o.customer_id
+        LEFT JOIN products p ON p.product_id = i.product_id
+        WHERE o.order_status NOT IN ({excluded})
+          AND o.order_purchase_timestamp >= {marker} AND o.order_purchase_timestamp < {marker}
+        GROUP BY i.order_id, DATE(o.order_purchase_timestamp), c.customer_state, p.product_category_name, i.seller_id
+    """
+    facts = read_query(conn, query, (*EXCLUDED_ORDER_STATUSES, first_day, last_day))
+    facts['sales_date'] = facts['sales_date'].astype(str)
+    facts['sales_month'] = facts['sales_date'].str[:7]
+    facts = facts[facts['sales_month'].isin(months)]
+    for column in ('customer_state', 'product_category_name'):
+        facts[column] = facts[column].fillna(UNKNOWN_VALUE)
+    for column in ('items', 'revenue', 'freight'):
+        facts[column] = pd.to_numeric(facts[column])  # MySQL returns SUM() of DECIMAL as Decimal
+    return facts
+
+
+def build_cube(facts, period_columns):
+    """
+    Aggregates order facts by period and every dimension in ROLLUP_DIMENSIONS.
+    Orders are counted distinctly, so an order with several sellers or
+    categories counts once in each of them but once in the total.
+    """
+    cubes = []
+    for dimension, column in ROLLUP_DIMENSIONS.items():
+        if column is None:
+            values = pd.Series(dimension, index=facts.index)
+        else:
+            values = facts[column]
+        cube = facts.assign(dimension=dimension, dimension_value=values).groupby(
+            period_columns + ['dimension', 'dimension_value'], sort=True).agg(
+            orders=('order_id', 'nunique'), items=('items', 'sum'),
+            revenue=('revenue', 'sum'), freight=('freight', 'sum')).reset_index()
+        cubes.append(cube)
+    cube = pd.concat(cubes, ignore_index=True)
+    cube['orders'] = cube['orders'].astype('int64')
+    cube['items'] = cube['items'].astype('int64')
+    cube[['revenue', 'freight']] = cube[['revenue', 'freight']].astype('float64').round(2)
+    return cube
+
+
+def write_cube(sink, table_name, cube, months, rebuild):
+    """Replaces the given months of a rollup table, or the whole table on a rebuild."""
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    parquet_path = os.path.join(STAGING_DIR, f"{table_name}.parquet")
+    cube.to_parquet(parquet_path, index=False, compression='snappy')
+    try:
+        if rebuild:
+            sink.write_batch(table_name, parquet_path, overwrite=True)
+        else:
+            sink.replace_partitions(table_name, parquet_path, 'sales_month', months)
+    finally:
+        os.remove(parquet_path)
+
+
+def update_rollups(source_conn, sink, state_path=ROLLUP_STATE_FILE):
+    """
+    Main function: refreshes the daily and monthly KPI cubes in the target for
+    every month with orders that changed since the last refresh (by the
+    latest timestamp of each order's lifecycle), reading from the source
+    connection. The first refresh, or one without a state file, rebuilds the
+    tables in full. Returns the months refreshed.
+    """
+    with instrumentation.span('kpi_rollups') as rollup_span:
+        state = load_state(state_path)
+        watermark = state.get('watermark')
+        rebuild = watermark is None
+
+        with rollup_span.phase('find_changes'):
+            months, new_watermark = find_changed_months(source_conn, watermark)
+        if not months:
+            print("  KPI rollups are up to date.")
+            return []
+        print(f"  Refreshing KPI rollups for {len(months)} month(s): {months[0]} to {months[-1]}...")
+
+        with rollup_span.phase('extract'):
+            facts = read_order_facts(source_conn, months)
+        with rollup_span.phase('aggregate'):
+            daily = build_cube(facts, ['sales_month', 'sales_date'])
+            monthly = build_cube(facts, ['sales_month'])
+        with rollup_span.phase('load'):
+            write_cube(sink, DAILY_TABLE, daily, months, rebuild)
+            write_cube(sink, MONTHLY_TABLE, monthly, months, rebuild)
+        rollup_span.add_rows(len(facts))
+        rollup_span.set(months=len(months), rebuild=rebuild)
+
+        # Only move the mark once both tables hold the new months
+        save_state({'watermark': new_watermark, 'refreshed_at': datetime.now().isoformat(sep=' ')}, state_path)
+        print(f"  Wrote {len(daily)} daily and {len(monthly)} monthly rollup rows from {len(facts)} order facts.")
+    return months
+
+
+if __name__ == '__main__':
+    import mysql.connector
+    import mysql_to_snowflake as etl
+
+    print("--- Refreshing KPI Rollups ---")
+    mysql_conn = None
+    sink = None
+    try:
+        mysql_conn = mysql.connector.connect(
+            host=etl.MYSQL_HOST,
+            user=etl.MYSQL_USER,
+            password=etl.MYSQL_PASSWORD,
+            database=etl.MYSQL_DB
+        )
+        sink = etl.create_snowflake_sink()
+        if update_rollups(mysql_conn, sink):
+            import query_cache
+            version = query_cache.publish_data_version()
+            print(f"Published data version {version}; cached app queries are now stale.")
+        print("\n--- KPI Rollups Complete! ---")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        instrumentation.record_error(e)
+    finally:
+        if sink:
+            sink.close()
+        if mysql_conn:
+            mysql_conn.close()
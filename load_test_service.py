@@ -0,0 +1,149 @@
+# load_test_service.py
+import asyncio
+import json
+import multiprocessing
+import time
+import numpy as np
+import feature_store
+from inference_service import SERVICE_HOST, SERVICE_PORT, RECOMMENDER_MODEL_DIR, run_service
+from recommender_store import Recommender
+
+# --- LOAD TEST SETTINGS ---
+START_SERVICE = True  # Start inference_service.py in a child process; False to test one already running
+CONCURRENCY = 32  # Clients sending requests at the same time, each over one keep-alive connection
+DURATION_SECONDS = 10
+IDS_PER_REQUEST = 10  # Customer or product ids per request
+CHURN_SHARE = 0.5  # Share of requests sent to /churn; the rest go to /recommendations
+STARTUP_TIMEOUT_SECONDS = 120
+SEED = 42
+
+
+def sample_ids():
+    """Picks the ids to request from the same feature snapshot and recommender the service loads."""
+    customer_ids = []
+    if feature_store.has_snapshot('CUSTOMER_CHURN_FEATURES'):
+        table = feature_store.read_table('CUSTOMER_CHURN_FEATURES', columns=['customer_unique_id'])
+        customer_ids = table['customer_unique_id'].astype(str).tolist()
+    product_ids = [pid.decode('utf-8') for pid in Recommender(RECOMMENDER_MODEL_DIR).product_ids]
+    if not customer_ids:
+        print("  No local feature snapshot; /churn requests will use made-up customer ids.")
+        customer_ids = [f"{i:032x}" for i in range(10000)]
+    return customer_ids, product_ids
+
+
+async def post(reader, writer, path, payload):
+    body = json.dumps(payload).encode('utf-8')
+    writer.write((f"POST {path} HTTP/1.1\r\nHost: {SERVICE_HOST}\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(body)}\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+    return await read_response(reader)
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def get(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode('latin-1'))
+        await writer.drain()
+        return await read_response(reader)
+    finally:
+        writer.close()
+
+
+async def client(host, port, customer_ids, product_ids, deadline, rng, results):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            if rng.random() < CHURN_SHARE:
+                path = '/churn'
+                payload = {'customer_ids': [customer_ids[i] for i in rng.integers(0, len(customer_ids), IDS_PER_REQUEST)]}
+            else:
+                path = '/recommendations'
+                payload = {'product_ids': [product_ids[i] for i in rng.integers(0, len(product_ids), IDS_PER_REQUEST)]}
+            start = time.perf_counter()
+            status, _ = await post(reader, writer, path, payload)
+            results.append((path, time.perf_counter() - start, status))
+    finally:
+        writer.close()
+
+
+async def run_clients(host, port, customer_ids, product_ids):
+    results = []
+    deadline = time.perf_counter() + DURATION_SECONDS
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(host, port, customer_ids, product_ids, deadline, np.random.default_rng(SEED + i), results)
+        for i in range(CONCURRENCY)
+    ))
+    elapsed = time.perf_counter() - start
+    _, health = await get(host, port, '/health')
+    return results, elapsed, health
+
+
+async def wait_until_ready(host, port, timeout=STARTUP_TIMEOUT_SECONDS):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            status, _ = await get(host, port, '/health')
+            if status == 200:
+                return
+        except (ConnectionError, OSError):
+            pass
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"The service did not come up on {host}:{port} within {timeout}s.")
+        await asyncio.sleep(0.2)
+
+
+def report(results, elapsed, health):
+    print(f"\n{'Endpoint':<20}{'Requests':>10}{'Errors':>8}{'p50 ms':>10}{'p99 ms':>10}{'Req/sec':>10}")
+    for path in ['/churn', '/recommendations', 'all']:
+        rows = [r for r in results if path == 'all' or r[0] == path]
+        if not rows:
+            continue
+        latencies = np.array([latency for _, latency, _ in rows]) * 1000
+        errors = sum(1 for _, _, status in rows if status != 200)
+        print(f"{path:<20}{len(rows):>10}{errors:>8}{np.percentile(latencies, 50):>10.2f}"
+              f"{np.percentile(latencies, 99):>10.2f}{len(rows) / elapsed:>10,.0f}")
+    print(f"\nThe service scored /churn requests in {health['batches']} micro-batches "
+          f"of {health['mean_batch_size']} customers on average.")
+
+
+def run_load_test(host=SERVICE_HOST, port=SERVICE_PORT):
+    service = None
+    try:
+        if START_SERVICE:
+            print("Starting the inference service...")
+            service = multiprocessing.get_context('spawn').Process(target=run_service, args=(host, port), daemon=True)
+            service.start()
+        asyncio.run(wait_until_ready(host, port))
+
+        print("Sampling ids to request...")
+        customer_ids, product_ids = sample_ids()
+        print(f"Running {CONCURRENCY} clients for {DURATION_SECONDS}s, {IDS_PER_REQUEST} ids per request...")
+        results, elapsed, health = asyncio.run(run_clients(host, port, customer_ids, product_ids))
+        report(results, elapsed, health)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if service is not None:
+            service.terminate()
+            service.join()
+
+
+if __name__ == '__main__':
+    print("--- Load Test: Inference Service ---")
+    run_load_test()
+    print("\n--- Load Test Complete! ---")
@@ -1,8 +1,24 @@
 # mysql_to_snowflake.py
+import os
+import contextvars
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import mysql.connector
+from mysql.connector import pooling
 import pandas as pd
 import snowflake.connector
 from snowflake.connector.pandas_tools import write_pandas
+from etl_sinks import SnowflakeSink
+import etl_checkpoint
+import instrumentation
+import kpi_rollups
+from load_data import TABLE_KEYS
+import query_cache
 
 # --- CONFIGURATION: FILL IN YOUR DETAILS HERE ---
 
@@ -21,6 +37,83 @@ SNOWFLAKE_DB = 'OLIST_DB'
 SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
 SNOWFLAKE_SCHEMA = 'PUBLIC'  # This is the default schema in a new database
 
+# 3. Transfer Settings
+# 'streaming' reads each table in fixed-size batches with an unbuffered cursor and
+# loads them through compressed Parquet staging files, so memory is bounded by
+# BATCH_SIZE. 'incremental' streams the same way but only moves rows changed since
+# the last run (see below). 'full' is the original whole-table pd.read_sql +
+# write_pandas path.
+ETL_MODE = 'streaming'
+BATCH_SIZE = 50000  # Rows per batch in streaming mode
+STAGING_DIR = 'etl_staging'  # Local folder for the Parquet staging files
+PARQUET_COMPRESSION = 'snappy'
+
+# 4. Concurrency Settings
+# Number of tables extracted and loaded at once in streaming and incremental modes. Each worker
+# holds one MySQL and one Snowflake connection; lower this to keep the
+# warehouse from being overloaded. 1 runs the tables one at a time.
+MAX_CONCURRENCY = 4
+
+# 5. Incremental Sync Settings
+# High-water marks from previous runs are kept in SYNC_STATE_FILE. Each table below
+# only transfers rows whose watermark expression is at or above the saved mark and
+# merges them into the target by its key columns. Rows at the mark are read again,
+# since more may have been committed with the same timestamp after the last run;
+# the merge counts those it already holds unchanged as skipped. Rows matching the
+# optional 'reread' condition are transferred on every run, for changes that don't
+# move the watermark. The expressions may reference the table as 't' and, through
+# 'join', its parent order as 'o'. Rows whose watermark is NULL are only picked up
+# by a full reload (delete the table's entry from the state file).
+# Any other table is skipped when CHECKSUM TABLE reports no change since the last
+# run, and copied in full otherwise.
+SYNC_STATE_FILE = 'etl_state.json'
+ORDER_JOIN = 'JOIN orders o ON o.order_id = t.order_id'
+INCREMENTAL_TABLES = {
+    # An order changes as it moves through its lifecycle, so use its latest timestamp.
+    # A status change without a timestamp (e.g. a shipped order being canceled) doesn't
+    # move it, so orders that haven't been delivered are read on every run.
+    'orders': {
+        'watermark': ("COALESCE(t.order_delivered_customer_date, t.order_delivered_carrier_date, "
+                      "t.order_approved_at, t.order_purchase_timestamp)"),
+        'reread': "t.order_status <> 'delivered'",
+        'keys': ['order_id'],
+    },
+    # Items, payments and customers are written when the order is placed
+    'order_items': {
+        'watermark': 'o.order_purchase_timestamp',
+        'join': ORDER_JOIN,
+        'keys': ['order_id', 'order_item_id'],
+    },
+    'order_payments': {
+        'watermark': 'o.order_purchase_timestamp',
+        'join': ORDER_JOIN,
+        'keys': ['order_id', 'payment_sequential'],
+    },
+    'customers': {
+        'watermark': 'o.order_purchase_timestamp',
+        'join': 'JOIN orders o ON o.customer_id = t.customer_id',
+        'keys': ['customer_id'],
+    },
+    'order_reviews': {
+        'watermark': 'COALESCE(t.review_answer_timestamp, t.review_creation_date)',
+        'keys': ['review_id', 'order_id'],
+    },
+}
+
+# 6. Checkpoint Settings
+# Streaming and full runs record each committed batch (or table) in ETL_CHECKPOINT_FILE.
+# If a run fails, the next one skips the tables already done and continues the others
+# from their first uncommitted batch; the file is deleted once a run succeeds.
+# Rows the target rejects are written to QUARANTINE_DIR instead of failing their table.
+RESUMABLE = True
+ETL_CHECKPOINT_FILE = 'etl_checkpoint.json'
+QUARANTINE_DIR = 'etl_quarantine'
+
+# 7. KPI Rollup Settings
+# After every successful run, the daily and monthly sales rollups read by the
+# dashboard's KPI view are refreshed for the months with changed orders (see kpi_rollups.py).
+BUILD_KPI_ROLLUPS = True
+
 
 def get_mysql_tables(cursor, db_name):
     """
@@ -38,22 +131,368 @@ def get_mysql_tables(cursor, db_name):
     return tables
 
 
-def etl_pipeline():
+def get_table_row_estimates(cursor, db_name):
+    """
+    Returns {table_name: estimated row count} from information_schema.
+    InnoDB's TABLE_ROWS is only an estimate, but it is free to read and
+    good enough to decide which tables to start first.
+    """
+    query = "SELECT table_name, table_rows FROM information_schema.tables WHERE table_schema = %s"
+    cursor.execute(query, (db_name,))
+    return {table_name: table_rows or 0 for table_name, table_rows in cursor.fetchall()}
+
+
+def connect_to_snowflake():
+    """Opens a new Snowflake connection using the settings above."""
+    return snowflake.connector.connect(
+        user=SNOWFLAKE_USER,
+        password=SNOWFLAKE_PASSWORD,
+        account=SNOWFLAKE_ACCOUNT,
+        warehouse=SNOWFLAKE_WAREHOUSE,
+        database=SNOWFLAKE_DB,
+        schema=SNOWFLAKE_SCHEMA,
+        timeout=60  # Add a 60-second timeout to prevent indefinite hanging
+    )
+
+
+def create_snowflake_sink():
+    """Creates a SnowflakeSink with its own connection, for the parallel scheduler."""
+    return SnowflakeSink(connect_to_snowflake(), owns_connection=True)
+
+
+class SyncState:
+    """
+    Per-table high-water marks and checksums from previous incremental runs,
+    saved to a local JSON file after every table. Safe to share between threads.
+    """
+
+    def __init__(self, path=SYNC_STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.tables = json.load(f)
+
+    def get(self, table_name, key):
+        return self.tables.get(table_name, {}).get(key)
+
+    def update(self, table_name, **values):
+        with self.lock:
+            self.tables.setdefault(table_name, {}).update(values)
+            # Write to a temporary file first so a crash can't leave a half-written state
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.tables, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+def to_state_value(value):
+    """Converts a watermark value from a DataFrame into something JSON can store."""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat(sep=' ')
+    if hasattr(value, 'item'):
+        return value.item()  # NumPy scalar -> Python int/float
+    return value
+
+
+def param_marker(conn):
+    """Returns the parameter placeholder of the connection's driver."""
+    return '?' if isinstance(conn, sqlite3.Connection) else '%s'
+
+
+def count_rows(conn, table_name):
+    """Returns the exact number of rows in a source table."""
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    count = cursor.fetchall()[0][0]
+    cursor.close()
+    return count
+
+
+def get_table_checksum(conn, table_name):
+    """Returns MySQL's CHECKSUM TABLE value, or None where it isn't supported."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CHECKSUM TABLE {table_name}")
+        return cursor.fetchall()[0][1]
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+
+def open_stream_cursor(conn):
+    """
+    Opens an unbuffered cursor so rows stay on the server until they are fetched.
+    DB-API stand-ins such as sqlite3 don't take the option but stream by default.
+    """
+    try:
+        return conn.cursor(buffered=False)
+    except TypeError:
+        return conn.cursor()
+
+
+def extract_table_batches(conn, table_name, batch_size=BATCH_SIZE, query=None, params=()):
+    """
+    Streams a table (or the result of query) from the source database as
+    DataFrames of at most batch_size rows. An empty result yields a single
+    empty DataFrame so the target table still gets created.
+    """
+    cursor = open_stream_cursor(conn)
+    try:
+        cursor.execute(query or f"SELECT * FROM {table_name}", params)
+        columns = [column[0] for column in cursor.description]
+
+        yielded = False
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yielded = True
+            yield pd.DataFrame.from_records(rows, columns=columns)
+
+        if not yielded:
+            yield pd.DataFrame(columns=columns)
+    finally:
+        # When the caller stops early, the rows left on the server must be read before
+        # mysql.connector will close the cursor or run anything else on the connection
+        if getattr(conn, 'unread_result', False):
+            conn.consume_results()
+        cursor.close()
+
+
+def table_order_columns(conn, table_name):
+    """
+    Columns a checkpointed extract is ordered by, so a row offset points at the
+    same rows on every run: the table's primary key from TABLE_KEYS, or all
+    its columns for tables without one.
+    """
+    primary = TABLE_KEYS.get(table_name, {}).get('primary')
+    if primary:
+        return primary
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {table_name} LIMIT 0")
+        cursor.fetchall()
+        return [column[0] for column in cursor.description]
+    finally:
+        cursor.close()
+
+
+def stage_batch(df, table_name, batch_number, staging_dir=STAGING_DIR):
+    """Writes one batch to a compressed Parquet staging file and returns its path."""
+    os.makedirs(staging_dir, exist_ok=True)
+    parquet_path = os.path.join(staging_dir, f"{table_name}_{batch_number:05d}.parquet")
+    df.to_parquet(parquet_path, index=False, compression=PARQUET_COMPRESSION,
+                  coerce_timestamps='us', allow_truncated_timestamps=True)
+    return parquet_path
+
+
+def stream_table(source_conn, sink, table_name, target_table_name, batch_size=BATCH_SIZE, checkpoint=None,
+                 quarantine_dir=QUARANTINE_DIR):
+    """
+    Copies one table batch by batch: extract, stage to Parquet, hand to the sink.
+    The first batch replaces the target table and later batches are appended.
+    Only one batch is held in memory at a time. The time spent extracting,
+    staging and loading is traced as phases of one span per table.
+
+    Rows the sink rejects are narrowed down by bisecting the batch and written
+    to quarantine_dir. With a checkpoint, the table is read in key order (see
+    table_order_columns) and every committed batch is recorded; a rerun
+    continues after the last one, once it has re-read that batch and found it
+    unchanged. A finished table is skipped.
+    """
+    with instrumentation.span('stream_table', table=table_name) as table_span:
+        resume = {'chunk': 0, 'row': 0, 'rows': 0, 'last_chunk': None}
+        if checkpoint is not None:
+            order_columns = table_order_columns(source_conn, table_name)
+            source = {'target': target_table_name, 'batch_size': batch_size, 'order_by': order_columns}
+            resume = checkpoint.resume(table_name, source, sink.count_rows(target_table_name))
+            if resume is None:
+                print(f"     [{target_table_name}] Already loaded by the previous run; skipping.")
+                table_span.set(skipped=True)
+                return checkpoint.get(table_name, 'rows')
+            if resume['chunk']:
+                print(f"     [{target_table_name}] Resuming at batch {resume['chunk'] + 1} (source row {resume['row']}).")
+                table_span.set(resumed_at_row=resume['row'])
+
+        # Re-read from the start of the last committed batch, to check the source still matches
+        last_chunk = resume['last_chunk']
+        start_row = last_chunk['start_row'] if last_chunk else resume['row']
+        query = None
+        if checkpoint is not None:
+            # Offsets only identify the same rows across runs when the order is fixed
+            order_by = ', '.join(f"`{col}`" for col in order_columns)
+            query = f"SELECT * FROM {table_name} ORDER BY {order_by}"
+            if start_row:
+                query += f" LIMIT {etl_checkpoint.ALL_ROWS} OFFSET {start_row}"
+        batches = extract_table_batches(source_conn, table_name, batch_size, query)
+        if last_chunk:
+            with table_span.phase('extract'):
+                df = next(batches, None)
+            if df is None or etl_checkpoint.chunk_checksum(df) != last_chunk['checksum']:
+                batches.close()
+                print(f"     [{target_table_name}] The source changed since the last run; reloading the table.")
+                checkpoint.reset_table(table_name)
+                return stream_table(source_conn, sink, table_name, target_table_name, batch_size, checkpoint,
+                                    quarantine_dir)
+
+        total_rows = resume['rows']
+        batch_number = resume['chunk']
+        row = resume['row']
+        overwrite = batch_number == 0
+
+        def write(part):
+            nonlocal overwrite
+            with table_span.phase('stage'):
+                parquet_path = stage_batch(part, target_table_name, batch_number)
+            try:
+                with table_span.phase('load'):
+                    sink.write_batch(target_table_name, parquet_path, overwrite=overwrite)
+                overwrite = False
+            finally:
+                os.remove(parquet_path)
+
+        while True:
+            with table_span.phase('extract'):
+                df = next(batches, None)
+            if df is None:
+                break
+            loaded, bad_rows = etl_checkpoint.load_with_quarantine(df, write)
+            if bad_rows:
+                etl_checkpoint.quarantine_rows(quarantine_dir, table_name, bad_rows)
+                print(f"     [{target_table_name}] {len(bad_rows)} rejected rows written to '{quarantine_dir}'.")
+            if checkpoint is not None:
+                checkpoint.commit_chunk(table_name, batch_number, row, len(df), loaded, len(bad_rows),
+                                        etl_checkpoint.chunk_checksum(df))
+
+            row += len(df)
+            total_rows += loaded
+            table_span.add_rows(loaded)
+            batch_number += 1
+            print(f"     [{target_table_name}] Batch {batch_number}: loaded {loaded} rows ({total_rows} so far).")
+
+        if checkpoint is not None:
+            checkpoint.complete_table(table_name)
+    return total_rows
+
+
+def sync_table_incremental(source_conn, sink, table_name, target_table_name, sync_state, batch_size=BATCH_SIZE):
+    """
+    Transfers only what changed in a table since the last run.
+
+    Tables in INCREMENTAL_TABLES are read from their saved high-water mark and
+    upserted into the target by key; the first run loads them in full. Other
+    tables are skipped if their checksum is unchanged and copied in full otherwise.
+    Returns a dict with the number of rows skipped, inserted and updated.
+    """
+    with instrumentation.span('sync_table_incremental', table=table_name) as table_span:
+        counts = sync_table_changes(source_conn, sink, table_name, target_table_name, sync_state, batch_size,
+                                    table_span)
+        table_span.add_rows(counts['inserted'] + counts['updated'])
+        table_span.set(**counts)
+    return counts
+
+
+def sync_table_changes(source_conn, sink, table_name, target_table_name, sync_state, batch_size, table_span):
+    """Does the work of sync_table_incremental(), timing its phases in table_span."""
+    total_rows = count_rows(source_conn, table_name)
+    config = INCREMENTAL_TABLES.get(table_name)
+
+    if config is None:
+        checksum = get_table_checksum(source_conn, table_name)
+        if checksum is not None and checksum == sync_state.get(table_name, 'checksum'):
+            return {'skipped': total_rows, 'inserted': 0, 'updated': 0}
+        inserted = stream_table(source_conn, sink, table_name, target_table_name, batch_size)
+        sync_state.update(table_name, checksum=checksum, synced_at=datetime.now().isoformat(sep=' '))
+        return {'skipped': 0, 'inserted': inserted, 'updated': 0}
+
+    watermark = sync_state.get(table_name, 'watermark')
+    query = f"SELECT t.*, {config['watermark']} AS _watermark FROM {table_name} t {config.get('join', '')}"
+    params = ()
+    if watermark is not None:
+        query += f" WHERE {config['watermark']} >= {param_marker(source_conn)}"
+        if 'reread' in config:
+            query += f" OR {config['reread']}"
+        params = (watermark,)
+
+    counts = {'skipped': 0, 'inserted': 0, 'updated': 0}
+    new_watermark = None
+    batches = extract_table_batches(source_conn, table_name, batch_size, query, params)
+    batch_number = 0
+    while True:
+        with table_span.phase('extract'):
+            df = next(batches, None)
+        if df is None or (df.empty and watermark is not None):
+            break
+
+        batch_watermark = df['_watermark'].max()
+        if pd.notna(batch_watermark) and (new_watermark is None or batch_watermark > new_watermark):
+            new_watermark = batch_watermark
+        df = df.drop(columns='_watermark')
+
+        with table_span.phase('stage'):
+            parquet_path = stage_batch(df, target_table_name, batch_number)
+        try:
+            if watermark is None:
+                # No saved mark yet: load the table in full
+                with table_span.phase('load'):
+                    sink.write_batch(target_table_name, parquet_path, overwrite=(batch_number == 0))
+                counts['inserted'] += len(df)
+            else:
+                with table_span.phase('merge'):
+                    inserted, updated = sink.merge_batch(target_table_name, parquet_path, config['keys'])
+                counts['inserted'] += inserted
+                counts['updated'] += updated
+        finally:
+            os.remove(parquet_path)
+        batch_number += 1
+
+    counts['skipped'] = max(total_rows - counts['inserted'] - counts['updated'], 0)
+    if new_watermark is not None:
+        sync_state.update(table_name, watermark=to_state_value(new_watermark),
+                          synced_at=datetime.now().isoformat(sep=' '))
+    return counts
+
+
+def refresh_kpi_rollups(source_conn, sink):
+    """
+    Brings the KPI rollups up to date after a sync. A failure is reported but
+    doesn't fail the sync: the rollups' watermark isn't moved, so the next run
+    refreshes the same months.
+    """
+    print("\n--- Refreshing KPI rollups ---")
+    try:
+        return kpi_rollups.update_rollups(source_conn, sink)
+    except Exception as e:
+        print(f"  Failed to refresh the KPI rollups: {e}")
+        return []
+
+
+@instrumentation.traced('etl_pipeline')
+def etl_pipeline(mode=ETL_MODE, sink=None):
     """
     Connects to MySQL, extracts data from each table,
     and loads it into a corresponding table in Snowflake.
+
+    In streaming mode a different sink (see etl_sinks.py) can be passed
+    to load into a local file or database instead of Snowflake; it is
+    closed when the pipeline finishes.
     """
     mysql_conn = None
     snowflake_conn = None
+    instrumentation.current_span().set(mode=mode)
     try:
         # --- Connect to MySQL ---
         print("Connecting to MySQL...")
-        mysql_conn = mysql.connector.connect(
-            host=MYSQL_HOST,
-            user=MYSQL_USER,
-            password=MYSQL_PASSWORD,
-            database=MYSQL_DB
-        )
+        with instrumentation.span('connect_mysql'):
+            mysql_conn = mysql.connector.connect(
+                host=MYSQL_HOST,
+                user=MYSQL_USER,
+                password=MYSQL_PASSWORD,
+                database=MYSQL_DB
+            )
         mysql_cursor = mysql_conn.cursor()
         print("MySQL connection successful.")
 
@@ -62,26 +501,48 @@ def etl_pipeline():
         print(f"Found {len(tables)} tables in MySQL: {tables}")
 
         # --- Connect to Snowflake ---
-        print("\nConnecting to Snowflake... (this may take up to 60 seconds)")
-        snowflake_conn = snowflake.connector.connect(
-            user=SNOWFLAKE_USER,
-            password=SNOWFLAKE_PASSWORD,
-            account=SNOWFLAKE_ACCOUNT,
-            warehouse=SNOWFLAKE_WAREHOUSE,
-            database=SNOWFLAKE_DB,
-            schema=SNOWFLAKE_SCHEMA,
-            timeout=60  # Add a 60-second timeout to prevent indefinite hanging
-        )
-        print("Snowflake connection successful.")
+        if sink is None or mode == 'full':
+            print("\nConnecting to Snowflake... (this may take up to 60 seconds)")
+            with instrumentation.span('connect_snowflake'):
+                snowflake_conn = connect_to_snowflake()
+            print("Snowflake connection successful.")
+
+        if mode in ('streaming', 'incremental') and sink is None:
+            sink = SnowflakeSink(snowflake_conn)
+        sync_state = SyncState() if mode == 'incremental' else None
+        # Incremental runs resume from their watermarks instead
+        checkpoint = etl_checkpoint.Checkpoint(ETL_CHECKPOINT_FILE) if RESUMABLE and mode != 'incremental' else None
+        failed_tables = []
 
         # --- Loop through tables, extract from MySQL, and load to Snowflake ---
         for table_name in tables:
             print(f"\n--- Processing table: {table_name} ---")
 
+            if mode == 'streaming':
+                snowflake_table_name = table_name.upper()
+                print(f"  Streaming '{table_name}' to '{snowflake_table_name}' in batches of {BATCH_SIZE} rows...")
+                nrows = stream_table(mysql_conn, sink, table_name, snowflake_table_name, checkpoint=checkpoint)
+                print(f"     Successfully loaded {nrows} rows into '{snowflake_table_name}'.")
+                continue
+
+            if mode == 'incremental':
+                snowflake_table_name = table_name.upper()
+                print(f"  Syncing changes from '{table_name}' to '{snowflake_table_name}'...")
+                counts = sync_table_incremental(mysql_conn, sink, table_name, snowflake_table_name, sync_state)
+                print(f"     Skipped {counts['skipped']}, inserted {counts['inserted']} "
+                      f"and updated {counts['updated']} rows in '{snowflake_table_name}'.")
+                continue
+
+            if checkpoint is not None and checkpoint.is_complete(table_name):
+                print("  Already loaded by the previous run; skipping.")
+                continue
+
             # 1. EXTRACT data from MySQL using Pandas
             print(f"  1. Extracting data from MySQL table '{table_name}'...")
             sql_query = f"SELECT * FROM {table_name}"
-            df = pd.read_sql(sql_query, mysql_conn)
+            with instrumentation.span('extract', table=table_name) as extract_span:
+                df = pd.read_sql(sql_query, mysql_conn)
+                extract_span.add_rows(len(df))
             print(f"     Extracted {len(df)} rows.")
 
             # 2. TRANSFORM (simple cleanse)
@@ -89,26 +550,58 @@ def etl_pipeline():
 
             # 3. LOAD data into Snowflake
             print(f"  2. Loading data into Snowflake table '{snowflake_table_name}'...")
-            success, nchunks, nrows, _ = write_pandas(
-                conn=snowflake_conn,
-                df=df,
-                table_name=snowflake_table_name,
-                auto_create_table=True,
-                overwrite=True
-            )
+            with instrumentation.span('load', table=table_name) as load_span:
+                success, nchunks, nrows, _ = write_pandas(
+                    conn=snowflake_conn,
+                    df=df,
+                    table_name=snowflake_table_name,
+                    auto_create_table=True,
+                    overwrite=True
+                )
+                load_span.add_rows(nrows)
             if success:
                 print(f"     Successfully loaded {nrows} rows into '{snowflake_table_name}'.")
+                if checkpoint is not None:
+                    checkpoint.complete_table(table_name, rows=nrows)
             else:
                 print(f"     Failed to load data into '{snowflake_table_name}'.")
+                failed_tables.append(table_name)
+
+        # --- Keep the checkpoint and the app's data version if any table failed ---
+        if failed_tables:
+            print(f"\nFailed tables: {failed_tables}")
+            if checkpoint is not None:
+                print(f"Run the pipeline again to resume them from '{ETL_CHECKPOINT_FILE}'.")
+            instrumentation.current_span().set(failed_tables=failed_tables)
+            return
+
+        # --- The run is complete, so the next one starts afresh ---
+        if checkpoint is not None:
+            checkpoint.finish()
+
+        # --- Refresh the KPI rollups from the synced orders ---
+        if BUILD_KPI_ROLLUPS:
+            if sink is None:
+                sink = SnowflakeSink(snowflake_conn)  # Full runs load with write_pandas and have no sink yet
+            refresh_kpi_rollups(mysql_conn, sink)
+
+        # --- Invalidate the app's query cache ---
+        version = query_cache.publish_data_version()
+        print(f"\nPublished data version {version}; cached app queries are now stale.")
 
     except mysql.connector.Error as mysql_err:
         print(f"MySQL Error: {mysql_err}")
+        instrumentation.record_error(mysql_err)
     except snowflake.connector.Error as sf_err:
         print(f"Snowflake Error: {sf_err}")
+        instrumentation.record_error(sf_err)
     except Exception as e:
         print(f"An error occurred: {e}")
+        instrumentation.record_error(e)
     finally:
         # --- Close connections ---
+        if sink:
+            sink.close()
         if mysql_conn and mysql_conn.is_connected():
             mysql_cursor.close()
             mysql_conn.close()
@@ -118,7 +611,143 @@ def etl_pipeline():
             print("Snowflake connection closed.")
 
 
+def transfer_table(mysql_pool, sink_pool, table_name, sync_state=None, checkpoint=None):
+    """
+    Streams one table using a MySQL connection and a sink borrowed from the pools,
+    or only its changes when a sync state is given. Returns the skipped/inserted/
+    updated row counts and the elapsed seconds.
+    """
+    mysql_conn = mysql_pool.get_connection()
+    sink = sink_pool.get()
+    start_time = time.perf_counter()
+    try:
+        if sync_state is not None:
+            counts = sync_table_incremental(mysql_conn, sink, table_name, table_name.upper(), sync_state)
+        else:
+            nrows = stream_table(mysql_conn, sink, table_name, table_name.upper(), checkpoint=checkpoint)
+            counts = {'skipped': 0, 'inserted': nrows, 'updated': 0}
+    finally:
+        mysql_conn.close()  # Returns the connection to the pool
+        sink_pool.put(sink)
+    return counts, time.perf_counter() - start_time
+
+
+@instrumentation.traced('parallel_etl_pipeline')
+def parallel_etl_pipeline(max_concurrency=MAX_CONCURRENCY, sink_factory=create_snowflake_sink, mode=ETL_MODE):
+    """
+    Streams several tables at once over a bounded pool of workers. Each worker
+    borrows one MySQL connection and one sink (with its own Snowflake connection)
+    from fixed-size pools. The largest tables, by information_schema row
+    estimates, are started first so the run doesn't end waiting on one straggler.
+    Prints the time taken by each table at the end. With mode='incremental'
+    only changed rows are transferred, as in etl_pipeline().
+    """
+    sink_pool = queue.Queue()
+    sinks = []
+    timings = []
+    failed_tables = []
+    instrumentation.current_span().set(mode=mode, max_concurrency=max_concurrency)
+    try:
+        # --- Plan the run from MySQL's table statistics ---
+        print("Connecting to MySQL...")
+        mysql_conn = mysql.connector.connect(
+            host=MYSQL_HOST,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD,
+            database=MYSQL_DB
+        )
+        mysql_cursor = mysql_conn.cursor()
+        row_estimates = get_table_row_estimates(mysql_cursor, MYSQL_DB)
+        mysql_cursor.close()
+        mysql_conn.close()
+
+        tables = sorted(row_estimates, key=row_estimates.get, reverse=True)
+        workers = max(1, min(max_concurrency, len(tables)))
+        print(f"Found {len(tables)} tables in MySQL, largest first: {tables}")
+
+        # --- Open one connection per worker on each side ---
+        print(f"\nOpening {workers} MySQL and {workers} target connections...")
+        mysql_pool = pooling.MySQLConnectionPool(
+            pool_name='olist_etl',
+            pool_size=workers,
+            host=MYSQL_HOST,
+            user=MYSQL_USER,
+            password=MYSQL_PASSWORD,
+            database=MYSQL_DB
+        )
+        for _ in range(workers):
+            sink = sink_factory()
+            sinks.append(sink)
+            sink_pool.put(sink)
+        print("Connection pools ready.")
+
+        # --- Transfer the tables concurrently ---
+        sync_state = SyncState() if mode == 'incremental' else None
+        checkpoint = etl_checkpoint.Checkpoint(ETL_CHECKPOINT_FILE) if RESUMABLE and mode != 'incremental' else None
+        run_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Each table runs in a copy of this context, so its spans are children of the pipeline's
+            futures = {executor.submit(contextvars.copy_context().run, transfer_table, mysql_pool, sink_pool, t,
+                                       sync_state, checkpoint): t for t in tables}
+            for future in as_completed(futures):
+                table_name = futures[future]
+                try:
+                    counts, elapsed = future.result()
+                except Exception as e:
+                    print(f"  Failed to transfer '{table_name}': {e}")
+                    failed_tables.append(table_name)
+                    continue
+                timings.append((table_name, counts, elapsed))
+                print(f"  Finished '{table_name}': {counts['inserted'] + counts['updated']} rows in {elapsed:.1f}s.")
+        run_elapsed = time.perf_counter() - run_start
+
+        # --- Per-table timing summary ---
+        print(f"\n{'Table':<32}{'Skipped':>12}{'Inserted':>12}{'Updated':>12}{'Seconds':>10}{'Rows/sec':>12}")
+        for table_name, counts, elapsed in sorted(timings, key=lambda t: t[2], reverse=True):
+            nrows = counts['inserted'] + counts['updated']
+            print(f"{table_name:<32}{counts['skipped']:>12}{counts['inserted']:>12}{counts['updated']:>12}"
+                  f"{elapsed:>10.1f}{nrows / max(elapsed, 1e-9):>12,.0f}")
+        print(f"\nTransferred {len(timings)} tables in {run_elapsed:.1f}s with {workers} workers.")
+        # --- Keep the checkpoint and the app's data version if any table failed ---
+        if failed_tables:
+            print(f"Failed tables: {failed_tables}")
+            if checkpoint is not None:
+                print(f"Run the pipeline again to resume them from '{ETL_CHECKPOINT_FILE}'.")
+            instrumentation.current_span().set(failed_tables=failed_tables)
+        else:
+            if checkpoint is not None:
+                checkpoint.finish()
+            # --- Refresh the KPI rollups from the synced orders ---
+            if BUILD_KPI_ROLLUPS:
+                mysql_conn = mysql_pool.get_connection()
+                try:
+                    refresh_kpi_rollups(mysql_conn, sinks[0])
+                finally:
+                    mysql_conn.close()
+
+            # --- Invalidate the app's query cache ---
+            version = query_cache.publish_data_version()
+            print(f"Published data version {version}; cached app queries are now stale.")
+
+    except mysql.connector.Error as mysql_err:
+        print(f"MySQL Error: {mysql_err}")
+        instrumentation.record_error(mysql_err)
+    except snowflake.connector.Error as sf_err:
+        print(f"Snowflake Error: {sf_err}")
+        instrumentation.record_error(sf_err)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        instrumentation.record_error(e)
+    finally:
+        for sink in sinks:
+            sink.close()
+        print("\nConnections closed.")
+
+
 if __name__ == '__main__':
     print("--- Starting ETL Pipeline: MySQL to Snowflake ---")
-    etl_pipeline()
+    if ETL_MODE in ('streaming', 'incremental') and MAX_CONCURRENCY > 1:
+        parallel_etl_pipeline()
+    else:
+        etl_pipeline()
     print("\n--- ETL Pipeline Complete! ---")
\ No newline at end of file
@@ -0,0 +1,136 @@
+# query_cache.py
+import hashlib
+import os
+import uuid
+from datetime import datetime
+import pyarrow as pa
+
+# --- CACHE SETTINGS ---
+# Shared by every process on the host that points at the same directory
+CACHE_DIR = os.environ.get('QUERY_CACHE_DIR', 'query_cache')
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used results are evicted above this size
+DATA_VERSION_FILE = 'DATA_VERSION'
+
+
+def normalize_query(query):
+    """
+    Collapses whitespace and drops a trailing semicolon, so the same query
+    formatted differently maps to the same cache entry. Case is kept, since
+    quoted identifiers and string literals are case-sensitive.
+    """
+    return ' '.join(str(query).split()).rstrip(';').strip()
+
+
+def data_version(cache_dir=CACHE_DIR):
+    """Returns the current data-version token ('initial' until something is published)."""
+    try:
+        with open(os.path.join(cache_dir, DATA_VERSION_FILE)) as f:
+            return f.read().strip() or 'initial'
+    except FileNotFoundError:
+        return 'initial'
+
+
+def publish_data_version(cache_dir=CACHE_DIR):
+    """
+    Marks all cached results as stale by moving to a new data-version token.
+    Called by the jobs that change what the app reads: the ETL sync, feature
+    store refreshes and batch scoring. Entries of older versions are deleted.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    version = f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    pointer = os.path.join(cache_dir, DATA_VERSION_FILE)
+    tmp_path = f"{pointer}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, pointer)
+
+    for name in os.listdir(cache_dir):
+        if name.endswith('.arrow') and not name.startswith(f"{version}-"):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                pass
+    return version
+
+
+def entry_path(query, version, cache_dir=CACHE_DIR):
+    """Content-addressed file name: the data version plus a hash of the normalized query."""
+    digest = hashlib.sha256(f"{version}\n{normalize_query(query)}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, f"{version}-{digest}.arrow")
+
+
+def get(query, version=None, cache_dir=CACHE_DIR):
+    """
+    Returns the cached result of query for a data version (the current one by
+    default) as a DataFrame, or None on a miss. The file is read through a
+    memory map.
+    """
+    path = entry_path(query, version or data_version(cache_dir), cache_dir)
+    try:
+        with pa.memory_map(path) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+    try:
+        os.utime(path)  # Marks the entry as recently used
+    except FileNotFoundError:
+        pass
+    return df
+
+
+def put(query, df, version=None, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Stores a query result for a data version (the current one by default) as an
+    Arrow IPC file. The file is written under a temporary name and renamed, so
+    concurrent readers in other processes only ever see complete entries.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = entry_path(query, version or data_version(cache_dir), cache_dir)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """Deletes the least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.arrow'):
+            continue
+        try:
+            stat = os.stat(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+def cached_query(query, load, cache_dir=CACHE_DIR):
+    """
+    Returns the cached result of query, or calls load() and caches what it returns.
+    The result is filed under the data version read before loading, so if a new
+    version is published while load() runs, the possibly stale result is never
+    served as the new version's.
+    """
+    version = data_version(cache_dir)
+    df = get(query, version, cache_dir)
+    if df is None:
+        df = load()
+        try:
+            put(query, df, version, cache_dir)
+        except (pa.ArrowException, OSError):
+            pass  # Results Arrow can't store are simply not cached
+    return df
@@ -0,0 +1,216 @@
+# recommender_store.py
+import json
+import os
+import shutil
+from itertools import zip_longest
+import numpy as np
+
+ARTIFACT_VERSION = 2
+READABLE_VERSIONS = (1, 2)  # Version 1 artifacts have no popularity fallback
+
+
+def save_recommender(path, product_ids, indptr, indices, scores, popular=None, category_names=None,
+                     category_codes=None, category_popular_indptr=None, category_popular=None,
+                     category_related_indptr=None, category_related=None, scoring_method='count', build_info=None):
+    """
+    Writes the recommender as a directory of .npy arrays that can be memory-mapped:
+      product_ids.npy  - interned id table: sorted, fixed-width UTF-8 byte strings
+      indptr.npy       - row i's recommendations are indices[indptr[i]:indptr[i + 1]]
+      indices.npy      - codes (positions in product_ids) of the recommended products
+      scores.npy       - score of each recommendation, best first within a row
+    and, when given, the popularity fallback:
+      popular.npy                 - codes of the most ordered products, most ordered first
+      category_names.npy          - sorted UTF-8 product_category_name table
+      category_codes.npy          - each product's position in category_names, or -1
+      category_popular_indptr.npy - category c's most ordered products are
+      category_popular.npy          category_popular[category_popular_indptr[c]:category_popular_indptr[c + 1]]
+      category_related_indptr.npy - the categories most often bought with category c, best
+      category_related.npy          first, are category_related[category_related_indptr[c]:...[c + 1]]
+    The directory is written next to the target and swapped in at the end, so a
+    running app never sees a half-written model.
+    """
+    ids = np.array([str(pid).encode('utf-8') for pid in product_ids], dtype=bytes)
+    if len(ids) > 1 and not np.all(ids[:-1] < ids[1:]):
+        raise ValueError("product_ids must be unique and sorted so they can be binary-searched.")
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, 'product_ids.npy'), ids)
+    np.save(os.path.join(tmp_path, 'indptr.npy'), np.asarray(indptr, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'indices.npy'), np.asarray(indices, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'scores.npy'), np.asarray(scores, dtype=np.float32))
+    if popular is not None:
+        np.save(os.path.join(tmp_path, 'popular.npy'), np.asarray(popular, dtype=np.int32))
+    if category_names is not None:
+        np.save(os.path.join(tmp_path, 'category_names.npy'),
+                np.array([str(name).encode('utf-8') for name in category_names], dtype=bytes))
+        np.save(os.path.join(tmp_path, 'category_codes.npy'), np.asarray(category_codes, dtype=np.int32))
+        np.save(os.path.join(tmp_path, 'category_popular_indptr.npy'), np.asarray(category_popular_indptr, dtype=np.int64))
+        np.save(os.path.join(tmp_path, 'category_popular.npy'), np.asarray(category_popular, dtype=np.int32))
+    if category_related is not None:
+        np.save(os.path.join(tmp_path, 'category_related_indptr.npy'), np.asarray(category_related_indptr, dtype=np.int64))
+        np.save(os.path.join(tmp_path, 'category_related.npy'), np.asarray(category_related, dtype=np.int32))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'version': ARTIFACT_VERSION, 'products': len(ids), 'recommendations': len(indices),
+                   'scoring_method': scoring_method, **(build_info or {})}, f)
+
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def get_recommender_version(path):
+    """
+    Identifies a saved recommender by when its meta.json was written. Every save
+    swaps in a new directory, so this changes with each retrain without
+    reading the arrays.
+    """
+    return f"{os.stat(os.path.join(path, 'meta.json')).st_mtime_ns:x}"
+
+
+class Recommender:
+    """
+    Read-only recommender served straight from the memory-mapped arrays written by
+    save_recommender(). Opening it reads nothing but the array headers, and every
+    process that opens the same files shares the OS page cache, so startup time and
+    per-process memory don't depend on catalogue size.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported recommender artifact version {self.meta['version']}.")
+
+        self.product_ids = self._load(path, 'product_ids')
+        self.indptr = self._load(path, 'indptr')
+        self.indices = self._load(path, 'indices')
+        self.scores = self._load(path, 'scores')
+
+        # Popularity fallback; empty for artifacts written without one
+        empty = np.zeros(0, dtype=np.int32)
+        self.popular_codes = self._load(path, 'popular', empty)
+        self.category_names = self._load(path, 'category_names', np.zeros(0, dtype=bytes))
+        self.category_codes = self._load(path, 'category_codes', empty)
+        self.category_popular_indptr = self._load(path, 'category_popular_indptr', np.zeros(1, dtype=np.int64))
+        self.category_popular = self._load(path, 'category_popular', empty)
+        self.category_related_indptr = self._load(path, 'category_related_indptr', np.zeros(1, dtype=np.int64))
+        self.category_related = self._load(path, 'category_related', empty)
+
+    @staticmethod
+    def _load(path, name, default=None):
+        file_path = os.path.join(path, f"{name}.npy")
+        if default is not None and not os.path.exists(file_path):
+            return default
+        return np.load(file_path, mmap_mode='r')
+
+    def code(self, product_id):
+        """Returns the integer code of a product id (binary search), or -1 if it is unknown."""
+        key = product_id.encode('utf-8')
+        position = int(np.searchsorted(self.product_ids, key))
+        if position < len(self.product_ids) and self.product_ids[position] == key:
+            return position
+        return -1
+
+    def get(self, product_id, k=None):
+        """Returns up to k recommended product ids for product_id, best first."""
+        code = self.code(product_id)
+        if code < 0:
+            return []
+
+        start, end = int(self.indptr[code]), int(self.indptr[code + 1])
+        if k is not None:
+            end = min(end, start + k)
+        return [pid.decode('utf-8') for pid in self.product_ids[self.indices[start:end]]]
+
+    def category(self, product_id):
+        """Returns the product_category_name of a product, or None if it has none or is unknown."""
+        code = self.code(product_id)
+        if code < 0 or len(self.category_codes) == 0 or self.category_codes[code] < 0:
+            return None
+        return self.category_names[self.category_codes[code]].decode('utf-8')
+
+    def popular(self, k=None, category=None):
+        """
+        Returns up to k of the most ordered products, most ordered first: overall,
+        or within a product_category_name.
+        """
+        codes = self.popular_codes
+        if category is not None:
+            position = self._category_position(category)
+            if position < 0:
+                return []
+            codes = self._category_popular_codes(position)
+        if k is not None:
+            codes = codes[:k]
+        return [pid.decode('utf-8') for pid in self.product_ids[codes]]
+
+    def _category_position(self, category):
+        key = category.encode('utf-8')
+        position = int(np.searchsorted(self.category_names, key))
+        if position < len(self.category_names) and self.category_names[position] == key:
+            return position
+        return -1
+
+    def _category_popular_codes(self, position):
+        return self.category_popular[self.category_popular_indptr[position]:self.category_popular_indptr[position + 1]]
+
+    def related_categories(self, category):
+        """
+        Returns the categories most often bought together with category, best first
+        (usually itself). Artifacts without category co-purchase data give [category].
+        """
+        position = self._category_position(category)
+        if position < 0:
+            return []
+        if len(self.category_related) == 0:
+            return [category]
+        related = self.category_related[self.category_related_indptr[position]:self.category_related_indptr[position + 1]]
+        return [name.decode('utf-8') for name in self.category_names[related]] or [category]
+
+    def category_recommendations(self, product_id, k):
+        """
+        Category-level recommendations for a long-tail product: the most ordered
+        products of the categories most often bought with the product's category,
+        taken in turn from each category. Returns up to 2 * k product ids.
+        """
+        category = self.category(product_id)
+        if category is None:
+            return []
+        lists = [self._category_popular_codes(self._category_position(name))[:2 * k]
+                 for name in self.related_categories(category)]
+        codes = [code for group in zip_longest(*lists) for code in group if code is not None]
+        return [pid.decode('utf-8') for pid in self.product_ids[codes[:2 * k]]]
+
+    def recommend(self, product_id, k):
+        """
+        Returns k products for product_id, from three tiers: its exact co-purchase
+        neighbours (head products), then category-level recommendations, then the
+        most ordered products overall, for products with fewer than k neighbours
+        (or none, e.g. a product bought in a single order).
+        """
+        recommendations = self.get(product_id, k=k)
+        if len(recommendations) >= k:
+            return recommendations
+
+        seen = set(recommendations)
+        seen.add(product_id)
+        candidates = self.category_recommendations(product_id, k) + self.popular(2 * k)
+        for candidate in candidates:
+            if len(recommendations) == k:
+                break
+            if candidate not in seen:
+                recommendations.append(candidate)
+                seen.add(candidate)
+        return recommendations
+
+    def __contains__(self, product_id):
+        return self.code(product_id) >= 0
+
+    def __len__(self):
+        return len(self.product_ids)
@@ -0,0 +1,235 @@
+# score_churn_batch.py
+import hashlib
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import joblib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import query_cache
+from sqlalchemy import create_engine
+import warnings
+
+# Suppress the UserWarning from pandas
+warnings.filterwarnings("ignore", category=UserWarning)
+
+# --- CONFIGURATION: FILL IN YOUR SNOWFLAKE DETAILS ---
+SNOWFLAKE_ACCOUNT = 'fac88810.us-east-1'  # <-- CHANGE THIS
+SNOWFLAKE_USER = 'ETL_USER'
+SNOWFLAKE_PASSWORD = 'Ha0ieidheb#rl9'  # <-- CHANGE THIS
+SNOWFLAKE_DB = 'OLIST_DB'
+SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
+SNOWFLAKE_SCHEMA = 'PUBLIC'
+
+# --- SCORING SETTINGS ---
+MODEL_PATH = 'churn_model.pkl'
+FEATURE_COLUMNS = ['frequency', 'monetary_value']  # Model inputs, in order; train_churn_model.py trains on these
+CHUNK_SIZE = 200000  # Customers read, scored and written per chunk
+SCORING_WORKERS = 1  # Set above 1 to score chunks across a process pool
+OUTPUT = 'table'  # 'table' writes PREDICTIONS_TABLE in Snowflake, 'parquet' writes PREDICTIONS_PATH
+PREDICTIONS_TABLE = 'CHURN_PREDICTIONS'
+PREDICTIONS_PATH = 'churn_predictions.parquet'
+
+
+def get_model_version(model_path=MODEL_PATH):
+    """Identifies a model by a short hash of its file, so every prediction can be traced to it."""
+    with open(model_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def iter_feature_chunks(engine, chunksize=CHUNK_SIZE):
+    """Streams CUSTOMER_CHURN_FEATURES in chunks, with lower-case column names."""
+    query = 'SELECT "customer_unique_id", "FREQUENCY", "MONETARY_VALUE" FROM CUSTOMER_CHURN_FEATURES'
+    for chunk in pd.read_sql(query, engine, chunksize=chunksize):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        yield chunk
+
+
+# --- PROCESS POOL WORKERS ---
+# Each worker loads the model once when it starts, so only feature arrays
+# and probabilities travel between processes.
+_worker_model = None
+
+
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = joblib.load(model_path)
+
+
+def _score_in_worker(features):
+    return _worker_model.predict_proba(features)[:, 1]
+
+
+class ParquetPredictionWriter:
+    """
+    Appends each chunk of predictions as a row group of one Parquet file.
+    The file is written under a temporary name and renamed when complete.
+    """
+
+    def __init__(self, path=PREDICTIONS_PATH):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.writer = None
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_path, table.schema, compression='snappy')
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Removes the partly written file of a failed run, leaving the previous predictions in place."""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class TablePredictionWriter:
+    """
+    Bulk-loads each chunk of predictions into a Snowflake table with write_pandas.
+    The table is replaced by the first chunk of a run, so it always holds the
+    latest scores.
+    """
+
+    def __init__(self, conn, table_name=PREDICTIONS_TABLE):
+        self.conn = conn
+        self.table_name = table_name
+        self.first_chunk = True
+
+    def write(self, df):
+        from snowflake.connector.pandas_tools import write_pandas
+        write_pandas(conn=self.conn, df=df, table_name=self.table_name,
+                     auto_create_table=True, overwrite=self.first_chunk)
+        self.first_chunk = False
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+def score_all_customers(engine, writer, model_path=MODEL_PATH, chunksize=CHUNK_SIZE, workers=SCORING_WORKERS):
+    """
+    Scores every customer in CUSTOMER_CHURN_FEATURES and hands the predictions to
+    the writer chunk by chunk. Each chunk is scored with a single vectorized
+    predict_proba call; with workers > 1 the chunks are scored across a process
+    pool, with at most two chunks per worker in flight so memory stays flat.
+    Returns the number of customers scored.
+    """
+    model_version = get_model_version(model_path)
+    scored_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    print(f"Scoring customers with model version {model_version}...")
+
+    def write_predictions(chunk, probabilities):
+        writer.write(pd.DataFrame({
+            'customer_unique_id': chunk['customer_unique_id'].to_numpy(),
+            'churn_probability': probabilities,
+            'model_version': model_version,
+            'scored_at': scored_at,
+        }))
+
+    total_rows = 0
+    start_time = time.perf_counter()
+
+    def report(chunk):
+        elapsed = time.perf_counter() - start_time
+        print(f"  Scored {len(chunk)} customers ({total_rows} so far, "
+              f"{total_rows / max(elapsed, 1e-9):,.0f} rows/sec).")
+
+    try:
+        if workers <= 1:
+            model = joblib.load(model_path)
+            for chunk in iter_feature_chunks(engine, chunksize):
+                write_predictions(chunk, model.predict_proba(chunk[FEATURE_COLUMNS])[:, 1])
+                total_rows += len(chunk)
+                report(chunk)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(model_path,)) as executor:
+                in_flight = deque()
+                for chunk in iter_feature_chunks(engine, chunksize):
+                    in_flight.append((chunk, executor.submit(_score_in_worker, chunk[FEATURE_COLUMNS])))
+                    # Write finished chunks in order once the pipeline is full
+                    while len(in_flight) >= 2 * workers:
+                        done_chunk, future = in_flight.popleft()
+                        write_predictions(done_chunk, future.result())
+                        total_rows += len(done_chunk)
+                        report(done_chunk)
+                while in_flight:
+                    done_chunk, future = in_flight.popleft()
+                    write_predictions(done_chunk, future.result())
+                    total_rows += len(done_chunk)
+                    report(done_chunk)
+        writer.close()
+    except BaseException:
+        writer.abort()  # Don't leave a partial output behind
+        raise
+    elapsed = time.perf_counter() - start_time
+    print(f"Scored {total_rows} customers in {elapsed:.1f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/sec).")
+    return total_rows
+
+
+def run_batch_scoring():
+    """
+    Main function to score all customers and store the predictions.
+    """
+    snowflake_engine = None
+    snowflake_conn = None
+    try:
+        # --- Create a SQLAlchemy Engine for Snowflake ---
+        print("Creating Snowflake SQLAlchemy engine...")
+        connection_url = (
+            f"snowflake://{SNOWFLAKE_USER}:{SNOWFLAKE_PASSWORD}@{SNOWFLAKE_ACCOUNT}/"
+            f"{SNOWFLAKE_DB}/{SNOWFLAKE_SCHEMA}?warehouse={SNOWFLAKE_WAREHOUSE}"
+        )
+        snowflake_engine = create_engine(connection_url)
+        print("Snowflake engine created successfully.")
+
+        if OUTPUT == 'table':
+            # Imported here so that app.py can use this module without loading the connector
+            import snowflake.connector
+            snowflake_conn = snowflake.connector.connect(
+                user=SNOWFLAKE_USER,
+                password=SNOWFLAKE_PASSWORD,
+                account=SNOWFLAKE_ACCOUNT,
+                warehouse=SNOWFLAKE_WAREHOUSE,
+                database=SNOWFLAKE_DB,
+                schema=SNOWFLAKE_SCHEMA
+            )
+            writer = TablePredictionWriter(snowflake_conn)
+            print(f"Writing predictions to Snowflake table '{PREDICTIONS_TABLE}'.")
+        else:
+            writer = ParquetPredictionWriter()
+            print(f"Writing predictions to '{PREDICTIONS_PATH}'.")
+
+        score_all_customers(snowflake_engine, writer)
+
+        # New predictions change what the dashboard shows
+        version = query_cache.publish_data_version()
+        print(f"Published data version {version}; cached app queries are now stale.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if snowflake_conn:
+            snowflake_conn.close()
+        if snowflake_engine:
+            snowflake_engine.dispose()
+            print("\nSnowflake engine connection closed.")
+
+
+if __name__ == '__main__':
+    print("--- Starting Batch Churn Scoring ---")
+    run_batch_scoring()
+    print("\n--- Batch Churn Scoring Complete! ---")
@@ -0,0 +1,50 @@
+# search_index.py
+import numpy as np
+
+# Sorts after every character a real id can contain, so prefix + PREFIX_END
+# is an upper bound for all ids starting with prefix
+PREFIX_END = '\U0010ffff'
+
+
+class PrefixIndex:
+    """
+    In-process typeahead index over a sorted array of ids, with optional
+    equality filters on columns aligned with the ids (e.g. product category).
+    A search is two binary searches for the block of ids starting with the
+    prefix plus a vectorized filter over that block, and returns one page of
+    matches, so the work and the payload don't grow with the number of ids.
+    """
+
+    def __init__(self, ids, **columns):
+        ids = np.asarray(ids, dtype=str)
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.columns = {name: np.asarray(values, dtype=object)[order] for name, values in columns.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def prefix_range(self, prefix):
+        """Returns the [start, end) positions of the ids starting with prefix."""
+        start = int(np.searchsorted(self.ids, prefix, side='left'))
+        end = int(np.searchsorted(self.ids, prefix + PREFIX_END, side='left'))
+        return start, end
+
+    def search(self, prefix='', limit=20, offset=0, **filters):
+        """
+        Returns (page, total): up to limit ids starting with prefix, skipping the
+        first offset matches, and the total number of matches. Keyword filters
+        keep only ids whose column equals the given value; None means no filter.
+        """
+        start, end = self.prefix_range(prefix)
+        active_filters = {name: value for name, value in filters.items() if value is not None}
+
+        if not active_filters:
+            page_start = min(start + offset, end)
+            return self.ids[page_start:min(page_start + limit, end)].tolist(), end - start
+
+        mask = np.ones(end - start, dtype=bool)
+        for name, value in active_filters.items():
+            mask &= self.columns[name][start:end] == value
+        matches = np.flatnonzero(mask)
+        return self.ids[start + matches[offset:offset + limit]].tolist(), len(matches)
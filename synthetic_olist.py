@@ -0,0 +1,313 @@
+# synthetic_olist.py
+import binascii
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
+
+# --- GENERATOR SETTINGS ---
+OUTPUT_DIR = 'synthetic_olist'
+SCALE = 1  # 1 is about the size of the real Olist dataset; 10 and 100 for load testing
+SEED = 42
+BLOCK_ORDERS = 100000  # Orders generated and written at a time, bounding memory at any scale
+
+# Sizes of the real dataset, multiplied by SCALE
+ORDERS_PER_SCALE = 99441
+PRODUCTS_PER_SCALE = 32951
+SELLERS_PER_SCALE = 3095
+
+# --- DISTRIBUTIONS (fitted by eye to the real dataset) ---
+REPEAT_ORDER_SHARE = 0.034  # Orders placed by a customer_unique_id seen before
+SINGLE_ITEM_SHARE = 0.9  # Orders with one item; the rest have a geometric tail of extra items
+EXTRA_ITEM_P = 0.5
+REPEATED_PRODUCT_SHARE = 0.65  # Extra items that are another unit of a product already in the basket
+PRODUCT_POPULARITY_EXPONENT = 0.9  # Zipf exponent: a few bestsellers and a long tail bought once
+CATEGORY_POPULARITY_EXPONENT = 1.1
+SELLER_POPULARITY_EXPONENT = 1.0
+MISSING_CATEGORY_SHARE = 0.0185
+FIRST_PURCHASE = np.datetime64('2016-09-04T00:00:00')
+LAST_PURCHASE = np.datetime64('2018-10-17T00:00:00')
+ORDER_STATUSES = [('delivered', 0.9702), ('shipped', 0.0111), ('canceled', 0.0063), ('unavailable', 0.0061),
+                  ('invoiced', 0.0032), ('processing', 0.0030), ('created', 0.0001)]
+PAYMENT_TYPES = [('credit_card', 0.739), ('boleto', 0.19), ('voucher', 0.056), ('debit_card', 0.015)]
+# Customer states with their share of customers, a zip prefix range and a city
+STATES = [
+    ('SP', 0.42, 1000, 19999, 'sao paulo'), ('RJ', 0.13, 20000, 28999, 'rio de janeiro'),
+    ('MG', 0.117, 30000, 39999, 'belo horizonte'), ('RS', 0.055, 90000, 99999, 'porto alegre'),
+    ('PR', 0.051, 80000, 87999, 'curitiba'), ('SC', 0.037, 88000, 89999, 'florianopolis'),
+    ('BA', 0.034, 40000, 48999, 'salvador'), ('DF', 0.022, 70000, 73699, 'brasilia'),
+    ('ES', 0.021, 29000, 29999, 'vitoria'), ('GO', 0.021, 72800, 76799, 'goiania'),
+    ('PE', 0.017, 50000, 56999, 'recife'), ('CE', 0.013, 60000, 63999, 'fortaleza'),
+    ('PA', 0.01, 66000, 68899, 'belem'), ('MT', 0.009, 78000, 78899, 'cuiaba'),
+    ('MA', 0.0075, 65000, 65999, 'sao luis'), ('MS', 0.0072, 79000, 79999, 'campo grande'),
+    ('PB', 0.0054, 58000, 58999, 'joao pessoa'), ('PI', 0.005, 64000, 64999, 'teresina'),
+    ('RN', 0.0049, 59000, 59999, 'natal'), ('AL', 0.0042, 57000, 57999, 'maceio'),
+    ('SE', 0.0034, 49000, 49999, 'aracaju'), ('TO', 0.0028, 77000, 77999, 'palmas'),
+    ('RO', 0.0025, 76800, 76999, 'porto velho'), ('AM', 0.0015, 69000, 69299, 'manaus'),
+    ('AC', 0.0008, 69900, 69999, 'rio branco'), ('AP', 0.0007, 68900, 68999, 'macapa'),
+    ('RR', 0.0005, 69300, 69399, 'boa vista'),
+]
+CATEGORIES = [
+    'cama_mesa_banho', 'beleza_saude', 'esporte_lazer', 'moveis_decoracao', 'informatica_acessorios',
+    'utilidades_domesticas', 'relogios_presentes', 'telefonia', 'ferramentas_jardim', 'automotivo',
+    'brinquedos', 'cool_stuff', 'perfumaria', 'bebes', 'eletronicos', 'papelaria',
+    'fashion_bolsas_e_acessorios', 'pet_shop', 'moveis_escritorio', 'consoles_games', 'malas_acessorios',
+    'construcao_ferramentas_construcao', 'eletrodomesticos', 'instrumentos_musicais', 'eletroportateis',
+    'casa_construcao', 'livros_interesse_geral', 'alimentos', 'moveis_sala', 'casa_conforto', 'bebidas',
+    'audio', 'market_place', 'construcao_ferramentas_iluminacao', 'climatizacao',
+    'moveis_cozinha_area_de_servico_jantar_e_jardim', 'alimentos_bebidas', 'industria_comercio_e_negocios',
+    'livros_tecnicos', 'telefonia_fixa', 'fashion_calcados', 'eletrodomesticos_2',
+    'construcao_ferramentas_jardim', 'agro_industria_e_comercio', 'artes', 'pcs', 'sinalizacao_e_seguranca',
+    'construcao_ferramentas_seguranca', 'artigos_de_natal', 'fashion_roupa_masculina',
+    'fashion_underwear_e_moda_praia', 'moveis_quarto', 'cine_foto', 'dvds_blu_ray', 'fraldas_higiene',
+    'musica', 'tablets_impressao_imagem', 'artigos_de_festas', 'flores', 'seguros_e_servicos',
+]
+
+# Salts that keep the ids of different entities apart
+ID_SALTS = {'order': 1, 'customer': 2, 'customer_unique': 3, 'product': 4, 'seller': 5}
+
+
+def mix64(values):
+    """splitmix64 finalizer: a bijection on uint64, so distinct inputs give distinct outputs."""
+    with np.errstate(over='ignore'):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def hex_ids(kind, indices, seed=SEED):
+    """
+    Deterministic 32-character hex ids, like Olist's, for entity numbers.
+    The first 64 bits are a bijection of the number, so ids never collide.
+    """
+    indices = np.asarray(indices, dtype=np.uint64)
+    salt = np.uint64(seed * 16 + ID_SALTS[kind])
+    with np.errstate(over='ignore'):
+        high = mix64(indices * np.uint64(16) + salt)
+        low = mix64(high ^ salt)
+    raw = np.stack([high, low], axis=1).astype('>u8').tobytes()
+    return np.frombuffer(binascii.hexlify(raw), dtype='S32').astype('U32')
+
+
+def zipf_weights(n, exponent, rng=None):
+    """Zipf weights over n items, optionally shuffled so popularity doesn't follow the item number."""
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    if rng is not None:
+        rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def choose(rng, probabilities, size):
+    """Samples indices with the given probabilities (inverse CDF, fast for large n)."""
+    cdf = np.cumsum(probabilities)
+    return np.minimum(np.searchsorted(cdf, rng.random(size) * cdf[-1], side='right'), len(cdf) - 1)
+
+
+def timestamps(seconds, mask=None):
+    """Formats epoch seconds as 'YYYY-MM-DD HH:MM:SS' strings, with nulls where mask is False."""
+    values = pa.array(seconds.astype('datetime64[s]')).cast(pa.string())
+    if mask is not None:
+        values = pa.array(values.to_numpy(zero_copy_only=False), mask=~mask)
+    return values
+
+
+class CsvAppender:
+    """Writes a CSV file in pieces, with Olist's header and quoting, under a temporary name."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.writer = None
+        self.rows = 0
+
+    def write(self, columns):
+        table = pa.table(columns)
+        if self.writer is None:
+            self.writer = pv.CSVWriter(self.tmp_path, table.schema)
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp_path, self.path)
+
+
+def generate_catalogue(output_dir, n_products, n_sellers, seed=SEED):
+    """
+    Writes the products and sellers files. Returns the per-product arrays the
+    order generator needs: popularity weights, seller numbers and prices.
+    """
+    rng = np.random.default_rng([seed, 0])
+    seller_states = choose(rng, np.array([share for _, share, _, _, _ in STATES]), n_sellers)
+    low = np.array([state[2] for state in STATES])[seller_states]
+    high = np.array([state[3] for state in STATES])[seller_states]
+    sellers = CsvAppender(os.path.join(output_dir, 'olist_sellers_dataset.csv'))
+    sellers.write({
+        'seller_id': hex_ids('seller', np.arange(n_sellers), seed),
+        'seller_zip_code_prefix': rng.integers(low, high + 1),
+        'seller_city': np.array([state[4] for state in STATES])[seller_states],
+        'seller_state': np.array([state[0] for state in STATES])[seller_states],
+    })
+    sellers.close()
+
+    categories = choose(rng, zipf_weights(len(CATEGORIES), CATEGORY_POPULARITY_EXPONENT), n_products)
+    missing = rng.random(n_products) < MISSING_CATEGORY_SHARE
+    category_names = np.array(CATEGORIES, dtype=object)[categories]
+    category_names[missing] = None
+
+    def measure(values):
+        return pa.array(values.astype(np.float64), mask=missing)
+
+    products = CsvAppender(os.path.join(output_dir, 'olist_products_dataset.csv'))
+    products.write({
+        'product_id': hex_ids('product', np.arange(n_products), seed),
+        'product_category_name': pa.array(category_names, type=pa.string()),
+        'product_name_lenght': measure(rng.integers(5, 77, n_products)),
+        'product_description_lenght': measure(np.minimum(rng.lognormal(6.5, 0.7, n_products).astype(int) + 4, 3992)),
+        'product_photos_qty': measure(np.minimum(rng.geometric(0.45, n_products), 20)),
+        'product_weight_g': np.minimum(rng.lognormal(6.7, 1.2, n_products).astype(int), 40425),
+        'product_length_cm': rng.integers(7, 106, n_products),
+        'product_height_cm': rng.integers(2, 106, n_products),
+        'product_width_cm': rng.integers(6, 119, n_products),
+    })
+    products.close()
+
+    return {
+        'popularity': zipf_weights(n_products, PRODUCT_POPULARITY_EXPONENT, rng),
+        'seller': choose(rng, zipf_weights(n_sellers, SELLER_POPULARITY_EXPONENT, rng), n_products),
+        'price': np.round(np.maximum(rng.lognormal(np.log(75), 0.85, n_products), 0.85), 2),
+    }
+
+
+def generate_orders(rng, first_order, n_orders, total_orders, catalogue, seed=SEED):
+    """
+    Generates one block of orders, numbered from first_order, with their customers,
+    items and payments. Returns the columns of each of the four files.
+    """
+    order_numbers = np.arange(first_order, first_order + n_orders)
+    order_ids = hex_ids('order', order_numbers, seed)
+
+    # Customers: customer_id is unique per order, as in Olist; a few orders reuse
+    # the customer_unique_id of another customer
+    repeat = rng.random(n_orders) < REPEAT_ORDER_SHARE
+    unique_numbers = np.where(repeat, rng.integers(0, total_orders, n_orders), order_numbers)
+    states = choose(rng, np.array([share for _, share, _, _, _ in STATES]), n_orders)
+    low = np.array([state[2] for state in STATES])[states]
+    high = np.array([state[3] for state in STATES])[states]
+    customers = {
+        'customer_id': hex_ids('customer', order_numbers, seed),
+        'customer_unique_id': hex_ids('customer_unique', unique_numbers, seed),
+        'customer_zip_code_prefix': rng.integers(low, high + 1),
+        'customer_city': np.array([state[4] for state in STATES])[states],
+        'customer_state': np.array([state[0] for state in STATES])[states],
+    }
+
+    # Order lifecycle: purchases grow over time; later steps only for orders that reached them
+    span = (LAST_PURCHASE - FIRST_PURCHASE).astype(np.int64)
+    purchase = FIRST_PURCHASE.astype(np.int64) + (span * np.sqrt(rng.random(n_orders))).astype(np.int64)
+    status = np.array([name for name, _ in ORDER_STATUSES])[
+        choose(rng, np.array([share for _, share in ORDER_STATUSES]), n_orders)]
+    approved = purchase + rng.exponential(10 * 3600, n_orders).astype(np.int64)
+    carrier = approved + rng.exponential(3 * 86400, n_orders).astype(np.int64)
+    delivered = carrier + rng.gamma(2.5, 3.5 * 86400, n_orders).astype(np.int64)
+    estimated = (purchase // 86400 + rng.integers(10, 40, n_orders)) * 86400
+    was_approved = ~np.isin(status, ['created', 'canceled']) | (rng.random(n_orders) < 0.5)
+    was_shipped = np.isin(status, ['delivered', 'shipped'])
+    orders = {
+        'order_id': order_ids,
+        'customer_id': customers['customer_id'],
+        'order_status': status,
+        'order_purchase_timestamp': timestamps(purchase),
+        'order_approved_at': timestamps(approved, was_approved),
+        'order_delivered_carrier_date': timestamps(carrier, was_shipped),
+        'order_delivered_customer_date': timestamps(delivered, status == 'delivered'),
+        'order_estimated_delivery_date': timestamps(estimated),
+    }
+
+    # Baskets: mostly one item, with a geometric tail; extra items are often
+    # more units of a product already in the basket
+    sizes = np.where(rng.random(n_orders) < SINGLE_ITEM_SHARE, 1, 1 + rng.geometric(EXTRA_ITEM_P, n_orders))
+    item_orders = np.repeat(np.arange(n_orders), sizes)
+    starts = np.cumsum(sizes) - sizes
+    position = np.arange(len(item_orders)) - starts[item_orders]
+    products = choose(rng, catalogue['popularity'], len(item_orders))
+    repeated = (position > 0) & (rng.random(len(item_orders)) < REPEATED_PRODUCT_SHARE)
+    # Another unit of the basket's first product
+    products[repeated] = products[starts[item_orders[repeated]]]
+    price = catalogue['price'][products]
+    freight = np.round(rng.gamma(2.0, 10.0, len(item_orders)) + 1, 2)
+    items = {
+        'order_id': order_ids[item_orders],
+        'order_item_id': position + 1,
+        'product_id': hex_ids('product', products, seed),
+        'seller_id': hex_ids('seller', catalogue['seller'][products], seed),
+        'shipping_limit_date': timestamps(approved[item_orders] + 6 * 86400),
+        'price': price,
+        'freight_value': freight,
+    }
+
+    # Payments: the order total, split over a voucher and a second method for a few orders
+    totals = np.bincount(item_orders, weights=price + freight, minlength=n_orders)
+    split = rng.random(n_orders) < 0.03
+    payment_orders = np.concatenate([np.arange(n_orders), np.flatnonzero(split)])
+    voucher_share = np.where(split, rng.uniform(0.1, 0.6, n_orders), 0)
+    values = np.concatenate([totals * (1 - voucher_share), (totals * voucher_share)[split]])
+    types = np.array([name for name, _ in PAYMENT_TYPES])[
+        choose(rng, np.array([share for _, share in PAYMENT_TYPES]), len(payment_orders))]
+    types[n_orders:] = 'voucher'
+    installments = np.where(types == 'credit_card', np.minimum(rng.geometric(0.35, len(types)), 24), 1)
+    order = np.argsort(payment_orders, kind='stable')
+    payments = {
+        'order_id': order_ids[payment_orders[order]],
+        'payment_sequential': np.concatenate([np.ones(n_orders, dtype=np.int64),
+                                              np.full(int(split.sum()), 2)])[order],
+        'payment_type': types[order],
+        'payment_installments': installments[order],
+        'payment_value': np.round(values[order], 2),
+    }
+    return customers, orders, items, payments
+
+
+def generate_dataset(output_dir=OUTPUT_DIR, scale=SCALE, seed=SEED):
+    """
+    Main function: writes Olist-shaped CSV files (customers, orders, order_items,
+    order_payments, products, sellers) at the given scale into output_dir.
+    The same scale and seed always give byte-identical files.
+    Returns {file name: rows written}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_orders = max(1, int(round(ORDERS_PER_SCALE * scale)))
+    n_products = max(1, int(round(PRODUCTS_PER_SCALE * scale)))
+    n_sellers = max(1, int(round(SELLERS_PER_SCALE * scale)))
+    catalogue = generate_catalogue(output_dir, n_products, n_sellers, seed)
+
+    files = {name: CsvAppender(os.path.join(output_dir, f"olist_{name}_dataset.csv"))
+             for name in ['customers', 'orders', 'order_items', 'order_payments']}
+    # Each block of orders has its own random stream
+    for first_order in range(0, n_orders, BLOCK_ORDERS):
+        rng = np.random.default_rng([seed, 1, first_order // BLOCK_ORDERS])
+        tables = generate_orders(rng, first_order, min(BLOCK_ORDERS, n_orders - first_order),
+                                 n_orders, catalogue, seed)
+        for name, columns in zip(files, tables):
+            files[name].write(columns)
+    for appender in files.values():
+        appender.close()
+
+    counts = {os.path.basename(appender.path): appender.rows for appender in files.values()}
+    counts['olist_products_dataset.csv'] = n_products
+    counts['olist_sellers_dataset.csv'] = n_sellers
+    return counts
+
+
+if __name__ == '__main__':
+    print("--- Generating Synthetic Olist Data ---")
+    start_time = time.perf_counter()
+    print(f"Writing scale {SCALE}x data to '{OUTPUT_DIR}'...")
+    row_counts = generate_dataset()
+    for file_name, rows in row_counts.items():
+        print(f"  {file_name}: {rows} rows")
+    print(f"Generated in {time.perf_counter() - start_time:.1f}s.")
+    print("\n--- Synthetic Data Generation Complete! ---")
@@ -0,0 +1,142 @@
+# test_mysql_to_snowflake.py
+import sqlite3
+import mysql.connector
+import pandas as pd
+import pytest
+import etl_checkpoint
+import mysql_to_snowflake as etl
+from etl_sinks import SQLiteSink
+
+
+class UnbufferedConnection:
+    """
+    SQLite dressed as a mysql.connector connection opened without
+    consume_results: like an unbuffered cursor's, a result keeps its unread rows
+    on the "server", and closing the cursor or running another statement
+    before they are read raises InternalError("Unread result found").
+    """
+
+    def __init__(self, database_path):
+        self.conn = sqlite3.connect(database_path)
+        self.pending = []
+
+    @property
+    def unread_result(self):
+        return bool(self.pending)
+
+    def consume_results(self):
+        self.pending.clear()
+
+    def cursor(self, buffered=False):
+        return UnbufferedCursor(self)
+
+    def close(self):
+        self.conn.close()
+
+
+class UnbufferedCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+
+    def execute(self, query, params=()):
+        if self.connection.unread_result:
+            raise mysql.connector.errors.InternalError("Unread result found")
+        cursor = self.connection.conn.execute(query.replace('`', '"'), params)
+        self.description = cursor.description
+        self.connection.pending = cursor.fetchall()
+
+    def fetchmany(self, size):
+        rows = self.connection.pending[:size]
+        del self.connection.pending[:size]
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self.connection.pending))
+
+    def close(self):
+        if self.connection.unread_result:
+            raise mysql.connector.errors.InternalError("Unread result found")
+
+
+class FailingSink(SQLiteSink):
+    """A SQLite sink whose connection drops after a number of batches."""
+
+    def __init__(self, database_path, fail_after):
+        super().__init__(database_path)
+        self.batches_left = fail_after
+
+    def write_batch(self, table_name, parquet_path, overwrite=False):
+        if self.batches_left == 0:
+            raise ConnectionError("Connection to the target lost")
+        self.batches_left -= 1
+        super().write_batch(table_name, parquet_path, overwrite)
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # Staging files, checkpoint and trace log stay in the test's folder
+    monkeypatch.setenv('PIPELINE_TRACE_LOG', str(tmp_path / 'traces.jsonl'))
+    conn = sqlite3.connect(tmp_path / 'source.db')
+    pd.DataFrame({'order_id': [f"o{i:02d}" for i in range(10)], 'order_status': 'delivered'}).to_sql(
+        'orders', conn, index=False)
+    conn.close()
+    connection = UnbufferedConnection(tmp_path / 'source.db')
+    yield connection
+    connection.close()
+
+
+def test_extract_stopped_early_leaves_connection_usable(source):
+    batches = etl.extract_table_batches(source, 'orders', batch_size=3)
+    next(batches)
+    batches.close()
+    assert etl.count_rows(source, 'orders') == 10
+
+
+def test_resume_reloads_table_when_source_changed(source, tmp_path):
+    checkpoint = etl_checkpoint.Checkpoint('etl_checkpoint.json')
+    with pytest.raises(ConnectionError):
+        etl.stream_table(source, FailingSink(tmp_path / 'target.db', fail_after=2), 'orders', 'ORDERS',
+                         batch_size=3, checkpoint=checkpoint)
+    assert checkpoint.get('orders', 'chunks') == 2
+
+    # A row of the last committed batch changes, so the rerun can't trust the rows already loaded
+    source.conn.execute("UPDATE orders SET order_status = 'canceled' WHERE order_id = 'o04'")
+    source.conn.commit()
+
+    sink = SQLiteSink(tmp_path / 'target.db')
+    checkpoint = etl_checkpoint.Checkpoint('etl_checkpoint.json')
+    assert etl.stream_table(source, sink, 'orders', 'ORDERS', batch_size=3, checkpoint=checkpoint) == 10
+    target = pd.read_sql('SELECT * FROM ORDERS ORDER BY order_id', sink.conn)
+    sink.close()
+    assert len(target) == 10
+    assert target.loc[target['order_id'] == 'o04', 'order_status'].item() == 'canceled'
+    assert checkpoint.is_complete('orders')
+
+
+def test_incremental_sync_rereads_ties_and_open_orders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('PIPELINE_TRACE_LOG', str(tmp_path / 'traces.jsonl'))
+    source = sqlite3.connect(tmp_path / 'source.db')
+    pd.DataFrame({
+        'order_id': ['a', 'b', 'c'],
+        'order_status': ['delivered', 'shipped', 'delivered'],
+        'order_purchase_timestamp': ['2018-01-01 10:00:00'] * 3,
+        'order_approved_at': None,
+        'order_delivered_carrier_date': None,
+        'order_delivered_customer_date': [None, None, '2018-01-05 12:00:00'],
+    }).to_sql('orders', source, index=False)
+    sink = SQLiteSink(tmp_path / 'target.db')
+    sync_state = etl.SyncState(str(tmp_path / 'etl_state.json'))
+    assert etl.sync_table_incremental(source, sink, 'orders', 'ORDERS', sync_state)['inserted'] == 3
+
+    # An order placed in the same second as the saved mark, and a status change that sets no timestamp
+    source.execute("INSERT INTO orders VALUES ('d', 'delivered', '2018-01-05 12:00:00', NULL, NULL, NULL)")
+    source.execute("UPDATE orders SET order_status = 'canceled' WHERE order_id = 'b'")
+    source.commit()
+    counts = etl.sync_table_incremental(source, sink, 'orders', 'ORDERS', sync_state)
+    assert counts == {'skipped': 2, 'inserted': 1, 'updated': 1}
+    assert sink.conn.execute('SELECT order_id, order_status FROM "ORDERS" ORDER BY order_id').fetchall() == [
+        ('a', 'delivered'), ('b', 'canceled'), ('c', 'delivered'), ('d', 'delivered')]
+    sink.close()
+    source.close()
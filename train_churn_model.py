@@ -1,12 +1,18 @@
 # train_churn_model.py
 import snowflake.connector
+import numpy as np
 import pandas as pd
 from sqlalchemy import create_engine
 from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 import joblib  # For saving the model
 import warnings
+import feature_store
+import instrumentation
+from score_churn_batch import FEATURE_COLUMNS
 
 # Suppress the UserWarning from pandas
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -19,11 +25,29 @@ SNOWFLAKE_DB = 'OLIST_DB'
 SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
 SNOWFLAKE_SCHEMA = 'PUBLIC'
 
+# --- TRAINING SETTINGS ---
+MODEL_FILENAME = 'churn_model.pkl'
+# 'full' loads the whole feature table and fits LogisticRegression in memory.
+# 'streaming' reads the features in chunks and fits an SGD logistic regression
+# with partial_fit, so peak memory is bounded by TRAINING_CHUNK_SIZE.
+TRAINING_MODE = 'full'
+TRAINING_CHUNK_SIZE = 100000  # Customers per chunk in streaming mode
+STREAMING_EPOCHS = 5  # Passes over the training stream
+HOLDOUT_PERCENT = 20  # Share of customers held out for evaluation in streaming mode
+
 
 def get_clean_feature_data(engine):
     """
-    Reads the pre-built, clean feature table from Snowflake.
+    Reads the pre-built, clean feature table from the local feature store
+    snapshot, or from Snowflake if no snapshot has been materialized yet.
     """
+    if feature_store.has_snapshot('CUSTOMER_CHURN_FEATURES'):
+        print("Reading clean feature data from the local feature store...")
+        df = feature_store.read_table('CUSTOMER_CHURN_FEATURES',
+                                      columns=['recency', 'frequency', 'monetary_value', 'churn'])
+        print(f"Successfully loaded {len(df)} records for model training.")
+        return df
+
     print("Fetching clean feature data from Snowflake table 'CUSTOMER_CHURN_FEATURES'...")
 
     query = 'SELECT "RECENCY", "FREQUENCY", "MONETARY_VALUE", "CHURN" FROM CUSTOMER_CHURN_FEATURES'
@@ -33,11 +57,161 @@ def get_clean_feature_data(engine):
     return df
 
 
-def train_model():
+def iter_feature_chunks(engine, chunksize=TRAINING_CHUNK_SIZE):
+    """
+    Streams (customer_unique_id, features, churn) chunks from the local feature
+    store snapshot, or from Snowflake if no snapshot has been materialized yet.
+    """
+    columns = ['customer_unique_id'] + FEATURE_COLUMNS + ['churn']
+    if feature_store.has_snapshot('CUSTOMER_CHURN_FEATURES'):
+        yield from feature_store.iter_batches('CUSTOMER_CHURN_FEATURES', columns=columns, batch_size=chunksize)
+        return
+
+    query = 'SELECT "customer_unique_id", "FREQUENCY", "MONETARY_VALUE", "CHURN" FROM CUSTOMER_CHURN_FEATURES'
+    for chunk in pd.read_sql(query, engine, chunksize=chunksize):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        yield chunk
+
+
+def is_holdout(customer_ids, holdout_percent=HOLDOUT_PERCENT):
+    """
+    Assigns each customer to the held-out set by a hash of its id, so every
+    pass over the stream makes the same split without keeping it in memory.
+    """
+    hashes = pd.util.hash_pandas_object(pd.Series(customer_ids), index=False).to_numpy()
+    return hashes % 100 < holdout_percent
+
+
+def fit_streaming(chunk_source, epochs=STREAMING_EPOCHS):
+    """
+    Fits a scaler + SGD logistic regression pipeline over a stream of chunks.
+    chunk_source() must return a fresh iterator over the chunks on each call.
+    The first pass fits the scaler and counts the classes; the class weights
+    are then n_samples / (2 * class_count), the same as class_weight='balanced'.
+    Each following pass runs partial_fit once per shuffled chunk.
+    """
+    scaler = StandardScaler()
+    class_counts = np.zeros(2, dtype=np.int64)
+    for chunk in chunk_source():
+        train = chunk[~is_holdout(chunk['customer_unique_id'])]
+        if train.empty:
+            continue
+        scaler.partial_fit(train[FEATURE_COLUMNS])
+        class_counts += np.bincount(train['churn'].to_numpy(dtype=np.int64), minlength=2)
+
+    if class_counts.min() == 0:
+        raise ValueError(f"Training data must contain both classes, got counts {class_counts.tolist()}.")
+    class_weights = class_counts.sum() / (2 * class_counts)
+    print(f"  {class_counts.sum()} training customers; class weights {np.round(class_weights, 3).tolist()}.")
+
+    model = SGDClassifier(loss='log_loss', random_state=42)
+    rng = np.random.default_rng(42)
+    for epoch in range(epochs):
+        for chunk in chunk_source():
+            train = chunk[~is_holdout(chunk['customer_unique_id'])]
+            if train.empty:
+                continue
+            order = rng.permutation(len(train))
+            X = scaler.transform(train[FEATURE_COLUMNS].iloc[order])
+            y = train['churn'].to_numpy(dtype=np.int64)[order]
+            model.partial_fit(X, y, classes=[0, 1], sample_weight=class_weights[y])
+        print(f"  Finished epoch {epoch + 1}/{epochs}.")
+
+    return Pipeline([('scaler', scaler), ('model', model)])
+
+
+def evaluate_streaming(model, chunk_source):
+    """Accumulates the confusion matrix of the model over the held-out customers."""
+    matrix = np.zeros((2, 2), dtype=np.int64)
+    for chunk in chunk_source():
+        holdout = chunk[is_holdout(chunk['customer_unique_id'])]
+        if holdout.empty:
+            continue
+        y_pred = model.predict(holdout[FEATURE_COLUMNS])
+        matrix += confusion_matrix(holdout['churn'].to_numpy(dtype=np.int64), y_pred, labels=[0, 1])
+    return matrix
+
+
+def print_confusion_report(matrix):
+    """Prints accuracy plus per-class precision and recall from a confusion matrix."""
+    accuracy = np.trace(matrix) / max(matrix.sum(), 1)
+    print(f"Accuracy: {accuracy:.2f}")
+    print(f"\n{'':>14}{'precision':>11}{'recall':>9}{'support':>10}")
+    for label, name in enumerate(['Not Churned', 'Churned']):
+        precision = matrix[label, label] / max(matrix[:, label].sum(), 1)
+        recall = matrix[label, label] / max(matrix[label, :].sum(), 1)
+        print(f"{name:>14}{precision:>11.2f}{recall:>9.2f}{matrix[label, :].sum():>10}")
+    return accuracy
+
+
+def train_model_full(engine):
+    """
+    Fits LogisticRegression on the whole feature table in memory.
+    """
+    # 1. Get Data from our new clean table
+    with instrumentation.span('load_features') as load_span:
+        df = get_clean_feature_data(engine)
+        load_span.add_rows(len(df))
+
+    # THIS IS THE FIX FOR DATA LEAKAGE:
+    # We remove 'recency' from the features so the model can't cheat.
+    # It must now learn from only frequency and monetary value.
+    X = df[FEATURE_COLUMNS]
+    y = df['churn']
+
+    # 2. Split Data
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    print(f"\nData split: {len(X_train)} training samples, {len(X_test)} testing samples.")
+
+    # 3. Train Model
+    print("Training Logistic Regression model...")
+    with instrumentation.span('fit', estimator='LogisticRegression') as fit_span:
+        model = LogisticRegression(random_state=42, class_weight='balanced')
+        model.fit(X_train, y_train)
+        fit_span.add_rows(len(X_train))
+    print("Model training complete.")
+
+    # 4. Evaluate Model
+    print("\n--- Model Evaluation ---")
+    with instrumentation.span('evaluate') as evaluate_span:
+        y_pred = model.predict(X_test)
+        evaluate_span.add_rows(len(X_test))
+
+    accuracy = accuracy_score(y_test, y_pred)
+    evaluate_span.set(accuracy=round(accuracy, 4))
+    print(f"Accuracy: {accuracy:.2f}")
+
+    print("\nClassification Report:")
+    print(classification_report(y_test, y_pred, target_names=['Not Churned', 'Churned']))
+    return model
+
+
+def train_model_streaming(engine):
+    """
+    Fits the model chunk by chunk with partial_fit and evaluates it on a
+    hash-selected held-out stream, never holding more than one chunk.
+    """
+    def chunk_source():
+        return iter_feature_chunks(engine, TRAINING_CHUNK_SIZE)
+
+    print(f"Training SGD logistic regression over {TRAINING_CHUNK_SIZE}-row chunks...")
+    with instrumentation.span('fit', estimator='SGDClassifier', epochs=STREAMING_EPOCHS):
+        model = fit_streaming(chunk_source)
+    print("Model training complete.")
+
+    print("\n--- Model Evaluation (held-out stream) ---")
+    with instrumentation.span('evaluate'):
+        print_confusion_report(evaluate_streaming(model, chunk_source))
+    return model
+
+
+@instrumentation.traced('train_model')
+def train_model(mode=TRAINING_MODE):
     """
     Main function to orchestrate the model training pipeline.
     """
     snowflake_engine = None
+    instrumentation.current_span().set(mode=mode)
     try:
         # --- Create a SQLAlchemy Engine for Snowflake ---
         print("Creating Snowflake SQLAlchemy engine...")
@@ -49,43 +223,20 @@ def train_model():
         snowflake_engine = create_engine(connection_url)
         print("Snowflake engine created successfully.")
 
-        # 1. Get Data from our new clean table
-        df = get_clean_feature_data(snowflake_engine)
-
-        # THIS IS THE FIX FOR DATA LEAKAGE:
-        # We remove 'recency' from the features so the model can't cheat.
-        # It must now learn from only frequency and monetary value.
-        X = df[['frequency', 'monetary_value']]
-        y = df['churn']
-
-        # 2. Split Data
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-        print(f"\nData split: {len(X_train)} training samples, {len(X_test)} testing samples.")
-
-        # 3. Train Model
-        print("Training Logistic Regression model...")
-        model = LogisticRegression(random_state=42, class_weight='balanced')
-        model.fit(X_train, y_train)
-        print("Model training complete.")
-
-        # 4. Evaluate Model
-        print("\n--- Model Evaluation ---")
-        y_pred = model.predict(X_test)
-
-        accuracy = accuracy_score(y_test, y_pred)
-        print(f"Accuracy: {accuracy:.2f}")
-
-        print("\nClassification Report:")
-        print(classification_report(y_test, y_pred, target_names=['Not Churned', 'Churned']))
+        if mode == 'streaming':
+            model = train_model_streaming(snowflake_engine)
+        else:
+            model = train_model_full(snowflake_engine)
 
         # 5. Save Model
-        model_filename = 'churn_model.pkl'
-        print(f"\nSaving trained model to {model_filename}...")
-        joblib.dump(model, model_filename)
+        print(f"\nSaving trained model to {MODEL_FILENAME}...")
+        with instrumentation.span('serialize', path=MODEL_FILENAME):
+            joblib.dump(model, MODEL_FILENAME)
         print("Model saved successfully.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        instrumentation.record_error(e)
     finally:
         if snowflake_engine:
             snowflake_engine.dispose()
@@ -1,9 +1,14 @@
 # train_recommender.py
 import pandas as pd
+from pandas.api.types import union_categoricals
+import numpy as np
+from scipy import sparse
 from sqlalchemy import create_engine
-import joblib
 from collections import defaultdict
 import warnings
+from recommender_store import save_recommender
+import feature_store
+import instrumentation
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -15,6 +20,42 @@ SNOWFLAKE_DB = 'OLIST_DB'
 SNOWFLAKE_WAREHOUSE = 'OLIST_WH'
 SNOWFLAKE_SCHEMA = 'PUBLIC'
 
+TOP_K = 5  # Number of recommendations kept per product
+MODEL_DIR = 'recommender_model'  # Memory-mappable model directory loaded by app.py
+
+# How co-purchased products are ranked:
+#   'count'   - raw co-purchase count (bestsellers rank high for everything)
+#   'lift'    - P(a and b) / (P(a) P(b)): how much more often than chance they are bought together
+#   'cosine'  - orders(a, b) / sqrt(orders(a) orders(b))
+#   'jaccard' - orders(a, b) / orders(a or b)
+SCORING_METHOD = 'cosine'
+MIN_COPURCHASES = 1  # Pairs bought together in fewer orders are not recommended
+POPULAR_TOP_N = 50  # Most ordered products stored, overall and per category, as the fallback
+
+# --- TIERED MODEL (local mode) ---
+# Most products are bought in a single order, so exact pairs are only counted
+# between head products, ordered in at least HEAD_MIN_ORDERS orders. Long-tail
+# products are served from category-level co-purchases: the most ordered products
+# of the CATEGORY_NEIGHBOURS categories most often bought with theirs.
+TIERED_MODEL = True
+HEAD_MIN_ORDERS = 3
+CATEGORY_NEIGHBOURS = 3
+# Above this many head product pairs, neighbours are found approximately with
+# MinHash signatures and LSH banding instead of the exact B.T @ B product
+PAIR_BUDGET = 50_000_000
+MINHASH_PERMUTATIONS = 64
+# Bands of MINHASH_PERMUTATIONS / LSH_BANDS rows. Co-purchase similarities are low
+# (a Jaccard of 0.1 is already high), so one-row bands are used: products sharing
+# their first order under any of the hash functions become candidate pairs.
+LSH_BANDS = 64
+LSH_MAX_BUCKET_SIZE = 100  # Larger LSH buckets are truncated, bounding the candidate pairs per bucket
+MINHASH_SEED = 42
+
+# 'local' fetches only (order_id, product_id) from ORDER_ITEMS and counts the pairs
+# here; 'warehouse' runs the original self-join in Snowflake and downloads every pair.
+COPURCHASE_MODE = 'local'
+ORDER_ITEMS_CHUNK_SIZE = 500000  # Rows fetched per chunk in local mode
+
 
 def get_copurchase_data(engine):
     """
@@ -38,8 +79,427 @@ def get_copurchase_data(engine):
     return df
 
 
-def create_recommendation_model(df):
+def get_order_items(engine, chunksize=ORDER_ITEMS_CHUNK_SIZE):
+    """
+    Fetches only the order and product ids from ORDER_ITEMS, streamed in chunks.
+    Each chunk is turned into pandas categoricals as it arrives, so the ids are
+    held as compact integer codes plus one copy of each distinct id.
+    Reads the local feature store snapshot instead when one exists.
+    """
+    if feature_store.has_snapshot('ORDER_ITEMS'):
+        print("Reading (order_id, product_id) from the local feature store...")
+        items = feature_store.read_table('ORDER_ITEMS', columns=['order_id', 'product_id'])
+        items = items.astype({'order_id': 'category', 'product_id': 'category'})
+        print(f"Successfully loaded {len(items)} order items.")
+        return items
+
+    print("Fetching (order_id, product_id) from ORDER_ITEMS...")
+    query = 'SELECT "order_id", "product_id" FROM "ORDER_ITEMS"'
+
+    order_chunks = []
+    product_chunks = []
+    for chunk in pd.read_sql(query, engine, chunksize=chunksize):
+        chunk.columns = [col.lower() for col in chunk.columns]
+        order_chunks.append(pd.Categorical(chunk['order_id']))
+        product_chunks.append(pd.Categorical(chunk['product_id']))
+
+    if not order_chunks:
+        return pd.DataFrame({'order_id': pd.Categorical([]), 'product_id': pd.Categorical([])})
+
+    items = pd.DataFrame({
+        'order_id': union_categoricals(order_chunks),
+        'product_id': union_categoricals(product_chunks),
+    })
+    print(f"Successfully fetched {len(items)} order items.")
+    return items
+
+
+def build_cooccurrence_matrix(df):
+    """
+    Counts co-purchased (product_a, product_b) pairs into a sparse
+    product x product matrix. Product ids are factorized into integer codes
+    in sorted id order, and duplicate pairs are summed by the sparse format.
+    Returns the CSR matrix and the array of product ids for its rows/columns.
+    """
+    codes, product_ids = pd.factorize(pd.concat([df['product_a'], df['product_b']], ignore_index=True), sort=True)
+    n_pairs = len(df)
+    n_products = len(product_ids)
+
+    matrix = sparse.coo_matrix(
+        (np.ones(n_pairs, dtype=np.int32), (codes[:n_pairs], codes[n_pairs:])),
+        shape=(n_products, n_products)
+    ).tocsr()
+    return matrix, np.asarray(product_ids, dtype=object)
+
+
+def build_basket(items):
+    """
+    Builds the sparse order x product matrix of item counts from ORDER_ITEMS rows.
+    Product codes follow sorted id order, like build_cooccurrence_matrix().
+    Returns the CSR matrix and the array of product ids for its columns.
+    """
+    order_codes, order_ids = pd.factorize(items['order_id'])
+    products = pd.Categorical(items['product_id'])
+    products = products.reorder_categories(products.categories.sort_values())
+    product_ids = products.categories
+
+    basket = sparse.csr_matrix(
+        (np.ones(len(items), dtype=np.int32), (order_codes, products.codes)),
+        shape=(len(order_ids), len(product_ids))
+    )
+    return basket, np.asarray(product_ids, dtype=object)
+
+
+def build_cooccurrence_from_items(items, distinct_orders=False):
+    """
+    Builds the same product x product matrix as the ORDER_ITEMS self-join, locally.
+    With B the sparse order x product matrix of item counts, B.T @ B sums, for every
+    pair of products, the item pairs of each order that contains both. The diagonal
+    (a product paired with itself) is dropped, like a.product_id != b.product_id.
+    With distinct_orders=True, B is made 0/1 first, so each entry counts the orders
+    that contain both products, as the similarity scores expect.
+    Returns the CSR matrix and the array of product ids for its rows/columns.
+    """
+    basket, product_ids = build_basket(items)
+    if distinct_orders:
+        basket.data[:] = 1
+    matrix = (basket.T @ basket).tocsr()
+    matrix = matrix - sparse.diags(matrix.diagonal(), dtype=matrix.dtype)
+    matrix.eliminate_zeros()
+    return matrix.tocsr(), product_ids
+
+
+def product_order_counts(items, product_ids):
+    """
+    Counts the distinct orders containing each product (aligned to product_ids)
+    and the total number of orders, from ORDER_ITEMS rows.
+    """
+    basket, basket_ids = build_basket(items)
+    basket.data[:] = 1
+    counts = pd.Series(np.asarray(basket.sum(axis=0)).ravel(), index=basket_ids)
+    return counts.reindex(product_ids, fill_value=0).to_numpy(dtype=np.int64), basket.shape[0]
+
+
+def get_product_order_counts(engine):
+    """
+    Fetches the number of distinct orders containing each product, and the total
+    number of orders, from Snowflake (used with the 'warehouse' co-purchase mode).
+    Returns a Series indexed by product_id and the order count.
+    """
+    print("Counting orders per product in Snowflake...")
+    counts = pd.read_sql(
+        'SELECT "product_id", COUNT(DISTINCT "order_id") AS orders FROM "ORDER_ITEMS" GROUP BY "product_id"', engine)
+    counts.columns = [col.lower() for col in counts.columns]
+    n_orders = pd.read_sql('SELECT COUNT(DISTINCT "order_id") AS orders FROM "ORDER_ITEMS"', engine).iloc[0, 0]
+    return counts.set_index('product_id')['orders'].sort_index(), int(n_orders)
+
+
+def reindex_matrix(matrix, product_ids, all_product_ids):
+    """
+    Re-labels the rows and columns of a product x product matrix from product_ids
+    onto the (sorted, larger) all_product_ids, e.g. so products that were never
+    bought with another one still get a code for the popularity fallback.
+    """
+    codes = np.searchsorted(all_product_ids, product_ids)
+    coo = matrix.tocoo()
+    return sparse.csr_matrix((coo.data, (codes[coo.row], codes[coo.col])),
+                             shape=(len(all_product_ids), len(all_product_ids)))
+
+
+def score_matrix(matrix, order_counts, n_orders, method=SCORING_METHOD, min_copurchases=MIN_COPURCHASES):
+    """
+    Turns a co-purchase matrix into a similarity matrix with the same sparsity
+    pattern, computed over the non-zero entries in one vectorized pass:
+    every entry (a, b) holding the number of orders with both products is
+    rescored from it and the order counts of a and b (see SCORING_METHOD).
+    Pairs bought together in fewer than min_copurchases orders are dropped.
+    """
+    matrix = matrix.tocsr()
+    if min_copurchases > 1:
+        matrix = matrix.multiply(matrix >= min_copurchases).tocsr()
+    if method == 'count':
+        return matrix
+
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    count_a = order_counts[rows].astype(np.float64)
+    count_b = order_counts[matrix.indices].astype(np.float64)
+    # Item-pair counts (the warehouse self-join) can exceed the distinct order counts
+    both = np.minimum(matrix.data, np.minimum(count_a, count_b))
+
+    if method == 'lift':
+        scores = both * n_orders / (count_a * count_b)
+    elif method == 'cosine':
+        scores = both / np.sqrt(count_a * count_b)
+    elif method == 'jaccard':
+        scores = both / (count_a + count_b - both)
+    else:
+        raise ValueError(f"Unknown scoring method '{method}'; use 'count', 'lift', 'cosine' or 'jaccard'.")
+    return sparse.csr_matrix((scores.astype(np.float32), matrix.indices, matrix.indptr), shape=matrix.shape)
+
+
+def top_k_per_row(matrix, k=TOP_K):
+    """
+    Selects the k highest-scoring columns of every row of a CSR matrix, without
+    sorting the whole pair table. Rows with more than k entries are grouped by
+    length (rounded up to a power of two), padded into one dense block per group,
+    and np.partition finds each row's k-th best score; entries above it are kept,
+    plus enough entries equal to it, in column order, to make k. Only the kept
+    entries (at most k per row) are then sorted.
+    Ties are broken by column code (product id order), so results are deterministic.
+    Returns CSR-style (indptr, indices, scores) arrays, best first within each row.
+    """
+    row_lengths = np.diff(matrix.indptr)
+    keep = np.ones(matrix.nnz, dtype=bool)
+
+    heavy_rows = np.flatnonzero(row_lengths > k)
+    if len(heavy_rows):
+        widths = 2 ** np.ceil(np.log2(row_lengths[heavy_rows])).astype(np.int64)
+        for width in np.unique(widths):
+            rows = heavy_rows[widths == width]
+            offsets = np.arange(width)
+            valid = offsets < row_lengths[rows][:, None]
+            positions = (matrix.indptr[rows][:, None] + offsets)[valid]
+
+            block = np.full((len(rows), width), -np.inf)
+            block[valid] = matrix.data[positions]
+            threshold = np.partition(block, width - k, axis=1)[:, width - k][:, None]
+            above = block > threshold
+            tied = block == threshold
+            room = k - above.sum(axis=1, keepdims=True)
+            keep[positions] = (above | (tied & (np.cumsum(tied, axis=1) <= room)))[valid]
+
+    kept = np.flatnonzero(keep)
+    entry_rows = np.repeat(np.arange(matrix.shape[0]), row_lengths)[kept]
+    # Sort the kept entries by row, then by descending score, then by column
+    order = kept[np.lexsort((matrix.indices[kept], -matrix.data[kept], entry_rows))]
+
+    indptr = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.minimum(row_lengths, k), out=indptr[1:])
+    return indptr, matrix.indices[order], matrix.data[order]
+
+
+def count_head_pairs(basket):
+    """Counts the (ordered) product pairs that B.T @ B would produce for a 0/1 basket matrix."""
+    per_order = np.diff(basket.indptr).astype(np.int64)
+    return int((per_order * (per_order - 1)).sum())
+
+
+def minhash_signatures(basket, num_perm=MINHASH_PERMUTATIONS, seed=MINHASH_SEED):
+    """
+    Computes a MinHash signature for every product (column) of a 0/1 order x product
+    matrix: for each of num_perm random hash functions of the order code, the
+    smallest hash over the orders containing the product. The share of equal
+    positions in two signatures estimates the Jaccard similarity of their order sets.
+    Returns an (n_products, num_perm) uint32 array; every product must have an order.
+    """
+    prime = np.uint64(2 ** 31 - 1)
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, int(prime), size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, int(prime), size=num_perm, dtype=np.uint64)
+
+    by_product = basket.tocsc()
+    orders = by_product.indices.astype(np.uint64)
+    starts = by_product.indptr[:-1]
+    signatures = np.empty((basket.shape[1], num_perm), dtype=np.uint32)
+    for i in range(num_perm):
+        signatures[:, i] = np.minimum.reduceat((a[i] * orders + b[i]) % prime, starts)
+    return signatures
+
+
+def lsh_candidate_pairs(signatures, bands=LSH_BANDS, max_bucket_size=LSH_MAX_BUCKET_SIZE):
+    """
+    Finds candidate similar product pairs by LSH banding: signatures are cut into
+    bands, and products whose signatures agree on a whole band land in the same
+    bucket. Pairs are generated within buckets, grouped by bucket size so each
+    group is one vectorized step. Returns unique (a, b) code arrays with a < b.
+    """
+    n_products, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    pair_keys = []
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        band_keys = block.view(np.dtype((np.void, block.dtype.itemsize * rows_per_band))).ravel()
+        _, buckets = np.unique(band_keys, return_inverse=True)
+
+        order = np.argsort(buckets, kind='stable')
+        bucket_starts = np.flatnonzero(np.r_[True, np.diff(buckets[order]) != 0])
+        bucket_sizes = np.minimum(np.diff(np.r_[bucket_starts, n_products]), max_bucket_size)
+        for size in np.unique(bucket_sizes[bucket_sizes > 1]):
+            members = order[bucket_starts[bucket_sizes == size][:, None] + np.arange(size)]
+            first, second = np.triu_indices(size, 1)
+            a, b = members[:, first].ravel(), members[:, second].ravel()
+            pair_keys.append(np.minimum(a, b).astype(np.int64) * n_products + np.maximum(a, b))
+
+    if not pair_keys:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    pair_keys = np.unique(np.concatenate(pair_keys))
+    return pair_keys // n_products, pair_keys % n_products
+
+
+def approximate_cooccurrence(basket, order_counts):
+    """
+    Approximates the product x product matrix of orders containing both products
+    with MinHash and LSH, in memory proportional to the products and candidate
+    pairs rather than to every co-purchased pair. Each candidate pair's Jaccard
+    estimate J is turned back into a co-order count, J (n_a + n_b) / (1 + J), so
+    the usual score_matrix() methods apply.
+    """
+    signatures = minhash_signatures(basket)
+    a, b = lsh_candidate_pairs(signatures)
+
+    similarity = np.empty(len(a), dtype=np.float64)
+    for start in range(0, len(a), 1_000_000):
+        end = start + 1_000_000
+        similarity[start:end] = (signatures[a[start:end]] == signatures[b[start:end]]).mean(axis=1)
+    matched = similarity > 0
+    a, b, similarity = a[matched], b[matched], similarity[matched]
+
+    both = similarity * (order_counts[a] + order_counts[b]) / (1 + similarity)
+    n_products = basket.shape[1]
+    return sparse.csr_matrix((np.r_[both, both], (np.r_[a, b], np.r_[b, a])), shape=(n_products, n_products))
+
+
+def build_head_recommendations(basket, order_counts, n_orders, method=SCORING_METHOD, top_k=TOP_K,
+                               head_min_orders=HEAD_MIN_ORDERS, pair_budget=PAIR_BUDGET):
+    """
+    Builds exact co-purchase neighbours for head products only, counted exactly
+    while the head pairs fit in pair_budget and with MinHash/LSH beyond it.
+    basket is the 0/1 order x product matrix. Returns CSR-style (indptr, indices,
+    scores) over all products, with empty rows for the long tail, and build info.
+    """
+    head = np.flatnonzero(order_counts >= head_min_orders)
+    head_basket = basket[:, head].tocsr()
+    head_basket.eliminate_zeros()
+    head_pairs = count_head_pairs(head_basket)
+    approximate = head_pairs > pair_budget
+
+    if approximate:
+        print(f"  {head_pairs:,} head pairs exceed the budget of {pair_budget:,}; using MinHash LSH...")
+        matrix = approximate_cooccurrence(head_basket, order_counts[head])
+    else:
+        print(f"  Counting {head_pairs:,} head pairs exactly...")
+        matrix = (head_basket.T @ head_basket).tocsr()
+        matrix = matrix - sparse.diags(matrix.diagonal(), dtype=matrix.dtype)
+        matrix.eliminate_zeros()
+
+    head_indptr, head_indices, scores = top_k_per_row(score_matrix(matrix, order_counts[head], n_orders, method), top_k)
+
+    row_lengths = np.zeros(len(order_counts), dtype=np.int64)
+    row_lengths[head] = np.diff(head_indptr)
+    indptr = np.zeros(len(order_counts) + 1, dtype=np.int64)
+    np.cumsum(row_lengths, out=indptr[1:])
+    build_info = {'head_products': len(head), 'head_pairs': head_pairs, 'approximate': bool(approximate)}
+    return indptr, head[head_indices], scores, build_info
+
+
+def category_neighbours(basket, categories, n_orders, method=SCORING_METHOD, k=CATEGORY_NEIGHBOURS):
+    """
+    Aggregates co-purchases to the category level: with A the 0/1 order x category
+    matrix, A.T @ A counts the orders containing both categories (its diagonal the
+    orders containing each one). Its size depends only on the number of categories.
+    Returns CSR-style (indptr, indices) of each category's k most related
+    categories, best first, with codes matching popular_products().
+    """
+    category_codes, category_names = pd.factorize(pd.Series(categories, dtype=object), sort=True)
+    known = np.flatnonzero(category_codes >= 0)
+    product_category = sparse.csr_matrix((np.ones(len(known), dtype=np.int32), (known, category_codes[known])),
+                                         shape=(len(categories), len(category_names)))
+    order_categories = (basket @ product_category).tocsr()
+    order_categories.data[:] = 1
+    matrix = (order_categories.T @ order_categories).tocsr()
+
+    indptr, indices, _ = top_k_per_row(score_matrix(matrix, matrix.diagonal(), n_orders, method), k)
+    return indptr, indices
+
+
+def get_product_categories(engine, product_ids):
+    """
+    Looks up each product's product_category_name (None when it has none), from
+    the local feature store snapshot or the PRODUCTS table.
+    """
+    if feature_store.has_snapshot('PRODUCTS'):
+        products = feature_store.read_table('PRODUCTS', columns=['product_id', 'product_category_name'])
+    else:
+        products = pd.read_sql('SELECT "product_id", "product_category_name" FROM "PRODUCTS"', engine)
+        products.columns = [col.lower() for col in products.columns]
+    categories = products.drop_duplicates('product_id').set_index('product_id')['product_category_name']
+    return categories.reindex(product_ids).astype(object).where(lambda c: c.notna(), None).to_numpy()
+
+
+def popular_products(order_counts, categories=None, top_n=POPULAR_TOP_N):
+    """
+    Precomputes the popularity fallback: the top_n most ordered products overall
+    and, when categories are given, within each product_category_name. Both lists
+    are picked with top_k_per_row(), as one-row and one-row-per-category matrices.
+    Returns the keyword arguments for save_recommender().
+    """
+    n_products = len(order_counts)
+    ordered = np.flatnonzero(order_counts > 0)
+    overall = sparse.csr_matrix((order_counts[ordered], (np.zeros(len(ordered), dtype=np.int64), ordered)),
+                                shape=(1, n_products))
+    _, popular, _ = top_k_per_row(overall, top_n)
+    fallback = {'popular': popular}
+
+    if categories is not None:
+        category_codes, category_names = pd.factorize(pd.Series(categories, dtype=object), sort=True)
+        in_category = ordered[category_codes[ordered] >= 0]
+        by_category = sparse.csr_matrix((order_counts[in_category], (category_codes[in_category], in_category)),
+                                        shape=(len(category_names), n_products))
+        category_indptr, category_popular, _ = top_k_per_row(by_category, top_n)
+        fallback.update(category_names=np.asarray(category_names, dtype=object), category_codes=category_codes,
+                        category_popular_indptr=category_indptr, category_popular=category_popular)
+    return fallback
+
+
+def recommendations_from_matrix(matrix, product_ids, top_k=TOP_K):
+    """
+    Turns a co-purchase matrix into the recommendation dictionary: each product_id
+    maps to the ids of its top_k most co-purchased products, most frequent first.
+    """
+    indptr, indices, _ = top_k_per_row(matrix, top_k)
+
+    recommendations = defaultdict(list)
+    for code in np.flatnonzero(np.diff(indptr)):
+        recommendations[product_ids[code]] = product_ids[indices[indptr[code]:indptr[code + 1]]].tolist()
+    return recommendations
+
+
+def create_recommendation_model(df, top_k=TOP_K):
+    """
+    Processes the co-purchase data to create a recommendation model.
+    The model is a dictionary where each key is a product_id and the value is a
+    list of recommended product_ids, sorted by co-purchase frequency.
+    """
+    print("\nCalculating co-purchase frequencies...")
+    matrix, product_ids = build_cooccurrence_matrix(df)
+    print(f"Frequency calculation complete: {matrix.nnz} distinct pairs across {len(product_ids)} products.")
+
+    print("Building recommendation dictionary...")
+    recommendations = recommendations_from_matrix(matrix, product_ids, top_k)
+    print("Recommendation dictionary built.")
+    return recommendations
+
+
+def create_recommendation_model_from_items(items, top_k=TOP_K):
+    """
+    Same model as create_recommendation_model(), built from ORDER_ITEMS
+    (order_id, product_id) rows instead of the downloaded pair table.
     """
+    print("\nCounting co-purchases from order items...")
+    matrix, product_ids = build_cooccurrence_from_items(items)
+    print(f"Frequency calculation complete: {matrix.nnz} distinct pairs across {len(product_ids)} products.")
+
+    print("Building recommendation dictionary...")
+    recommendations = recommendations_from_matrix(matrix, product_ids, top_k)
+    print("Recommendation dictionary built.")
+    return recommendations
+
+
+def create_recommendation_model_iterrows(df):
+    """
+    Original row-by-row implementation of create_recommendation_model(),
+    kept as the baseline for benchmark_recommender.py.
+
     Processes the co-purchase data to create a recommendation model.
     The model is a dictionary where each key is a product_id and the value is a
     list of recommended product_ids, sorted by co-purchase frequency.
@@ -68,11 +528,58 @@ def create_recommendation_model(df):
     return recommendations
 
 
+def train_tiered_recommender(engine):
+    """
+    Trains the tiered model from ORDER_ITEMS: exact (or MinHash) neighbours for
+    head products, category-level co-purchases for the long tail, and the
+    popularity fallback. Memory and time grow with the head products and the
+    categories, not with every co-purchased pair.
+    """
+    with instrumentation.span('extract') as extract_span:
+        order_items_df = get_order_items(engine)
+        extract_span.add_rows(len(order_items_df))
+    with instrumentation.span('build_basket') as basket_span:
+        basket, product_ids = build_basket(order_items_df)
+        basket.data[:] = 1
+        order_counts = np.asarray(basket.sum(axis=0)).ravel().astype(np.int64)
+        n_orders = basket.shape[0]
+        basket_span.add_rows(len(order_items_df))
+
+    print(f"\nBuilding neighbours for products in at least {HEAD_MIN_ORDERS} orders, scored by {SCORING_METHOD}...")
+    with instrumentation.span('build_neighbours', scoring_method=SCORING_METHOD) as neighbours_span:
+        indptr, indices, scores, build_info = build_head_recommendations(basket, order_counts, n_orders)
+        neighbours_span.add_rows(build_info['head_products'])
+        neighbours_span.set(**build_info)
+    print(f"  {build_info['head_products']} of {len(product_ids)} products are head products.")
+
+    print(f"Precomputing the {POPULAR_TOP_N} most ordered products and related categories...")
+    with instrumentation.span('fallback'):
+        try:
+            categories = get_product_categories(engine, product_ids)
+        except Exception as e:
+            print(f"  Could not read product categories, storing overall popularity only: {e}")
+            categories = None
+        fallback = popular_products(order_counts, categories, POPULAR_TOP_N)
+        if categories is not None:
+            related_indptr, related = category_neighbours(basket, categories, n_orders)
+            fallback.update(category_related_indptr=related_indptr, category_related=related)
+            print(f"  Related categories computed for {len(related_indptr) - 1} categories.")
+
+    print(f"\nSaving recommendation model to {MODEL_DIR}/...")
+    with instrumentation.span('serialize', path=MODEL_DIR) as serialize_span:
+        save_recommender(MODEL_DIR, product_ids, indptr, indices, scores, scoring_method=SCORING_METHOD,
+                         build_info=build_info, **fallback)
+        serialize_span.add_rows(len(product_ids))
+    print("Model saved successfully.")
+
+
+@instrumentation.traced('train_recommender')
 def train_recommender():
     """
     Main function to orchestrate the recommendation model training.
     """
     snowflake_engine = None
+    instrumentation.current_span().set(copurchase_mode=COPURCHASE_MODE, tiered=TIERED_MODEL)
     try:
         # --- Create a SQLAlchemy Engine for Snowflake ---
         print("Creating Snowflake SQLAlchemy engine...")
@@ -85,19 +592,61 @@ def train_recommender():
         print("Snowflake engine created successfully.")
 
         # 1. Get Data
-        copurchase_df = get_copurchase_data(snowflake_engine)
+        if COPURCHASE_MODE == 'local' and TIERED_MODEL:
+            train_tiered_recommender(snowflake_engine)
+            return
+        if COPURCHASE_MODE == 'local':
+            with instrumentation.span('extract') as extract_span:
+                order_items_df = get_order_items(snowflake_engine)
+                extract_span.add_rows(len(order_items_df))
+            print("\nCounting co-purchases from order items...")
+            with instrumentation.span('count_pairs') as count_span:
+                matrix, product_ids = build_cooccurrence_from_items(order_items_df,
+                                                                     distinct_orders=SCORING_METHOD != 'count')
+                order_counts, n_orders = product_order_counts(order_items_df, product_ids)
+                count_span.add_rows(len(order_items_df))
+        else:
+            with instrumentation.span('extract') as extract_span:
+                copurchase_df = get_copurchase_data(snowflake_engine)
+                extract_span.add_rows(len(copurchase_df))
+            print("\nCalculating co-purchase frequencies...")
+            with instrumentation.span('count_pairs') as count_span:
+                matrix, pair_product_ids = build_cooccurrence_matrix(copurchase_df)
+                count_span.add_rows(len(copurchase_df))
+            with instrumentation.span('extract_order_counts'):
+                counts, n_orders = get_product_order_counts(snowflake_engine)
+            product_ids = np.asarray(counts.index.union(pd.Index(pair_product_ids)).sort_values(), dtype=object)
+            matrix = reindex_matrix(matrix, pair_product_ids, product_ids)
+            order_counts = counts.reindex(product_ids, fill_value=0).to_numpy(dtype=np.int64)
+        print(f"Frequency calculation complete: {matrix.nnz} distinct pairs across {len(product_ids)} products.")
 
         # 2. Create Model
-        recommender_model = create_recommendation_model(copurchase_df)
+        print(f"Scoring pairs by {SCORING_METHOD} and selecting the top {TOP_K} recommendations per product...")
+        with instrumentation.span('score', scoring_method=SCORING_METHOD) as score_span:
+            scores = score_matrix(matrix, order_counts, n_orders, SCORING_METHOD)
+            indptr, indices, scores = top_k_per_row(scores, TOP_K)
+            score_span.add_rows(matrix.nnz)
+
+        print(f"Precomputing the {POPULAR_TOP_N} most ordered products as the fallback...")
+        with instrumentation.span('fallback'):
+            try:
+                categories = get_product_categories(snowflake_engine, product_ids)
+            except Exception as e:
+                print(f"  Could not read product categories, storing overall popularity only: {e}")
+                categories = None
+            fallback = popular_products(order_counts, categories, POPULAR_TOP_N)
 
         # 3. Save Model
-        model_filename = 'recommender_model.pkl'
-        print(f"\nSaving recommendation model to {model_filename}...")
-        joblib.dump(recommender_model, model_filename)
+        print(f"\nSaving recommendation model to {MODEL_DIR}/...")
+        with instrumentation.span('serialize', path=MODEL_DIR) as serialize_span:
+            save_recommender(MODEL_DIR, product_ids, indptr, indices, scores, scoring_method=SCORING_METHOD,
+                             **fallback)
+            serialize_span.add_rows(len(product_ids))
         print("Model saved successfully.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        instrumentation.record_error(e)
     finally:
         if snowflake_engine:
             snowflake_engine.dispose()
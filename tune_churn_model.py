@@ -0,0 +1,185 @@
+# tune_churn_model.py
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import loguniform
+from sqlalchemy import create_engine
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import get_scorer, accuracy_score, classification_report
+from sklearn.model_selection import StratifiedKFold, ParameterGrid, ParameterSampler, train_test_split
+import warnings
+from train_churn_model import (
+    SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, SNOWFLAKE_PASSWORD, SNOWFLAKE_DB, SNOWFLAKE_WAREHOUSE, SNOWFLAKE_SCHEMA,
+    FEATURE_COLUMNS, MODEL_FILENAME, get_clean_feature_data,
+)
+
+# Suppress the UserWarning from pandas
+warnings.filterwarnings("ignore", category=UserWarning)
+
+# --- SEARCH SETTINGS ---
+SEARCH_MODE = 'grid'  # 'grid' tries every combination of PARAM_GRID; 'random' samples N_RANDOM_CANDIDATES
+PARAM_GRID = {
+    'C': [0.001, 0.01, 0.1, 1.0, 10.0, 100.0],
+    'class_weight': ['balanced', None],
+}
+PARAM_DISTRIBUTIONS = {
+    'C': loguniform(1e-3, 1e3),
+    'class_weight': ['balanced', None],
+}
+N_RANDOM_CANDIDATES = 20
+CV_FOLDS = 5
+SCORING = 'balanced_accuracy'  # Any sklearn scorer name
+SEARCH_WORKERS = os.cpu_count() or 1
+RESULTS_PATH = 'cv_results.csv'
+
+
+def base_model():
+    # Same estimator as train_churn_model.py; the search overrides its parameters
+    return LogisticRegression(random_state=42, class_weight='balanced')
+
+
+def candidate_params(mode=SEARCH_MODE):
+    if mode == 'random':
+        candidates = ParameterSampler(PARAM_DISTRIBUTIONS, n_iter=N_RANDOM_CANDIDATES, random_state=42)
+    else:
+        candidates = ParameterGrid(PARAM_GRID)
+    # Plain Python values, so they print and save cleanly
+    return [{name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+            for params in candidates]
+
+
+# --- PROCESS POOL WORKERS ---
+# The training arrays are written once as .npy files and every worker memory-maps
+# them when it starts, so tasks carry only a parameter dict and a fold number and
+# all workers share one copy of the data through the OS page cache.
+_worker_data = None
+
+
+def _init_worker(data_dir):
+    global _worker_data
+    _worker_data = {name: np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode='r')
+                    for name in ('X', 'y', 'folds')}
+
+
+def _evaluate_in_worker(candidate, params, fold):
+    X, y, folds = _worker_data['X'], _worker_data['y'], _worker_data['folds']
+    train, test = folds != fold, folds == fold
+
+    model = clone(base_model()).set_params(**params)
+    start_time = time.perf_counter()
+    model.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - start_time
+    score = get_scorer(SCORING)(model, X[test], y[test])
+    return candidate, fold, score, fit_seconds
+
+
+def assign_folds(y, n_folds=CV_FOLDS):
+    """Returns the stratified test-fold number of every sample."""
+    folds = np.empty(len(y), dtype=np.int8)
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42)
+    for fold, (_, test_index) in enumerate(splitter.split(np.zeros(len(y)), y)):
+        folds[test_index] = fold
+    return folds
+
+
+def run_search(X, y, candidates, n_folds=CV_FOLDS, workers=SEARCH_WORKERS):
+    """
+    Scores every candidate with stratified k-fold CV, one (candidate, fold) fit
+    per task across a process pool. Returns a results table with one row per
+    candidate: its parameters, mean and std CV score, mean fit time and rank.
+    """
+    data_dir = tempfile.mkdtemp(prefix='churn_cv_')
+    try:
+        np.save(os.path.join(data_dir, 'X.npy'), np.ascontiguousarray(X, dtype=np.float64))
+        np.save(os.path.join(data_dir, 'y.npy'), np.asarray(y, dtype=np.int64))
+        np.save(os.path.join(data_dir, 'folds.npy'), assign_folds(y, n_folds))
+
+        scores = np.full((len(candidates), n_folds), np.nan)
+        fit_times = np.full((len(candidates), n_folds), np.nan)
+        total_tasks = len(candidates) * n_folds
+        print(f"Running {len(candidates)} candidates x {n_folds} folds = {total_tasks} fits on {workers} workers...")
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data_dir,)) as executor:
+            futures = [executor.submit(_evaluate_in_worker, candidate, params, fold)
+                       for candidate, params in enumerate(candidates) for fold in range(n_folds)]
+            for done, future in enumerate(as_completed(futures), start=1):
+                candidate, fold, score, fit_seconds = future.result()
+                scores[candidate, fold] = score
+                fit_times[candidate, fold] = fit_seconds
+                if done % max(total_tasks // 10, 1) == 0 or done == total_tasks:
+                    print(f"  {done}/{total_tasks} fits done.")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results = pd.DataFrame(candidates).add_prefix('param_')
+    results = results.assign(**{
+        f'mean_{SCORING}': scores.mean(axis=1),
+        f'std_{SCORING}': scores.std(axis=1),
+        'mean_fit_seconds': fit_times.mean(axis=1),
+    })
+    results['rank'] = results[f'mean_{SCORING}'].rank(ascending=False, method='min').astype(int)
+    return results.sort_values('rank'), candidates[int(np.argmax(scores.mean(axis=1)))]
+
+
+def tune_model(mode=SEARCH_MODE):
+    """
+    Main function: searches LogisticRegression settings with cross-validation on
+    the training split, refits the best one, evaluates it on the held-out test
+    split like train_churn_model.py, and saves it to churn_model.pkl.
+    """
+    snowflake_engine = None
+    try:
+        # --- Create a SQLAlchemy Engine for Snowflake ---
+        print("Creating Snowflake SQLAlchemy engine...")
+        connection_url = (
+            f"snowflake://{SNOWFLAKE_USER}:{SNOWFLAKE_PASSWORD}@{SNOWFLAKE_ACCOUNT}/"
+            f"{SNOWFLAKE_DB}/{SNOWFLAKE_SCHEMA}?warehouse={SNOWFLAKE_WAREHOUSE}"
+        )
+        snowflake_engine = create_engine(connection_url)
+        print("Snowflake engine created successfully.")
+
+        df = get_clean_feature_data(snowflake_engine)
+        X_train, X_test, y_train, y_test = train_test_split(
+            df[FEATURE_COLUMNS], df['churn'], test_size=0.2, random_state=42, stratify=df['churn'])
+        print(f"\nData split: {len(X_train)} training samples, {len(X_test)} testing samples.")
+
+        start_time = time.perf_counter()
+        results, best_params = run_search(X_train.to_numpy(), y_train.to_numpy(), candidate_params(mode))
+        print(f"Search finished in {time.perf_counter() - start_time:.1f}s.")
+
+        results.to_csv(RESULTS_PATH, index=False)
+        print(f"\nTop candidates (all results in '{RESULTS_PATH}'):")
+        print(results.head(5).to_string(index=False))
+
+        print(f"\nRefitting best parameters {best_params} on the training split...")
+        model = clone(base_model()).set_params(**best_params)
+        model.fit(X_train, y_train)
+
+        print("\n--- Model Evaluation ---")
+        y_pred = model.predict(X_test)
+        print(f"Accuracy: {accuracy_score(y_test, y_pred):.2f}")
+        print("\nClassification Report:")
+        print(classification_report(y_test, y_pred, target_names=['Not Churned', 'Churned']))
+
+        print(f"\nSaving best model to {MODEL_FILENAME}...")
+        joblib.dump(model, MODEL_FILENAME)
+        print("Model saved successfully.")
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        if snowflake_engine:
+            snowflake_engine.dispose()
+            print("\nSnowflake engine connection closed.")
+
+
+if __name__ == '__main__':
+    print("--- Starting Churn Model Hyperparameter Search ---")
+    tune_model()
+    print("\n--- Hyperparameter Search Complete! ---")